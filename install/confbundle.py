@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Create a configuration bundle of a WaG instance using CouchDB-hosted tile
+configurations (i.e. "tiles": {"server": ..., "appId": ...} in wdglance.json).
+
+The bundle is a single JSON file with the layouts and the configurations
+of all the tiles used by the layouts:
+
+    {"hash": ..., "created": ..., "source": {...}, "layouts": {...}, "tiles": {...}}
+
+The hash is computed from the layouts and the tiles. Set "confBundle" in
+wdglance.json to the bundle path and the server loads both from the file
+at startup (no CouchDB requests). A bundle is validated before it is written
+(all the tiles referenced by the layouts must exist and have a tileType).
+
+The CouchDB database update sequence and the hash of the layouts are stored
+in the bundle, so a repeated run does not fetch the tiles at all if nothing
+has changed (and the file is not touched). If the update sequence has changed
+but the fetched content has not (e.g. other documents of the database have
+been modified), the content and its hash are kept and only the stored update
+sequence is rewritten.
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from migrate import DbConf, create_session, db_url, iter_doc_pages
+
+LAYOUT_MODES = ['single', 'cmp', 'translat']
+
+BUNDLE_VERSION = 1
+
+
+def json_hash(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def load_json_conf(path: str) -> Dict[str, Any]:
+    """
+    Load a JSON configuration (including its "import" file
+    if present, the same way the server does)
+    """
+    with open(path) as fr:
+        conf = json.load(fr)
+    if 'import' in conf:
+        with open(conf['import']) as fr:
+            imported = json.load(fr)
+        imported.update(conf)
+        conf = imported
+    return conf
+
+
+def mk_db_conf(tiles_conf: Dict[str, Any]) -> DbConf:
+    """
+    The server expects "server" to be a database URL (documents
+    are read from SERVER/APP_ID:TILE).
+    """
+    db_conf = DbConf()
+    url = urlsplit(tiles_conf['server'])
+    db_conf.server = f'{url.scheme}://{url.netloc.rsplit("@", 1)[-1]}'
+    db_conf.db = url.path.strip('/')
+    db_conf.username = tiles_conf.get('username', url.username or '')
+    db_conf.password = tiles_conf.get('password', url.password or '')
+    return db_conf
+
+
+def expand_layouts(layouts: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Expand layouts referring to other layouts (useLayout, replace,
+    insertAfter) the same way the server does (see useCommonLayouts
+    in src/js/conf/loader.ts).
+    """
+    ans = copy.deepcopy(layouts)
+    for mode in LAYOUT_MODES:
+        layout = ans.get(mode)
+        if not layout or not layout.get('useLayout'):
+            continue
+        groups = copy.deepcopy(layouts[layout['useLayout']]['groups'])
+        for group in groups:
+            if type(group) is str:
+                continue
+            tiles = []
+            for tile in group['tiles']:
+                if tile.get('ref') in layout.get('replace', {}):
+                    tile['tile'] = layout['replace'][tile['ref']]
+                tiles.append(tile)
+                tiles.extend(layout.get('insertAfter', {}).get(tile.get('ref'), []))
+            group['tiles'] = tiles
+        layout['groups'] = groups
+    return ans
+
+
+def layout_tiles(layouts: Dict[str, Any]) -> List[Dict[str, Any]]:
+    ans = []
+    for mode in LAYOUT_MODES:
+        for group in (layouts.get(mode) or {}).get('groups', []):
+            if type(group) is not str:
+                ans.extend(group['tiles'])
+    return ans
+
+
+def validate(layouts: Dict[str, Any], tiles: Dict[str, Any]) -> List[str]:
+    errors = []
+    try:
+        expanded = expand_layouts(layouts)
+    except KeyError as ex:
+        return [f'layout refers to a non-existing layout {ex}']
+    for tile in layout_tiles(expanded):
+        if tile['tile'] not in tiles:
+            errors.append(f'tile {tile["tile"]} used in layouts not found')
+        for dep_key in ('waitFor', 'readSubqFrom'):
+            deps = tile.get(dep_key) or []
+            for dep in [deps] if type(deps) is str else deps:
+                if dep not in tiles:
+                    errors.append(f'tile {tile["tile"]} refers to an unknown tile {dep} ({dep_key})')
+    for ident, conf in tiles.items():
+        if type(conf) is not dict or 'tileType' not in conf:
+            errors.append(f'tile {ident} has no tileType')
+    return errors
+
+
+def fetch_tiles(db_conf: DbConf, app_id: str, idents: List[str]) -> Dict[str, Any]:
+    """
+    Fetch the tile documents (APP_ID:TILE) in pages instead
+    of requesting them one by one like the server does.
+    """
+    session = create_session(db_conf)
+    prefix = f'{app_id}:'
+    wanted = set(f'{prefix}{ident}' for ident in idents)
+    tiles = {}
+    for docs in iter_doc_pages(session, db_conf, prefix):
+        for doc in docs:
+            if doc['_id'] in wanted:
+                tiles[doc['ident']] = doc['conf']
+    return tiles
+
+
+def get_update_seq(db_conf: DbConf) -> str:
+    ans = create_session(db_conf).get(db_url(db_conf, db_conf.db))
+    ans.raise_for_status()
+    return str(ans.json()['update_seq'])
+
+
+def load_bundle(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.isfile(path):
+        return None
+    with open(path) as fr:
+        return json.load(fr)
+
+
+def build_bundle(wdglance_conf_path: str, out_path: str, force: bool = False) -> bool:
+    """
+    Create (or update) the bundle. Return True if the bundle content has changed.
+    """
+    wdglance_conf = load_json_conf(wdglance_conf_path)
+    tiles_conf = wdglance_conf['tiles']
+    if type(tiles_conf) is not dict or 'server' not in tiles_conf:
+        print(f'ERROR: It looks like {wdglance_conf_path} does not use CouchDB for providing tile configs')
+        sys.exit(1)
+    layouts = wdglance_conf['layouts']
+    if type(layouts) is str:
+        with open(layouts) as fr:
+            layouts = json.load(fr)
+    db_conf = mk_db_conf(tiles_conf)
+    source = {
+        'server': db_url(db_conf, db_conf.db),
+        'appId': tiles_conf['appId'],
+        'updateSeq': get_update_seq(db_conf),
+        'layoutsHash': json_hash(layouts),
+    }
+    curr = load_bundle(out_path)
+    if curr and not force and curr.get('source') == source:
+        print(f'{out_path} is up to date (hash {curr["hash"]})')
+        return False
+
+    idents = sorted(set(t['tile'] for t in layout_tiles(expand_layouts(layouts))))
+    tiles = fetch_tiles(db_conf, tiles_conf['appId'], idents)
+    errors = validate(layouts, tiles)
+    if errors:
+        for err in errors:
+            print(f'ERROR: {err}')
+        sys.exit(1)
+    content_hash = json_hash({'layouts': layouts, 'tiles': tiles})
+    if curr and not force and curr.get('hash') == content_hash:
+        curr['source'] = source  # just remember the new update sequence (the file is rewritten)
+        ans = curr
+        print(f'{out_path} content unchanged (hash {content_hash})')
+    else:
+        ans = {
+            'version': BUNDLE_VERSION,
+            'hash': content_hash,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'source': source,
+            'layouts': layouts,
+            'tiles': tiles,
+        }
+        print(f'{out_path} written: {len(tiles)} tiles, hash {content_hash}')
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'w') as fw:
+        json.dump(ans, fw, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, out_path)
+    return ans is not curr
+
+
+def check_bundle(path: str) -> bool:
+    bundle = load_bundle(path)
+    if bundle is None:
+        print(f'ERROR: {path} not found')
+        return False
+    errors = validate(bundle['layouts'], bundle['tiles'])
+    if json_hash({'layouts': bundle['layouts'], 'tiles': bundle['tiles']}) != bundle['hash']:
+        errors.append('hash mismatch')
+    for err in errors:
+        print(f'ERROR: {err}')
+    if not errors:
+        print(f'{path} OK (hash {bundle["hash"]})')
+    return not errors
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        'confbundle', description='Resolve CouchDB-hosted tile configurations and layouts into a single bundle file')
+    sub = argparser.add_subparsers(dest='action', required=True)
+    build_parser = sub.add_parser('build', help='Create or update a bundle')
+    build_parser.add_argument('wdglance_conf', metavar='WDGLANCE_CONF', help='a wdglance.json with "tiles" stored in CouchDB')
+    build_parser.add_argument('bundle', metavar='BUNDLE', help='the bundle file to create or update')
+    build_parser.add_argument('-f', '--force', action='store_const', const=True,
+                              help='Fetch the tiles and rewrite the bundle even if nothing has changed')
+    check_parser = sub.add_parser('check', help='Validate a bundle and its hash')
+    check_parser.add_argument('bundle', metavar='BUNDLE')
+    args = argparser.parse_args()
+    if args.action == 'build':
+        build_bundle(args.wdglance_conf, args.bundle, args.force)
+    elif not check_bundle(args.bundle):
+        sys.exit(1)
@@ -0,0 +1,111 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Buffered write engine for the freqdb builders (mkfreqdb*.py).
+
+Rows are collected in memory (rows with the same primary key are merged
+right away) and written via executemany() using an
+INSERT ... ON CONFLICT DO UPDATE statement so duplicate keys across
+batches are summed by SQLite itself.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple, Any
+
+from metrics import Metrics
+
+
+class TableSpec(NamedTuple):
+    name: str
+    columns: Tuple[str, ...]
+    key: Tuple[str, ...]
+    summed: Tuple[str, ...]
+
+    def upsert_sql(self) -> str:
+        return 'INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO UPDATE SET {4}'.format(
+            self.name, ', '.join(self.columns), ', '.join('?' for _ in self.columns), ', '.join(self.key),
+            ', '.join('{0} = {0} + excluded.{0}'.format(c) for c in self.summed))
+
+
+class BatchWriter:
+    """
+    BatchWriter buffers rows for a list of tables and flushes them
+    (in the order the tables were specified) once the total number
+    of buffered rows reaches batch_size.
+
+    Duplicate keys are not reported one by one. Instead, the writer
+    counts for each table how many added rows did not produce a new
+    record (see the 'duplicates' property).
+
+    If metrics are set, flushing is measured as the 'write' stage and
+    the duplicates are reported as 'duplicate_<table>' rejected rows.
+    """
+
+    def __init__(self, db, tables: List[TableSpec], batch_size: int = 50000, metrics: Optional[Metrics] = None):
+        self._db = db
+        self._tables = tables
+        self._batch_size = batch_size
+        self._sql = {t.name: t.upsert_sql() for t in tables}
+        self._key_idx = {t.name: tuple(t.columns.index(c) for c in t.key) for t in tables}
+        self._sum_idx = {t.name: tuple(t.columns.index(c) for c in t.summed) for t in tables}
+        self._buffers: Dict[str, Dict[Tuple, List[Any]]] = {t.name: {} for t in tables}
+        self._num_added: Dict[str, int] = {t.name: 0 for t in tables}
+        self._duplicates: Dict[str, int] = {t.name: 0 for t in tables}
+        self._num_buffered = 0
+        self._metrics = metrics or Metrics()
+
+    def add(self, table: str, row: Tuple):
+        buff = self._buffers[table]
+        key = tuple(row[i] for i in self._key_idx[table])
+        self._num_added[table] += 1
+        curr = buff.get(key)
+        if curr is None:
+            buff[key] = list(row)
+            self._num_buffered += 1
+            if self._num_buffered >= self._batch_size:
+                self.flush()
+        else:
+            for i in self._sum_idx[table]:
+                curr[i] += row[i]
+
+    def _max_rowid(self, cur, table: str) -> int:
+        cur.execute('SELECT MAX(rowid) FROM {0}'.format(table))
+        ans = cur.fetchone()[0]
+        return ans if ans is not None else 0
+
+    def flush(self):
+        with self._metrics.stage('write'):
+            cur = self._db.cursor()
+            for t in self._tables:
+                buff = self._buffers[t.name]
+                if len(buff) > 0:
+                    # tables are append-only here so the MAX(rowid) delta is
+                    # the number of actually inserted (i.e. non-duplicate) rows
+                    rowid_before = self._max_rowid(cur, t.name)
+                    cur.executemany(self._sql[t.name], buff.values())
+                    inserted = self._max_rowid(cur, t.name) - rowid_before
+                    self._duplicates[t.name] += self._num_added[t.name] - inserted
+                    self._metrics.reject('duplicate_{0}'.format(t.name), self._num_added[t.name] - inserted)
+                    buff.clear()
+                self._num_added[t.name] = 0
+            self._num_buffered = 0
+
+    @property
+    def duplicates(self) -> Dict[str, int]:
+        return dict(self._duplicates)
+
+    def print_summary(self):
+        print('duplicate keys merged: {0}'.format(
+            ', '.join('{0}: {1}'.format(k, v) for k, v in self._duplicates.items())))
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A benchmark suite for the freqdb scripts.
+
+    benchmark.py generate DB_PATH [--rows N] [--layout plain|sublemma] ...
+        creates a synthetic colcounts table (Zipf distributed lemmas with
+        morphodita-style suffixes, positional or Penn tags, stop tokens,
+        n-grams and duplicate keys)
+
+    benchmark.py run DB_PATH [--report FILE] [--trace-memory]
+        times (and optionally memory-profiles) individual stages: SQL sort,
+        aggregation (mkfreqdb.run), lemma classification (is_stop_ngram,
+        is_pname, the charset filter; each compared with the original regex
+        implementation), PoS mapping and CouchDB document encoding against
+        a null sink; the result is a JSON report
+
+    benchmark.py compare OLD_REPORT NEW_REPORT
+        prints relative changes of the stage times
+
+    benchmark.py docsize SQLITE_DB [--layout plain|sublemma] [--top-k K ...]
+        compares sizes and JSON parsing times of the original and the compact
+        (see compactdocs.py) CouchDB documents of a database created by
+        mkfreqdb.py (or mkfreqdb_sublemmas.py), e.g. a production one
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import common
+from compactdocs import compact_doc
+from docencoding import EncodedBatch, encode_doc
+from tagsets import DEFAULT_TAGSET, TAGSETS, get_tagset
+
+DEFAULT_NUM_ROWS = 1000000
+
+DEFAULT_NUM_LEMMAS = 50000
+
+ZIPF_EXPONENT = 1.07
+
+SYLLABLES = [
+    'ka', 'po', 'ne', 'při', 'vy', 'za', 'ro', 'sta', 'měs', 'to', 'dě', 'la', 'ní', 'kon', 'tr', 'ho', 'vá', 'ře',
+    'ču', 'bý', 'mi', 'lo', 'sk', 'ov', 'ša', 'den', 'pra', 'cel', 'žá', 'ký', 'ja', 'ru', 'te', 'di']
+
+ENDINGS = ['', 'a', 'u', 'e', 'y', 'ou', 'ám', 'ech', 'ovi', 'ími', 'ého', 'ý', 'la', 'li', 'ly', 'me', 'te']
+
+MORPHODITA_SUFFIXES = ['', '', '', '', '-1', '-2', '_^(osoba)', '_;Y', '_;G', '_,t', '-1_^(ve_smyslu)', '`dům']
+
+CNC_POS = 'NNNNAAAVVVDPCRJTIX'
+
+PENN_TAGS = ['NN', 'NNS', 'NNP', 'JJ', 'JJR', 'VB', 'VBD', 'VBG', 'VBN', 'VBZ', 'RB', 'IN', 'DT', 'CC', 'PRP', 'CD', 'UH']
+
+UD_TAGS = ['NOUN', 'PROPN', 'ADJ', 'VERB', 'AUX', 'ADV', 'ADP', 'DET', 'PRON', 'NUM', 'CCONJ', 'PART', 'INTJ']
+
+STOP_TOKENS = ['.', ',', '123', '1.5', '%', '(', ')', '...', '--', '§', '2026', '"', '&']
+
+LEMMA_COLUMN = {'plain': 'col1', 'sublemma': 'col2'}
+
+
+# ---------------------------- generator ----------------------------------
+
+def mk_positional_tag(rnd: random.Random, pos: str) -> str:
+    return (pos + rnd.choice('NAFU') + rnd.choice('MIFN-') + rnd.choice('SP-') + rnd.choice('1234567-') +
+            '-----' + rnd.choice('AN-') + '----')
+
+
+class LemmaFactory:
+
+    def __init__(self, rnd: random.Random, tagset: str, stop_ratio: float, ngram_ratio: float):
+        self._rnd = rnd
+        self._tagset = tagset
+        self._stop_ratio = stop_ratio
+        self._ngram_ratio = ngram_ratio
+
+    def _word(self):
+        return ''.join(self._rnd.choice(SYLLABLES) for _ in range(self._rnd.randint(1, 4)))
+
+    def _tag(self):
+        if self._tagset == 'penn':
+            return self._rnd.choice(PENN_TAGS)
+        elif self._tagset == 'ud':
+            return self._rnd.choice(UD_TAGS)
+        return mk_positional_tag(self._rnd, self._rnd.choice(CNC_POS))
+
+    def create(self):
+        """
+        Create a lemma: (raw morphodita lemma, lemma, tags, forms)
+        """
+        x = self._rnd.random()
+        if x < self._stop_ratio:
+            lemma = self._rnd.choice(STOP_TOKENS)
+        elif x < self._stop_ratio + self._ngram_ratio:
+            lemma = ' '.join(self._word() for _ in range(self._rnd.randint(2, 3)))
+        else:
+            lemma = self._word()
+            if self._rnd.random() < 0.05:
+                lemma = lemma.capitalize()
+        raw_lemma = lemma + self._rnd.choice(MORPHODITA_SUFFIXES)
+        if x < self._stop_ratio and self._tagset == 'cnc':
+            tags = ['Z:-------------', 'X@-------------']
+        else:
+            tags = [self._tag() for _ in range(self._rnd.randint(1, 3))]
+        forms = [lemma + e for e in self._rnd.sample(ENDINGS, self._rnd.randint(1, 6))]
+        return raw_lemma, lemma, tags, forms
+
+
+def generate(
+        db_path: str,
+        num_rows: int = DEFAULT_NUM_ROWS,
+        num_lemmas: int = DEFAULT_NUM_LEMMAS,
+        layout: str = 'plain',
+        tagset: str = 'cnc',
+        stop_ratio: float = 0.02,
+        ngram_ratio: float = 0.1,
+        seed: int = 0):
+    """
+    Create a synthetic colcounts table. Lemmas are picked from a Zipf
+    distribution, so frequent lemmas repeat the same (word, lemma, tag)
+    keys which have to be merged by the builders.
+    """
+    rnd = random.Random(seed)
+    factory = LemmaFactory(rnd, tagset, stop_ratio, ngram_ratio)
+    lemmas = [factory.create() for _ in range(num_lemmas)]
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, num_lemmas + 1):
+        total += 1 / rank ** ZIPF_EXPONENT
+        cum_weights.append(total)
+
+    with sqlite3.connect(db_path) as db:
+        db.execute('DROP TABLE IF EXISTS colcounts')
+        db.execute('CREATE TABLE colcounts (col0 TEXT, col1 TEXT, col2 TEXT, col3 TEXT, col4 TEXT, `count` INTEGER, arf REAL)')
+        buff = []
+        for i in range(num_rows):
+            raw_lemma, lemma, tags, forms = rnd.choices(lemmas, cum_weights=cum_weights)[0]
+            word = rnd.choice(forms)
+            tag = rnd.choice(tags)
+            count = max(1, int(rnd.paretovariate(1.2)))
+            arf = round(count * rnd.uniform(0.2, 1.0), 3)
+            if layout == 'sublemma':
+                sublemma = lemma + rnd.choice(['', '', '-1'])
+                buff.append((word, raw_lemma, lemma, sublemma, tag, count, arf))
+            else:
+                buff.append((word, raw_lemma, tag, None, None, count, arf))
+            if len(buff) == 10000:
+                db.executemany('INSERT INTO colcounts VALUES (?, ?, ?, ?, ?, ?, ?)', buff)
+                buff = []
+        db.executemany('INSERT INTO colcounts VALUES (?, ?, ?, ?, ?, ?, ?)', buff)
+        db.execute('CREATE TABLE IF NOT EXISTS benchmark_meta (key TEXT PRIMARY KEY, value TEXT)')
+        db.executemany('INSERT OR REPLACE INTO benchmark_meta VALUES (?, ?)', [
+            ('rows', str(num_rows)), ('lemmas', str(num_lemmas)), ('layout', layout), ('tagset', tagset),
+            ('stop_ratio', str(stop_ratio)), ('ngram_ratio', str(ngram_ratio)), ('seed', str(seed))])
+        db.commit()
+    db.close()
+
+
+# ---------------------------- stages ----------------------------------
+
+# the original regex based classification (as a reference for the common.py functions)
+
+_REGEX_PNAME = common.upcase_regex
+
+_REGEX_CHARSET = re.compile(r'^[\sA-Za-z0-9áÁéÉěĚšŠčČřŘžŽýÝíÍúÚůťŤďĎňŇóÓ-]+$')
+
+
+def _regex_is_stop_word(w):
+    return w is None or re.match(r'^[\d\.,\:;\!\?%\$\[\]=\*\-\+\(\)\{\}/\|"\'_<>"&#@~\^§]+$', w)
+
+
+def _regex_is_stop_ngram(w):
+    return any([_regex_is_stop_word(x) for x in w.split(' ')])
+
+
+class NullSink:
+    """
+    A sink consuming encoded batches without writing them anywhere
+    """
+
+    def __init__(self):
+        self.num_docs = 0
+        self.num_bytes = 0
+
+    def load(self, batches: Iterable[EncodedBatch], on_commit=None):
+        for batch in batches:
+            self.num_docs += len(batch)
+            self.num_bytes += batch.num_bytes
+
+
+def max_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if platform.system() == 'Darwin' else rss * 1024
+
+
+def measure(name: str, fn: Callable[[], int], trace_memory: bool) -> Dict[str, Any]:
+    """
+    Run a stage function returning number of processed items and
+    collect its time and memory usage.
+    """
+    print('Running stage {0}...'.format(name))
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    num_items = fn()
+    ans = dict(
+        name=name, seconds=time.perf_counter() - t0, cpu_seconds=time.process_time() - cpu0, items=num_items)
+    ans['items_per_s'] = num_items / ans['seconds'] if ans['seconds'] > 0 else None
+    ans['ns_per_item'] = ans['seconds'] * 1e9 / num_items if num_items > 0 else None
+    if trace_memory:
+        ans['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    ans['max_rss_bytes'] = max_rss_bytes()
+    return ans
+
+
+def get_meta(db) -> Dict[str, str]:
+    try:
+        return dict(db.execute('SELECT key, value FROM benchmark_meta'))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def run_benchmarks(db_path: str, trace_memory: bool = False, tmp_dir: Optional[str] = None) -> Dict[str, Any]:
+    src = sqlite3.connect(db_path)
+    meta = get_meta(src)
+    layout = meta.get('layout', 'plain')
+    if layout == 'sublemma':
+        import mkfreqdb_sublemmas as builder
+        import freqdb2couchdb_sublemma as converter
+        lemma_idx, tag_idx = 2, 4
+    else:
+        import mkfreqdb as builder
+        import freqdb2couchdb as converter
+        lemma_idx, tag_idx = 1, 2
+    pos_imp = get_tagset(meta.get('tagset', DEFAULT_TAGSET))
+
+    stages = []
+
+    def sql_sort():
+        n = 0
+        for _ in builder.read_sorted(src):
+            n += 1
+        return n
+    stages.append(measure('sql_sort', sql_sort, trace_memory))
+
+    # the builders and the converters read rows sorted by lemma
+    sample = [(row[lemma_idx], row[tag_idx]) for row in src.execute(
+        'SELECT * FROM colcounts ORDER BY {0} LIMIT 1000000'.format(LEMMA_COLUMN[layout]))]
+    lemmas = [lemma for lemma, _ in sample]
+
+    for name, fn, reference in (
+            ('is_stop_ngram', common.is_stop_ngram, _regex_is_stop_ngram),
+            ('is_pname', common.is_pname, lambda w: _REGEX_PNAME.match(w) is not None),
+            ('charset_filter', common.CHARSETS[common.DEFAULT_CHARSET].accepts,
+             lambda w: _REGEX_CHARSET.match(w) is not None)):
+        for stage_name, f in ((name, fn), (name + '_regex', reference)):
+            if hasattr(f, 'cache_clear'):
+                f.cache_clear()
+            stages.append(measure(stage_name, lambda: len([f(w) for w in lemmas]), trace_memory))
+        stages[-2]['mismatches'] = sum(1 for w in lemmas if bool(fn(w)) != bool(reference(w)))
+
+    def pos_mapping():
+        for _, tag in sample:
+            pos_imp(tag)
+        return len(sample)
+    stages.append(measure('pos_imp', pos_mapping, trace_memory))
+
+    def pos_mapping_column():
+        return len(pos_imp.map_column([tag for _, tag in sample]))
+    stages.append(measure('pos_imp_column', pos_mapping_column, trace_memory))
+
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        work_path = os.path.join(work_dir, 'bench.db')
+        shutil.copyfile(db_path, work_path)
+        with sqlite3.connect(work_path, check_same_thread=False) as db:
+            def aggregation():
+                db.execute('PRAGMA journal_mode = OFF')
+                db.execute('BEGIN TRANSACTION')
+                builder.run(db, pos_imp)
+                db.commit()
+                return src.execute('SELECT COUNT(*) FROM colcounts').fetchone()[0]
+            stages.append(measure('aggregation', aggregation, trace_memory))
+
+            sink = NullSink()
+
+            def encoding():
+                converter.convert(db, sink)
+                return sink.num_docs
+            stages.append(measure('couchdb_encoding', encoding, trace_memory))
+            stages[-1]['bytes'] = sink.num_bytes
+        db.close()
+    finally:
+        shutil.rmtree(work_dir)
+    src.close()
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        created=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=commit, python=platform.python_version(),
+        platform=platform.platform(), dataset=meta, trace_memory=trace_memory, stages=stages)
+
+
+def percentile(values: List[int], p: float) -> int:
+    return sorted(values)[min(int(len(values) * p), len(values) - 1)] if values else 0
+
+
+def doc_sizes(
+        db_path: str, layout: str = 'plain', top_k_values: Iterable[int] = (20, 50, 200),
+        corpus_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build all the documents of a freqdb and measure, for the original
+    schema and the compact one with different K values, the total size
+    of the documents and sizes and parsing times of the documents
+    returned by a by-lemma lookup (i.e. without the overflow documents).
+    Parsing times are also reported for the 1% of lemmas with the largest
+    original documents.
+    """
+    if layout == 'sublemma':
+        import freqdb2couchdb_sublemma as converter
+    else:
+        import freqdb2couchdb as converter
+    from pipeline import filter_rows, group_rows, mk_id
+
+    schemas = {'original': None}
+    schemas.update(('compact_{0}'.format(k), k) for k in top_k_values)
+    sizes = {name: [] for name in schemas}
+    parse_times = {name: [] for name in schemas}
+    total = {name: 0 for name in schemas}
+    num_docs = {name: 0 for name in schemas}
+    db = sqlite3.connect(db_path)
+    rows = filter_rows(converter.select_lines(db, None, False, bool(corpus_size)), converter.LEMMA)
+    for i, group in enumerate(group_rows(rows, (converter.LEMMA, converter.POS))):
+        doc = converter.build_doc(group, mk_id(i), corpus_size)
+        for name, top_k in schemas.items():
+            docs = [doc] if top_k is None else compact_doc(dict(doc), top_k)
+            encoded = [encode_doc(d) for d in docs]
+            t0 = time.perf_counter()
+            json.loads(encoded[0])
+            parse_times[name].append(time.perf_counter() - t0)
+            sizes[name].append(len(encoded[0]))
+            total[name] += sum(len(data) for data in encoded)
+            num_docs[name] += len(encoded)
+    db.close()
+
+    largest = sorted(range(len(sizes['original'])), key=lambda i: -sizes['original'][i])
+    largest = largest[:max(len(largest) // 100, 1)]
+    ans = []
+    for name in schemas:
+        ans.append(dict(
+            schema=name, docs=num_docs[name], total_bytes=total[name],
+            hit_bytes_mean=sum(sizes[name]) / len(sizes[name]) if sizes[name] else 0,
+            hit_bytes_p99=percentile(sizes[name], 0.99), hit_bytes_max=max(sizes[name], default=0),
+            hit_parse_us_mean=sum(parse_times[name]) * 1e6 / len(parse_times[name]) if parse_times[name] else 0,
+            largest_hit_parse_us_mean=sum(parse_times[name][i] for i in largest) * 1e6 / len(largest) if largest else 0))
+    return dict(
+        created=time.strftime('%Y-%m-%dT%H:%M:%S'), db=os.path.abspath(db_path), lemmas=len(sizes['original']),
+        corpus_size=corpus_size, schemas=ans)
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    old_stages = {s['name']: s for s in old['stages']}
+    ans = ['{0:<20} {1:>10} {2:>10} {3:>8}'.format('stage', 'old [s]', 'new [s]', 'change')]
+    for stage in new['stages']:
+        prev = old_stages.get(stage['name'])
+        if prev is None or prev['seconds'] == 0:
+            ans.append('{0:<20} {1:>10} {2:>10.3f} {3:>8}'.format(stage['name'], '-', stage['seconds'], '-'))
+        else:
+            ans.append('{0:<20} {1:>10.3f} {2:>10.3f} {3:>+7.1f}%'.format(
+                stage['name'], prev['seconds'], stage['seconds'], (stage['seconds'] / prev['seconds'] - 1) * 100))
+    return ans
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('benchmark', description='Benchmark suite for the freqdb scripts')
+    sub = argparser.add_subparsers(dest='action', required=True)
+    gen_parser = sub.add_parser('generate', help='Create a synthetic colcounts table')
+    gen_parser.add_argument('db_path', metavar='DB_PATH', help='sqlite3 database to create the colcounts table in')
+    gen_parser.add_argument('-r', '--rows', type=int, default=DEFAULT_NUM_ROWS,
+                            help='Number of rows (default is {0})'.format(DEFAULT_NUM_ROWS))
+    gen_parser.add_argument('-l', '--lemmas', type=int, default=DEFAULT_NUM_LEMMAS,
+                            help='Number of distinct lemmas (default is {0})'.format(DEFAULT_NUM_LEMMAS))
+    gen_parser.add_argument('--layout', choices=('plain', 'sublemma'), default='plain',
+                            help='Columns for mkfreqdb.py (plain) or mkfreqdb_sublemmas.py (sublemma)')
+    gen_parser.add_argument('--tagset', choices=list(TAGSETS), default=DEFAULT_TAGSET,
+                            help='Positional (cnc), Penn or UD tags')
+    gen_parser.add_argument('--stop-ratio', type=float, default=0.02, help='Ratio of stop token lemmas')
+    gen_parser.add_argument('--ngram-ratio', type=float, default=0.1, help='Ratio of multi-word lemmas')
+    gen_parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    run_parser = sub.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('db_path', metavar='DB_PATH', help='a database created by the generate action')
+    run_parser.add_argument('--report', type=str, help='A file to write the JSON report to (default is stdout)')
+    run_parser.add_argument('--trace-memory', action='store_const', const=True,
+                            help='Measure peak Python memory of each stage (slower)')
+    run_parser.add_argument('--tmp-dir', type=str, help='Directory for a working copy of the database')
+    cmp_parser = sub.add_parser('compare', help='Compare two reports')
+    cmp_parser.add_argument('old_report', metavar='OLD_REPORT')
+    cmp_parser.add_argument('new_report', metavar='NEW_REPORT')
+    size_parser = sub.add_parser('docsize', help='Compare the original and the compact CouchDB documents')
+    size_parser.add_argument('db_path', metavar='SQLITE_DB', help='a database created by mkfreqdb.py or mkfreqdb_sublemmas.py')
+    size_parser.add_argument('--layout', choices=('plain', 'sublemma'), default='plain',
+                             help='Documents of freqdb2couchdb.py (plain) or freqdb2couchdb_sublemma.py (sublemma)')
+    size_parser.add_argument('--top-k', type=int, nargs='+', default=[20, 50, 200],
+                             help='Numbers of inline forms of the compact documents to compare')
+    size_parser.add_argument('--corpus-size', type=int, help='Add the precomputed ipm, flevel and ARF rank fields')
+    args = argparser.parse_args()
+
+    if args.action == 'generate':
+        t0 = time.time()
+        generate(args.db_path, args.rows, args.lemmas, args.layout, args.tagset, args.stop_ratio, args.ngram_ratio,
+                 args.seed)
+        print('Generated {0} rows in {1:.1f}s'.format(args.rows, time.time() - t0))
+    elif args.action == 'run':
+        report = run_benchmarks(args.db_path, args.trace_memory, args.tmp_dir)
+        if args.report:
+            with open(args.report, 'w') as fw:
+                json.dump(report, fw, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+    elif args.action == 'docsize':
+        print(json.dumps(doc_sizes(args.db_path, args.layout, args.top_k, args.corpus_size), indent=2))
+    else:
+        with open(args.old_report) as fr1, open(args.new_report) as fr2:
+            print('\n'.join(compare(json.load(fr1), json.load(fr2))))
@@ -0,0 +1,247 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Blue/green loading of a freqdb to CouchDB.
+
+Documents are loaded into a fresh versioned database (e.g. freqdb3g_v3_20261017120000),
+the design document with the views required by the CouchDB backend is installed
+and all the views are queried (in parallel) until CouchDB finishes indexing them.
+Only then the freqDB.database.path of a WaG server configuration is rewritten
+(the server must be restarted to use it), so the live site never queries cold
+views. The alias document {"_id": ALIAS, "db": ..., "previous": ...} stored in
+the alias database records the current and the previous database (which is kept
+for a rollback); the server itself does not read it.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional
+
+from couchloader import BulkLoadError, CouchClient, RetryableError
+
+DEFAULT_DESIGN_DOC = 'freqdb'
+
+DEFAULT_ALIAS_DB = 'freqdb_aliases'
+
+POLL_INTERVAL = 10.0
+
+# the views required by the CouchDB backend
+# (keep in sync with src/js/server/freqdb/backends/couchdb/index.ts)
+FREQDB_VIEWS = {
+    'by-arf': '''function (doc) {
+    if (!doc.overflow_of) {
+        emit(doc.arf, 1);
+    }
+}''',
+    '1g-by-arf': '''function (doc) {
+    if (!doc.overflow_of && doc.lemma.split(' ').length === 1) {
+        emit(doc.arf, null);
+    }
+}''',
+    '2g-by-arf': '''function (doc) {
+    if (!doc.overflow_of && doc.lemma.split(' ').length === 2) {
+        emit(doc.arf, null);
+    }
+}''',
+    '3g-by-arf': '''function (doc) {
+    if (!doc.overflow_of && doc.lemma.split(' ').length === 3) {
+        emit(doc.arf, null);
+    }
+}''',
+    'by-lemma': '''function (doc) {
+    if (!doc.overflow_of) {
+        emit(doc.lemma, doc.count);
+    }
+}''',
+    'by-word': '''function (doc) {
+    if (doc.cforms) {
+        doc.cforms.word.forEach(function (v, i) {
+            emit(v, doc.cforms.count[i]);
+        });
+    } else {
+        doc.forms.forEach(function (v) {
+            emit(v.word, v.count);
+        });
+    }
+}''',
+}
+
+
+def versioned_name(db_name: str) -> str:
+    return '{0}_{1}'.format(db_name, time.strftime('%Y%m%d%H%M%S'))
+
+
+class BlueGreen:
+    """
+    Args:
+        server_url: CouchDB server URL (credentials may be part of the URL)
+        alias: a name of the alias document (the base database name)
+        alias_db: a database storing alias documents
+        design_doc: a name of the design document with the views
+                    (the backend's path must point to its _view/ URL)
+    """
+
+    def __init__(
+            self, server_url: str, alias: str, alias_db: str = DEFAULT_ALIAS_DB,
+            design_doc: str = DEFAULT_DESIGN_DOC):
+        self._client = CouchClient(server_url)
+        self._alias = alias
+        self._alias_db = alias_db
+        self._design_doc = design_doc
+
+    def _request(self, method: str, path: str, data: Optional[Dict[str, Any]] = None) -> Any:
+        conn = self._client.connect()
+        try:
+            return self._client.request(
+                conn, method, path, json.dumps(data).encode('utf-8') if data is not None else None)
+        finally:
+            conn.close()
+
+    def _get(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._request('GET', path)
+        except BulkLoadError as ex:
+            if ex.status == 404:
+                return None
+            raise
+
+    def create_db(self, db_name: str, exist_ok: bool = False):
+        try:
+            self._request('PUT', self._client.path(db_name))
+            print('Created database {0}'.format(db_name))
+        except BulkLoadError as ex:
+            if ex.status != 412 or not exist_ok:
+                raise
+
+    def install_views(self, db_name: str):
+        path = self._client.path(db_name, '_design', self._design_doc)
+        doc = dict(language='javascript', views={k: dict(map=v) for k, v in FREQDB_VIEWS.items()})
+        curr = self._get(path)
+        if curr is not None:
+            doc['_rev'] = curr['_rev']
+        self._request('PUT', path, doc)
+        print('Installed views {0} to {1}/_design/{2}'.format(', '.join(FREQDB_VIEWS), db_name, self._design_doc))
+
+    def _index_progress(self, db_name: str) -> Optional[float]:
+        # database names of the indexer tasks are shard paths (shards/RANGE/DB_NAME.SUFFIX)
+        pattern = re.compile(r'(^|/){0}(\.\d+)?$'.format(re.escape(db_name)))
+        tasks = [t for t in self._request('GET', self._client.path('_active_tasks'))
+                 if t.get('type') == 'indexer' and pattern.search(t.get('database', ''))]
+        if not tasks:
+            return None
+        return sum(t.get('progress', 0) for t in tasks) / len(tasks)
+
+    def _query_view(self, db_name: str, view: str, deadline: Optional[float]):
+        path = self._client.path(db_name, '_design', self._design_doc, '_view', view, limit=0)
+        while True:
+            try:
+                self._request('GET', path)
+                return
+            except RetryableError:  # e.g. a timeout while the index is being built
+                if deadline is not None and time.time() > deadline:
+                    raise
+                time.sleep(1.0)
+
+    def warm_views(self, db_name: str, timeout: Optional[float] = None, poll_interval: float = POLL_INTERVAL):
+        """
+        Query all the views in parallel (a view query returns once
+        the index is up to date) and report indexing progress until
+        all of them are done.
+        """
+        t0 = time.time()
+        deadline = t0 + timeout if timeout else None
+        with ThreadPoolExecutor(len(FREQDB_VIEWS)) as executor:
+            futures = [executor.submit(self._query_view, db_name, view, deadline) for view in FREQDB_VIEWS]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=poll_interval)
+                if pending:
+                    progress = self._index_progress(db_name)
+                    print('Indexing views of {0}: {1} ({2:.0f}s)'.format(
+                        db_name, '{0:.0f}%'.format(progress) if progress is not None else 'waiting',
+                        time.time() - t0))
+            for f in futures:
+                f.result()
+        print('Views of {0} are ready ({1:.0f}s)'.format(db_name, time.time() - t0))
+
+    def switch(self, db_name: str) -> Optional[str]:
+        """
+        Point the alias to db_name and return the previous database (if any).
+        """
+        self.create_db(self._alias_db, exist_ok=True)
+        path = self._client.path(self._alias_db, self._alias)
+        curr = self._get(path)
+        doc = dict(db=db_name, previous=curr['db'] if curr else None, updated=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        if curr is not None:
+            doc['_rev'] = curr['_rev']
+        self._request('PUT', path, doc)
+        print('Alias {0} switched to {1} (previous: {2})'.format(self._alias, db_name, doc['previous']))
+        return doc['previous']
+
+
+DB_PATH_RE = re.compile(r'/([^/]+)/_design/([^/]+)')
+
+
+def _parse_db_path(conf: Dict[str, Any], path: str) -> re.Match:
+    try:
+        db_path = conf['freqDB']['database']['path']
+    except KeyError:
+        raise ValueError('No freqDB.database found in {0}'.format(path))
+    srch = DB_PATH_RE.search(db_path)
+    if srch is None:
+        raise ValueError('freqDB.database.path is not a CouchDB view URL: {0}'.format(db_path))
+    return srch
+
+
+def check_server_conf(path: str, design_doc: Optional[str] = None) -> str:
+    """
+    Make sure freqDB.database.path of a WaG server configuration can be
+    switched (so a load does not fail only after it is finished) and return
+    the name of the design document the server queries. If design_doc is
+    set, it must be the same one (otherwise the server would be switched
+    to a database without its views).
+    """
+    with open(path) as fr:
+        server_design_doc = _parse_db_path(json.load(fr), path).group(2)
+    if design_doc is not None and design_doc != server_design_doc:
+        raise ValueError('The design document {0} differs from {1} used by freqDB.database.path in {2}'.format(
+            design_doc, server_design_doc, path))
+    return server_design_doc
+
+
+def update_server_conf(path: str, db_name: str):
+    """
+    Replace the database in freqDB.database.path (a CouchDB view URL)
+    of a WaG server configuration. The file is replaced atomically.
+    The server reads the path only at startup, so it must be restarted.
+    """
+    with open(path) as fr:
+        conf = json.load(fr)
+    db_path = conf['freqDB']['database']['path']
+    srch = _parse_db_path(conf, path)
+    # only the database segment is replaced, the design document stays the same
+    new_path = db_path[:srch.start(1)] + db_name + db_path[srch.end(1):]
+    conf['freqDB']['database']['path'] = new_path
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fw:
+        json.dump(conf, fw, indent=4, ensure_ascii=False)
+        fw.write('\n')
+    os.replace(tmp_path, path)
+    print('Updated freqDB.database.path in {0}: {1}'.format(path, new_path))
+    print('Restart the WaG server to use the new database')
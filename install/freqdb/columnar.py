@@ -0,0 +1,319 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A columnar (memory-mappable) intermediate freqdb format.
+
+The result of the word/lemma JOIN (sorted by lemma, pos, value) is stored
+once in a directory:
+
+    meta.json        - columns, their types and row/group counts
+    strings.bin      - UTF-8 data of all the distinct strings
+    strings.idx.npy  - offsets of the strings within strings.bin
+    COLUMN.npy       - one array per column (int64/float64 values or int32 string codes)
+    groups.npy       - row offsets of the (lemma, pos) groups
+
+Group rank columns (e.g. the rank of a lemma by its ARF) are not stored,
+they are derived from the first row values of the groups when loaded
+(the same way as SQL RANK() OVER (ORDER BY column DESC)).
+
+Loaders map the arrays (np.load(mmap_mode='r')) and read each group via
+slicing, so re-exporting to a different backend does not have to repeat
+the JOIN. The meta.json file is written last, so an incomplete export
+cannot be mistaken for a valid one.
+"""
+
+import json
+import mmap
+import os
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from couchsync import mk_stable_id
+
+FORMAT_VERSION = 1
+
+TYPE_STR = 'str'
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+
+ARRAY_TYPES = {TYPE_STR: ('i', np.int32), TYPE_INT: ('q', np.int64), TYPE_FLOAT: ('d', np.float64)}
+
+NULL_CODE = -1
+
+META_FILE = 'meta.json'
+
+
+class _SpillArray:
+    """
+    An append-only array of unknown final length. Values are
+    written to a raw file in chunks and converted to .npy by save().
+    """
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, path: str, typecode: str, dtype):
+        self._path = path
+        self._dtype = dtype
+        self._fw = open(path, 'wb')
+        self._buff = array(typecode)
+        self._typecode = typecode
+        self.size = 0
+
+    def append(self, v):
+        self._buff.append(v)
+        self.size += 1
+        if len(self._buff) >= self.CHUNK_SIZE:
+            self._buff.tofile(self._fw)
+            self._buff = array(self._typecode)
+
+    def save(self, npy_path: str):
+        self._buff.tofile(self._fw)
+        self._fw.close()
+        out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=self._dtype, shape=(self.size,))
+        if self.size > 0:
+            src = np.memmap(self._path, dtype=self._dtype, mode='r', shape=(self.size,))
+            for i in range(0, self.size, self.CHUNK_SIZE * 16):
+                out[i:i + self.CHUNK_SIZE * 16] = src[i:i + self.CHUNK_SIZE * 16]
+            del src
+        out.flush()
+        del out
+        os.unlink(self._path)
+
+
+def export_columnar(
+        db,
+        path: str,
+        sql: str,
+        key: Tuple[str, ...] = ('lemma', 'pos'),
+        str_columns: Sequence[str] = (),
+        float_columns: Sequence[str] = (),
+        group_ranks: Optional[Dict[str, str]] = None,
+        chunk_size: int = 10000):
+    """
+    Run an SQL query (which must be ordered by the key columns first) and store
+    its result as a columnar export.
+
+    The number of rows is obtained first (COUNT(*)) so the column arrays
+    are written directly to memory mapped .npy files chunk by chunk.
+    Group offsets and string offsets are spilled to raw files. Only
+    the string interning dictionary grows with the data.
+
+    Args:
+        db: an SQLite connection
+        path: an output directory
+        sql: a query; its column names are used as the names of the arrays
+        key: columns the groups are defined by
+        str_columns: columns to be stored as interned strings
+        float_columns: columns to be stored as floats (the remaining ones must be integers);
+                       NULL numbers are stored as zeros
+        group_ranks: derived rank columns (name => source column)
+        chunk_size: number of rows fetched and written at once
+    """
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, META_FILE)
+    if os.path.exists(meta_path):
+        os.unlink(meta_path)
+    cur = db.cursor()
+    cur.execute('SELECT COUNT(*) FROM ({0})'.format(sql))
+    total_rows = cur.fetchone()[0]
+    cur.execute(sql)
+    names = [d[0] for d in cur.description]
+    types = [TYPE_STR if name in str_columns else TYPE_FLOAT if name in float_columns else TYPE_INT for name in names]
+    key_idx = [names.index(k) for k in key]
+    outputs = [
+        np.lib.format.open_memmap(
+            os.path.join(path, name + '.npy'), mode='w+', dtype=ARRAY_TYPES[t][1], shape=(total_rows,))
+        for name, t in zip(names, types)]
+    groups = _SpillArray(os.path.join(path, 'groups.tmp'), 'q', np.int64)
+    offsets = _SpillArray(os.path.join(path, 'strings.idx.tmp'), 'q', np.int64)
+    offsets.append(0)
+    strings: Dict[str, int] = {}
+    curr_key = None
+    num_rows = 0
+    with open(os.path.join(path, 'strings.bin'), 'wb') as fw_strings:
+        str_offset = 0
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            if num_rows + len(rows) > total_rows:
+                raise RuntimeError('Columnar export: the query returned more rows than counted')
+            data = [array(ARRAY_TYPES[t][0]) for t in types]
+            for row in rows:
+                row_key = tuple(row[i] for i in key_idx)
+                if row_key != curr_key:
+                    groups.append(num_rows)
+                    curr_key = row_key
+                for i, v in enumerate(row):
+                    if types[i] == TYPE_STR:
+                        if v is None:
+                            data[i].append(NULL_CODE)
+                        else:
+                            code = strings.get(v)
+                            if code is None:
+                                code = len(strings)
+                                strings[v] = code
+                                raw = v.encode('utf-8')
+                                fw_strings.write(raw)
+                                str_offset += len(raw)
+                                offsets.append(str_offset)
+                            data[i].append(code)
+                    else:
+                        data[i].append(v or 0)
+                num_rows += 1
+            for out, t, values in zip(outputs, types, data):
+                out[num_rows - len(rows):num_rows] = np.frombuffer(values, dtype=ARRAY_TYPES[t][1])
+    if num_rows != total_rows:
+        raise RuntimeError('Columnar export: the query returned fewer rows than counted')
+    groups.append(num_rows)
+    for out in outputs:
+        out.flush()
+    del outputs
+    groups.save(os.path.join(path, 'groups.npy'))
+    offsets.save(os.path.join(path, 'strings.idx.npy'))
+    with open(meta_path, 'w') as fw:
+        json.dump(dict(
+            version=FORMAT_VERSION, num_rows=num_rows, num_groups=groups.size - 1, key=list(key),
+            columns=[dict(name=n, type=t) for n, t in zip(names, types)], group_ranks=group_ranks or {}), fw, indent=2)
+    print('Columnar export: {0} rows, {1} groups, {2} strings'.format(num_rows, groups.size - 1, len(strings)))
+
+
+def is_columnar(path: str) -> bool:
+    """
+    Test whether the path contains a complete columnar export
+    """
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class _GroupKeys:
+    """
+    A lazy sequence of group keys (for bisect)
+    """
+
+    def __init__(self, db: 'ColumnarFreqDB'):
+        self._db = db
+
+    def __len__(self):
+        return self._db.num_groups
+
+    def __getitem__(self, i: int) -> Tuple:
+        return tuple((v is not None, v) for v in self._db.group_key(i))
+
+
+class ColumnarFreqDB:
+    """
+    A read-only access to a columnar export. All the arrays
+    are memory mapped.
+
+    Args:
+        path: an export directory
+        string_cache_size: max. number of cached decoded strings
+        with_ranks: if False, group rank columns are not calculated (their values are None)
+    """
+
+    def __init__(self, path: str, string_cache_size: int = 1000000, with_ranks: bool = True):
+        with open(os.path.join(path, META_FILE)) as fr:
+            self._meta = json.load(fr)
+        if self._meta['version'] != FORMAT_VERSION:
+            raise ValueError('Unsupported columnar format version {0}'.format(self._meta['version']))
+        self._types = {c['name']: c['type'] for c in self._meta['columns']}
+        self._columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in self._types}
+        self._groups = np.load(os.path.join(path, 'groups.npy'), mmap_mode='r')
+        self._str_offsets = np.load(os.path.join(path, 'strings.idx.npy'), mmap_mode='r')
+        with open(os.path.join(path, 'strings.bin'), 'rb') as fr:
+            self._strings = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ) if self._str_offsets[-1] > 0 else b''
+        self.string = lru_cache(maxsize=string_cache_size)(self._decode)
+        self._group_ranks = {
+            name: self._rank_groups(source) if with_ranks else None
+            for name, source in self._meta.get('group_ranks', {}).items()}
+
+    def _rank_groups(self, column: str) -> np.ndarray:
+        values = np.asarray(self._columns[column][self._groups[:-1]])
+        # rank = 1 + number of groups with a higher value
+        return len(values) - np.searchsorted(np.sort(values), values, side='right') + 1
+
+    @property
+    def num_rows(self) -> int:
+        return self._meta['num_rows']
+
+    @property
+    def num_groups(self) -> int:
+        return self._meta['num_groups']
+
+    @property
+    def columns(self) -> List[str]:
+        return [c['name'] for c in self._meta['columns']] + list(self._group_ranks)
+
+    def _decode(self, code: int) -> Optional[str]:
+        if code == NULL_CODE:
+            return None
+        return self._strings[self._str_offsets[code]:self._str_offsets[code + 1]].decode('utf-8')
+
+    def column(self, name: str, start: int = 0, end: Optional[int] = None) -> List[Any]:
+        """
+        Get values of a column for the rows [start, end)
+        """
+        values = self._columns[name][start:end].tolist()
+        if self._types[name] == TYPE_STR:
+            return [self.string(v) for v in values]
+        elif self._types[name] == TYPE_FLOAT:
+            # the same as SQLite's INTEGER affinity does with REAL values
+            return [int(v) if v.is_integer() else v for v in values]
+        return values
+
+    def group_key(self, i: int) -> Tuple:
+        row = int(self._groups[i])
+        return tuple(self.string(int(self._columns[k][row])) for k in self._meta['key'])
+
+    def _group_order(self, after: Optional[Tuple[str, str]], by_id: bool) -> Sequence[int]:
+        if by_id:
+            # stable ids are derived from the key (see couchsync.py)
+            return sorted(range(self.num_groups), key=lambda i: mk_stable_id(*self.group_key(i)))
+        start = 0
+        if after is not None:
+            keys = _GroupKeys(self)
+            target = tuple((v is not None, v) for v in after)
+            lo, hi = 0, len(keys)
+            while lo < hi:  # bisect_right
+                mid = (lo + hi) // 2
+                if target < keys[mid]:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            start = lo
+        return range(start, self.num_groups)
+
+    def iter_rows(
+            self,
+            columns: Sequence[str],
+            after: Optional[Tuple[str, str]] = None,
+            by_id: bool = False) -> Iterator[Tuple[Any, ...]]:
+        """
+        Produce rows with the requested columns ordered by the group key
+        (or by stable ids of groups if by_id is True), optionally starting
+        right after the 'after' key.
+        """
+        for i in self._group_order(after, by_id):
+            start, end = int(self._groups[i]), int(self._groups[i + 1])
+            yield from zip(*(self._group_column(name, i, end - start) if name in self._group_ranks
+                             else self.column(name, start, end) for name in columns))
+
+    def _group_column(self, name: str, group: int, size: int) -> List[Optional[int]]:
+        ranks = self._group_ranks[name]
+        return [None if ranks is None else int(ranks[group])] * size
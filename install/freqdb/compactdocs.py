@@ -0,0 +1,80 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A compact freqdb document schema (version 2).
+
+Forms are stored as parallel arrays ("cforms") sorted by count (ascending,
+i.e. in the order the CouchDB backend returns them) instead of a list of
+objects repeating their keys. Only the top K forms (by count) are stored
+inline. The remaining ones are stored in an overflow document which the
+CouchDB backend reads only when all the forms are needed (word forms tile):
+
+    {"_id": ID, "schema": 2, "lemma": ..., "pos": ..., "count": ..., "arf": ...,
+     "cforms": {"word": [...], "count": [...], "arf": [...]},
+     "num_forms": N, "overflow": "ID:overflow"}
+
+    {"_id": "ID:overflow", "schema": 2, "overflow_of": ID, "lemma": ..., "pos": ...,
+     "count": ..., "arf": ..., "cforms": {...}}
+
+Documents with a single form are kept in the original schema (the arrays
+would only add bytes). "num_forms" and "overflow" are present only in
+truncated documents.
+
+The overflow document repeats the lemma fields so a "by-word" view hit can
+be resolved without reading the main document. Its id sorts right after
+the id of the main document (as required by couchsync.py).
+"""
+
+from typing import Any, Dict, List
+
+SCHEMA_VERSION = 2
+
+OVERFLOW_SUFFIX = ':overflow'
+
+FORM_FIELDS = ('word', 'count', 'arf', 'ipm', 'flevel', 'arf_rank')
+
+# fields not copied to overflow documents
+MAIN_ONLY_FIELDS = ('_id', 'cforms', 'num_forms', 'overflow', 'arf_neighbours', 'sublemmas')
+
+DEFAULT_TOP_K = 50
+
+
+def to_columns(forms: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    fields = [f for f in FORM_FIELDS if len(forms) > 0 and f in forms[0]]
+    return {f: [form[f] for form in forms] for f in fields}
+
+
+def compact_doc(doc: Dict[str, Any], top_k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Convert a document with a "forms" list to the compact schema. Return
+    the main document optionally followed by its overflow document.
+    """
+    if len(doc['forms']) <= 1:
+        return [doc]
+    forms = sorted(doc.pop('forms'), key=lambda form: form['count'])
+    ans = dict(doc)
+    ans['schema'] = SCHEMA_VERSION
+    split = max(len(forms) - top_k, 0)
+    ans['cforms'] = to_columns(forms[split:])
+    if split == 0:
+        return [ans]
+    ans['num_forms'] = len(forms)
+    ans['overflow'] = doc['_id'] + OVERFLOW_SUFFIX
+    overflow = {k: v for k, v in ans.items() if k not in MAIN_ONLY_FIELDS}
+    overflow['_id'] = ans['overflow']
+    overflow['overflow_of'] = doc['_id']
+    overflow['cforms'] = to_columns(forms[:split])
+    return [ans, overflow]
@@ -0,0 +1,305 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pipelined CouchDB bulk loader.
+
+Batches of documents are produced by a (blocking) reader running in
+a separate thread and passed via a bounded asyncio queue to a number
+of concurrent writers, each of them posting to the _bulk_docs endpoint
+over its own keep-alive HTTP connection. This way reading from SQLite
+and indexing in CouchDB overlap. Failed batches are retried with an
+exponential backoff. An optional callback is notified about committed
+batches which allows the import to be checkpointed and resumed.
+
+The loader uses only the standard library, so it can be pointed to any
+local HTTP server mimicking the _bulk_docs endpoint for testing.
+"""
+
+import asyncio
+import base64
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+from urllib.parse import quote, urlsplit, unquote, urlencode
+
+from docencoding import EncodedBatch
+
+DEFAULT_NUM_WRITERS = 4
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+DEFAULT_REPORT_INTERVAL = 10.0
+HTTP_TIMEOUT = 600
+
+# query parameters CouchDB expects to be JSON values
+JSON_PARAMS = ('key', 'keys', 'startkey', 'endkey', 'start_key', 'end_key')
+
+
+class BulkLoadError(Exception):
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class RetryableError(Exception):
+    pass
+
+
+class LoadStats:
+
+    def __init__(self):
+        self.num_docs = 0
+        self.num_batches = 0
+        self.num_bytes = 0
+        self.num_retries = 0
+        self.num_doc_errors = 0
+        self.t0 = time.time()
+
+    def report(self, prefix: str = 'Loaded'):
+        t = max(time.time() - self.t0, 1e-6)
+        print('{0} {1} docs in {2} batches ({3:.0f} docs/s, {4:.2f} MB/s, retries: {5}, doc errors: {6})'.format(
+            prefix, self.num_docs, self.num_batches, self.num_docs / t, self.num_bytes / t / 1e6,
+            self.num_retries, self.num_doc_errors))
+
+
+class CouchClient:
+    """
+    A minimal CouchDB HTTP client based on http.client. Connections
+    are created explicitly so each user (e.g. a bulk writer) can keep
+    its own keep-alive connection.
+
+    Args:
+        server_url: CouchDB server URL (credentials may be part of the URL)
+    """
+
+    def __init__(self, server_url: str):
+        url = urlsplit(server_url)
+        self._scheme = url.scheme
+        self._netloc = (url.hostname or 'localhost', url.port)
+        self._root = url.path.rstrip('/')
+        self._headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if url.username:
+            credentials = '{0}:{1}'.format(unquote(url.username), unquote(url.password or ''))
+            self._headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self._scheme == 'https':
+            return http.client.HTTPSConnection(*self._netloc, timeout=HTTP_TIMEOUT)
+        return http.client.HTTPConnection(*self._netloc, timeout=HTTP_TIMEOUT)
+
+    def path(self, *parts: str, **params: Any) -> str:
+        """
+        Create a request path. Parameter values are JSON encoded as
+        required by CouchDB (e.g. for startkey).
+        """
+        ans = '/'.join((self._root,) + tuple(quote(p, safe='_') for p in parts))
+        if params:
+            ans += '?' + urlencode({k: v if type(v) is str and k not in JSON_PARAMS else json.dumps(v) for k, v in params.items()})
+        return ans
+
+    def request(self, conn: http.client.HTTPConnection, method: str, path: str, body: Optional[bytes] = None) -> Any:
+        """
+        Send a single request (blocking) and return decoded JSON response.
+
+        Raises:
+            RetryableError: in case of connection errors, 5xx and 429 responses
+            BulkLoadError: in case of other 4xx responses
+        """
+        try:
+            conn.request(method, path, body=body, headers=self._headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as ex:
+            conn.close()
+            raise RetryableError('Connection error: {0}'.format(ex))
+        if resp.status >= 500 or resp.status == 429:
+            raise RetryableError('Server error {0}: {1}'.format(resp.status, data[:200]))
+        elif resp.status >= 400:
+            raise BulkLoadError('Request failed {0}: {1}'.format(resp.status, data[:200]), resp.status)
+        return json.loads(data)
+
+
+class CouchBulkLoader:
+    """
+    Args:
+        server_url: CouchDB server URL (credentials may be part of the URL)
+        db_name: a database to write to
+        num_writers: number of concurrent writers (= HTTP connections)
+        queue_size: max. number of batches waiting for a writer
+    """
+
+    def __init__(
+            self,
+            server_url: str,
+            db_name: str,
+            num_writers: int = DEFAULT_NUM_WRITERS,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            backoff: float = DEFAULT_BACKOFF,
+            report_interval: float = DEFAULT_REPORT_INTERVAL):
+        self._client = CouchClient(server_url)
+        self._path = self._client.path(db_name, '_bulk_docs')
+        self._num_writers = num_writers
+        self._queue_size = queue_size
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._report_interval = report_interval
+        self.stats = LoadStats()
+        self._on_commit: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._committed: Dict[int, Dict[str, Any]] = {}
+        self._next_commit = 0
+
+    def _post(self, conn: http.client.HTTPConnection, body: bytes) -> List[Dict[str, Any]]:
+        return self._client.request(conn, 'POST', self._path, body)
+
+    def _encode(self, batch: Union[EncodedBatch, List[Dict[str, Any]]]) -> bytes:
+        if isinstance(batch, EncodedBatch):
+            return batch.bulk_body()
+        return json.dumps({'docs': batch}).encode('utf-8')
+
+    async def _writer(self, queue: asyncio.Queue, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        conn = self._client.connect()
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                seq, batch = item
+                body = await loop.run_in_executor(executor, self._encode, batch)
+                for attempt in range(self._max_retries + 1):
+                    try:
+                        ans = await loop.run_in_executor(executor, self._post, conn, body)
+                        break
+                    except RetryableError as ex:
+                        if attempt == self._max_retries:
+                            raise BulkLoadError('Giving up after {0} retries: {1}'.format(attempt, ex))
+                        self.stats.num_retries += 1
+                        wait = self._backoff * 2 ** attempt
+                        print('Batch failed ({0}), retrying in {1:.1f}s'.format(ex, wait))
+                        await asyncio.sleep(wait)
+                self.stats.num_doc_errors += sum(1 for item in ans if 'error' in item)
+                self.stats.num_docs += len(batch)
+                self.stats.num_batches += 1
+                self.stats.num_bytes += len(body)
+                self._mark_committed(seq, batch.last if isinstance(batch, EncodedBatch) else batch[-1])
+        finally:
+            conn.close()
+
+    def _mark_committed(self, seq: int, last_doc: Dict[str, Any]):
+        """
+        Batches may be committed out of order by concurrent writers. The
+        on_commit callback is called only for a continuous sequence of
+        committed batches so it is safe to resume right after the last doc
+        it has seen.
+        """
+        self._committed[seq] = last_doc
+        while self._next_commit in self._committed:
+            doc = self._committed.pop(self._next_commit)
+            self._next_commit += 1
+            if self._on_commit:
+                self._on_commit(doc)
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self._report_interval)
+            self.stats.report('Progress:')
+
+    def _read(self, batches: Iterable[List[Dict[str, Any]]], queue: asyncio.Queue, loop, stop: threading.Event):
+        """
+        Feed the queue from a blocking source (runs in its own thread).
+        """
+        try:
+            for seq, batch in enumerate(batches):
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(queue.put((seq, batch)), loop).result()
+        finally:
+            if not stop.is_set():
+                for _ in range(self._num_writers):
+                    asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    async def _load(self, batches: Iterable[List[Dict[str, Any]]]):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self._queue_size)
+        stop = threading.Event()
+        with ThreadPoolExecutor(self._num_writers + 1) as executor:
+            reader = loop.run_in_executor(executor, self._read, batches, queue, loop, stop)
+            reporter = asyncio.ensure_future(self._reporter())
+            writers = [asyncio.ensure_future(self._writer(queue, executor)) for _ in range(self._num_writers)]
+            try:
+                await asyncio.gather(*writers)
+            except BaseException:
+                stop.set()
+                for w in writers:
+                    w.cancel()
+                while not queue.empty():  # unblock the reader
+                    queue.get_nowait()
+                raise
+            finally:
+                reporter.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+            await reader
+
+    def load(
+            self,
+            batches: Iterable[List[Dict[str, Any]]],
+            on_commit: Optional[Callable[[Dict[str, Any]], None]] = None) -> LoadStats:
+        """
+        Load all the batches and return the final statistics.
+        If on_commit is set, it is called with the last document
+        of each committed batch (in the order of batches).
+        """
+        self.stats = LoadStats()
+        self._on_commit = on_commit
+        self._committed = {}
+        self._next_commit = 0
+        asyncio.run(self._load(batches))
+        self.stats.report()
+        return self.stats
+
+
+class Checkpoint:
+    """
+    A persistent (JSON file) record of the last committed
+    position of an import.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.isfile(self._path):
+            return None
+        with open(self._path) as fr:
+            return json.load(fr)
+
+    def save(self, data: Dict[str, Any]):
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as fw:
+            json.dump(data, fw)
+            fw.flush()
+            os.fsync(fw.fileno())
+        os.replace(tmp_path, self._path)
+
+    def clear(self):
+        if os.path.isfile(self._path):
+            os.unlink(self._path)
@@ -0,0 +1,186 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Diff-sync of freqdb documents with an existing CouchDB database.
+
+In the sync mode, documents have stable ids derived from their (lemma, pos)
+key and they contain a hash of their content. Local documents (ordered by id)
+are merge-joined with pages of a remote (id, rev, hash) listing (ordered by id too)
+and only new, changed and deleted documents are sent to the server. This way
+CouchDB view indexers have to process only the delta.
+
+The listing is read from a small view (SYNC_DESIGN_DOC, installed by the sync
+if missing) so the documents themselves are not transferred. Documents without
+the hash (e.g. loaded without --sync) are listed with a null hash and rewritten.
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from couchloader import BulkLoadError, CouchClient, RetryableError, DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF
+
+DEFAULT_PAGE_SIZE = 2000
+
+HASH_FIELD = 'content_hash'
+
+SYNC_DESIGN_DOC = 'freqdb_sync'
+
+SYNC_VIEW = 'content_hash'
+
+# keys are document ids; the raw collation keeps them in the same order as _all_docs and Python
+SYNC_VIEW_DEF = dict(
+    map='function (doc) {{ emit(doc._id, [doc._rev, doc.{0} || null]); }}'.format(HASH_FIELD),
+    options=dict(collation='raw'))
+
+
+def mk_stable_id(lemma: str, pos: str) -> str:
+    """
+    Create a document id derived from a (lemma, pos) key. Hex digits
+    sort the same way in Python and in CouchDB's raw _all_docs collation.
+    """
+    return hashlib.sha1('{0}\t{1}'.format(lemma, pos).encode('utf-8')).hexdigest()
+
+
+def add_stable_ids(db, table: str = 'lemma'):
+    """
+    Store stable ids of a lemma table's (value, pos) rows in its indexed
+    stable_id column (created if missing), so documents can be read ordered
+    by id without calling Python for each row. Only missing ids are computed
+    (e.g. for lemmas added by a delta build).
+    """
+    cur = db.cursor()
+    if 'stable_id' not in [row[1] for row in cur.execute('PRAGMA table_info({0})'.format(table))]:
+        cur.execute('ALTER TABLE {0} ADD COLUMN stable_id TEXT'.format(table))
+    db.create_function('mk_stable_id', 2, mk_stable_id, deterministic=True)
+    cur.execute('UPDATE {0} SET stable_id = mk_stable_id(value, pos) WHERE stable_id IS NULL'.format(table))
+    cur.execute('CREATE INDEX IF NOT EXISTS {0}_stable_id_idx ON {0} (stable_id)'.format(table))
+
+
+def content_hash(doc: Dict[str, Any]) -> str:
+    data = {k: v for k, v in doc.items() if k not in ('_id', '_rev', HASH_FIELD)}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class SyncStats:
+
+    def __init__(self):
+        self.inserted = 0
+        self.changed = 0
+        self.deleted = 0
+        self.unchanged = 0
+
+    def report(self):
+        print('Sync: {0} inserted, {1} changed, {2} deleted, {3} unchanged'.format(
+            self.inserted, self.changed, self.deleted, self.unchanged))
+
+
+def _request(client: CouchClient, conn, method: str, path: str, body: Optional[bytes], max_retries: int, backoff: float) -> Any:
+    for attempt in range(max_retries + 1):
+        try:
+            return client.request(conn, method, path, body)
+        except RetryableError:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def install_sync_view(client: CouchClient, conn, db_name: str, max_retries: int, backoff: float):
+    """
+    Create (or update) the design document with the (id => [rev, hash]) view
+    """
+    path = client.path(db_name, '_design', SYNC_DESIGN_DOC)
+    doc = dict(language='javascript', views={SYNC_VIEW: SYNC_VIEW_DEF})
+    try:
+        curr = _request(client, conn, 'GET', path, None, max_retries, backoff)
+    except BulkLoadError as ex:
+        if ex.status != 404:
+            raise
+        curr = None
+    if curr is not None:
+        if curr.get('views') == doc['views']:
+            return
+        doc['_rev'] = curr['_rev']
+    _request(client, conn, 'PUT', path, json.dumps(doc).encode('utf-8'), max_retries, backoff)
+    print('Installed view {0} to {1}/_design/{2}'.format(SYNC_VIEW, db_name, SYNC_DESIGN_DOC))
+
+
+def iter_remote(
+        server_url: str,
+        db_name: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Iterate over (id, rev, content hash) of all the non-design documents
+    in the database ordered by id. The listing is fetched in pages from
+    the sync view (the first request may take a while if CouchDB has to
+    index the documents first).
+    """
+    client = CouchClient(server_url)
+    conn = client.connect()
+    try:
+        install_sync_view(client, conn, db_name, max_retries, backoff)
+        params: Dict[str, Any] = dict(limit=page_size)
+        while True:
+            ans = _request(
+                client, conn, 'GET', client.path(db_name, '_design', SYNC_DESIGN_DOC, '_view', SYNC_VIEW, **params),
+                None, max_retries, backoff)
+            for row in ans['rows']:
+                yield row['id'], row['value'][0], row['value'][1]
+            if len(ans['rows']) < page_size:
+                return
+            # the smallest possible key greater than the last one
+            params = dict(limit=page_size, startkey=ans['rows'][-1]['key'] + '\u0000')
+    finally:
+        conn.close()
+
+
+def iter_changes(
+        local_docs: Iterable[Dict[str, Any]],
+        remote: Iterable[Tuple[str, str, str]],
+        stats: Optional[SyncStats] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Merge-join local documents with the remote (id, rev, hash) listing (both
+    must be ordered by id) and produce documents to be written to the server
+    (new ones, changed ones with a proper _rev and deletion stubs).
+    """
+    if stats is None:
+        stats = SyncStats()
+    remote_iter = iter(remote)
+    curr_remote = next(remote_iter, None)
+    for doc in local_docs:
+        doc[HASH_FIELD] = content_hash(doc)
+        while curr_remote is not None and curr_remote[0] < doc['_id']:
+            stats.deleted += 1
+            yield {'_id': curr_remote[0], '_rev': curr_remote[1], '_deleted': True}
+            curr_remote = next(remote_iter, None)
+        if curr_remote is not None and curr_remote[0] == doc['_id']:
+            if curr_remote[2] != doc[HASH_FIELD]:
+                doc['_rev'] = curr_remote[1]
+                stats.changed += 1
+                yield doc
+            else:
+                stats.unchanged += 1
+            curr_remote = next(remote_iter, None)
+        else:
+            stats.inserted += 1
+            yield doc
+    while curr_remote is not None:
+        stats.deleted += 1
+        yield {'_id': curr_remote[0], '_rev': curr_remote[1], '_deleted': True}
+        curr_remote = next(remote_iter, None)
@@ -0,0 +1,192 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Incremental (delta) update of a freqdb database.
+
+Rows of a new colcounts delta are appended to the colcounts table and
+only the lemmas found in the delta are recomputed. Checksums of the affected
+(lemma, pos) groups are calculated before and after the rebuild so the
+changed groups can be reported. This allows downstream loaders to push
+only changed groups (see also the --changed-out option of the builders).
+
+Each build is recorded in the 'build_version' table. Delta builds also store
+a digest of the delta content and the same delta cannot be applied twice (its
+rows would be counted twice). As the colcounts table is modified in place,
+the builders must not turn off the rollback journal in the delta mode.
+"""
+
+import hashlib
+import sqlite3
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from batchwriter import TableSpec
+
+class DeltaError(Exception):
+    pass
+
+
+CHANGE_NEW = 'new'
+CHANGE_MODIFIED = 'modified'
+CHANGE_DELETED = 'deleted'
+
+AFFECTED_TABLE = 'temp.freqdb_affected'
+
+
+def create_meta_tables(db):
+    cur = db.cursor()
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS build_version (version INTEGER PRIMARY KEY, created INTEGER, is_delta INTEGER, '
+        'num_changed INTEGER, delta_digest TEXT)')
+    if 'delta_digest' not in [r[1] for r in cur.execute('PRAGMA table_info(build_version)')]:
+        cur.execute('ALTER TABLE build_version ADD COLUMN delta_digest TEXT')
+
+
+def _group_columns(table: TableSpec) -> Tuple[str, str]:
+    return ('value', 'pos') if table.name == 'lemma' else ('lemma', 'pos')
+
+
+def _next_version(db) -> int:
+    cur = db.cursor()
+    cur.execute('SELECT MAX(version) FROM build_version')
+    return (cur.fetchone()[0] or 0) + 1
+
+
+def _record_build(db, is_delta: bool, num_changed: Optional[int], delta_digest: Optional[str] = None) -> int:
+    version = _next_version(db)
+    db.execute('INSERT INTO build_version (version, created, is_delta, num_changed, delta_digest) VALUES (?, ?, ?, ?, ?)',
+               (version, int(time.time()), int(is_delta), num_changed, delta_digest))
+    return version
+
+
+def record_full_build(db) -> int:
+    """
+    Record a full (from scratch) build.
+    """
+    create_meta_tables(db)
+    return _record_build(db, False, None)
+
+
+def delta_digest(delta_db, columns: List[str]) -> str:
+    """
+    Calculate a digest of the delta colcounts content
+    """
+    h = hashlib.sha1(repr(columns).encode('utf-8'))
+    for row in delta_db.execute('SELECT {0} FROM colcounts ORDER BY rowid'.format(
+            ', '.join('`{0}`'.format(c) for c in columns))):
+        h.update(repr(row).encode('utf-8'))
+    return h.hexdigest()
+
+
+def group_checksums(db, tables: List[TableSpec]) -> Dict[Tuple[str, str], str]:
+    """
+    Calculate checksums of all the (lemma, pos) groups of the affected
+    lemmas. A checksum covers the group rows in all the tables.
+    """
+    hashes: Dict[Tuple[str, str], Any] = {}
+    cur = db.cursor()
+    for t in tables:
+        lemma_col, pos_col = _group_columns(t)
+        cur.execute('SELECT {0}, {1}, {2} FROM {3} WHERE {1} IN (SELECT value FROM {4}) ORDER BY {0}'.format(
+            ', '.join(t.columns), lemma_col, pos_col, t.name, AFFECTED_TABLE))
+        for row in cur:
+            key = row[-2:]
+            if key not in hashes:
+                hashes[key] = hashlib.sha1()
+            hashes[key].update(repr((t.name,) + row[:-2]).encode('utf-8'))
+    return {k: v.hexdigest() for k, v in hashes.items()}
+
+
+def apply_delta(
+        db,
+        delta_path: str,
+        lemma_column: str,
+        tables: List[TableSpec],
+        rebuild: Callable[[str, Tuple], None]) -> List[Tuple[str, str, str]]:
+    """
+    Append colcounts rows from the delta database, remove the tables rows of
+    all the lemmas found in the delta and recompute them using
+    rebuild(sql_condition, sql_params) which is expected to process only
+    colcounts rows matching the condition (without recreating the tables).
+
+    Returns a list of (change type, lemma, pos) for the groups which really
+    changed.
+
+    Raises:
+        DeltaError: if the delta has been already applied
+    """
+    create_meta_tables(db)
+    cur = db.cursor()
+    with sqlite3.connect(delta_path) as delta_db:
+        columns = [r[1] for r in delta_db.execute('PRAGMA table_info(colcounts)')]
+        digest = delta_digest(delta_db, columns)
+    delta_db.close()
+    cur.execute('SELECT version, created FROM build_version WHERE delta_digest = ?', (digest,))
+    applied = cur.fetchone()
+    if applied:
+        raise DeltaError('Delta {0} has been already applied (build version {1}, {2})'.format(
+            delta_path, applied[0], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(applied[1]))))
+
+    # one-off indexes making lemma based access to large tables cheap
+    cur.execute('CREATE INDEX IF NOT EXISTS colcounts_{0}_idx ON colcounts ({0})'.format(lemma_column))
+    for t in tables:
+        if t.name != 'lemma':
+            cur.execute('CREATE INDEX IF NOT EXISTS {0}_lemma_pos_idx ON {0} (lemma, pos)'.format(t.name))
+
+    cur.execute('SELECT MAX(rowid) FROM colcounts')
+    last_rowid = cur.fetchone()[0] or 0
+    with sqlite3.connect(delta_path) as delta_db:
+        cur.executemany(
+            'INSERT INTO colcounts ({0}) VALUES ({1})'.format(
+                ', '.join('`{0}`'.format(c) for c in columns), ', '.join('?' for _ in columns)),
+            delta_db.execute('SELECT {0} FROM colcounts'.format(', '.join('`{0}`'.format(c) for c in columns))))
+    delta_db.close()
+    cur.execute('DROP TABLE IF EXISTS {0}'.format(AFFECTED_TABLE))
+    cur.execute('CREATE TABLE {0} (value TEXT PRIMARY KEY)'.format(AFFECTED_TABLE))
+    cur.execute('INSERT OR IGNORE INTO {0} (value) SELECT DISTINCT {1} FROM colcounts WHERE rowid > ?'.format(
+        AFFECTED_TABLE, lemma_column), (last_rowid,))
+
+    old_checksums = group_checksums(db, tables)
+    for t in reversed(tables):
+        cur.execute('DELETE FROM {0} WHERE {1} IN (SELECT value FROM {2})'.format(
+            t.name, _group_columns(t)[0], AFFECTED_TABLE))
+    rebuild('{0} IN (SELECT value FROM {1})'.format(lemma_column, AFFECTED_TABLE), ())
+    new_checksums = group_checksums(db, tables)
+
+    changes = []
+    for key, checksum in new_checksums.items():
+        if key not in old_checksums:
+            changes.append((CHANGE_NEW,) + key)
+        elif old_checksums[key] != checksum:
+            changes.append((CHANGE_MODIFIED,) + key)
+    for key in old_checksums:
+        if key not in new_checksums:
+            changes.append((CHANGE_DELETED,) + key)
+    changes.sort(key=lambda x: (x[1] or '', x[2] or ''))
+
+    _record_build(db, True, len(changes), digest)
+    cur.execute('DROP TABLE {0}'.format(AFFECTED_TABLE))
+    return changes
+
+
+def write_changes(path: str, changes: List[Tuple[str, str, str]]):
+    """
+    Write a list of changed groups as a tab separated file
+    (change type, lemma, pos).
+    """
+    with open(path, 'w') as fw:
+        for change in changes:
+            fw.write('\t'.join('' if v is None else v for v in change) + '\n')
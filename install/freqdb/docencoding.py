@@ -0,0 +1,151 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Document encoding and byte-size based batching.
+
+Each document is encoded to JSON bytes exactly once (using orjson if
+installed) and the encoded documents are cut into batches by a byte
+budget, so a batch of huge lemmas (with thousands of forms) cannot
+produce a request exceeding CouchDB's max_http_request_size.
+"""
+
+import json
+import math
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+try:
+    import orjson
+
+    def encode_doc(doc: Dict[str, Any]) -> bytes:
+        return orjson.dumps(doc)
+except ImportError:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def encode_doc(doc: Dict[str, Any]) -> bytes:
+        return _encoder.encode(doc).encode('utf-8')
+
+DEFAULT_MAX_BATCH_BYTES = 32 * 1024 * 1024
+
+
+class EncodedBatch:
+    """
+    A batch of pre-encoded documents. Only the last document is kept
+    decoded (e.g. for checkpointing).
+    """
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.num_bytes = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    def append(self, doc: Dict[str, Any], data: bytes):
+        self.parts.append(data)
+        self.num_bytes += len(data) + 1
+        self.last = doc
+
+    def __len__(self):
+        return len(self.parts)
+
+    def bulk_body(self) -> bytes:
+        return b'{"docs":[' + b','.join(self.parts) + b']}'
+
+
+class Histogram:
+    """
+    A simple histogram with power-of-two buckets
+    """
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        b = math.ceil(math.log2(value)) if value > 1 else 0
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(
+            name=self.name, unit=self.unit, count=self.count, mean=self.total / self.count if self.count else 0,
+            max=self.max, buckets={'<={0}'.format(2 ** k): v for k, v in sorted(self.buckets.items())})
+
+    def report(self):
+        print('{0}: count {1}, mean {2:.1f} {4}, max {3:.1f} {4}'.format(
+            self.name, self.count, self.total / self.count if self.count else 0, self.max, self.unit))
+        for k, v in sorted(self.buckets.items()):
+            print('    <= {0:>12} {1}: {2}'.format(2 ** k, self.unit, v))
+
+
+class EncodingStats:
+
+    def __init__(self):
+        self.batch_bytes = Histogram('batch size', 'B')
+        self.batch_docs = Histogram('batch docs', 'docs')
+        self.encode_time = Histogram('batch encode time', 'us')
+
+    def report(self):
+        for h in (self.batch_bytes, self.batch_docs, self.encode_time):
+            h.report()
+
+
+def byte_batches(
+        docs: Iterable[Union[Dict[str, Any], List[Dict[str, Any]]]],
+        max_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        max_docs: Optional[int] = None,
+        stats: Optional[EncodingStats] = None) -> Iterator[EncodedBatch]:
+    """
+    Encode documents and cut them into batches of at most max_bytes
+    (a document larger than max_bytes forms a batch on its own)
+    and (optionally) at most max_docs documents.
+
+    An item may also be a list of documents which must not be split
+    between batches (e.g. a compact document and its overflow document,
+    so a checkpoint after a batch never points inside such a group).
+    """
+    batch = EncodedBatch()
+    encode_time = 0.0
+
+    def add_stats():
+        if stats:
+            stats.batch_bytes.add(batch.num_bytes)
+            stats.batch_docs.add(len(batch))
+            stats.encode_time.add(encode_time * 1e6)
+
+    for item in docs:
+        group = item if isinstance(item, list) else (item,)
+        t0 = time.perf_counter()
+        encoded = [encode_doc(doc) for doc in group]
+        dt = time.perf_counter() - t0
+        size = sum(len(data) + 1 for data in encoded)
+        if len(batch) > 0 and (batch.num_bytes + size > max_bytes
+                               or (max_docs is not None and len(batch) + len(group) > max_docs)):
+            add_stats()
+            yield batch
+            batch = EncodedBatch()
+            encode_time = 0.0
+        for doc, data in zip(group, encoded):
+            batch.append(doc, data)
+        encode_time += dt
+    if len(batch) > 0:
+        add_stats()
+        yield batch
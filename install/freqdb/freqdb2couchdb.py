@@ -22,83 +22,71 @@ Please note that this is still an ad-hoc script which may
 not work for your user case (e.g. the character filtering).
 """
 
-import sys
-import couchdb
-import sqlite3
-import re
+import json
+from functools import partial
 
-DB_NAME = 'freqdb3g_v3'
-
-
-class DummyDB2():
-    """
-    For testing
-    """
-
-    def update(self, data):
-        print(data)
+from common import add_freq_info
+from couchsync import add_stable_ids
+from mkfreqdb import SELECT_FORMS, SELECT_RANKED_FORMS
+from pipeline import export, mk_arg_parser, run_from_args, source
 
-    def __getitem__(self, v):
-        return self
+DB_NAME = 'freqdb3g_v3'
 
+BATCH_SIZE = 50000
 
-def select_lines(db1):
-    cursor = db1.cursor()
-    cursor.execute('SELECT w.value, w.lemma, w.pos, w.count, w.arf, w.pos as lemma_pos, m.count as lemma_count, m.arf as lemma_arf, m.is_pname as lemma_is_pname '
-                   'FROM word AS w JOIN lemma AS m ON m.value = w.lemma AND m.pos = w.pos ORDER BY w.lemma, w.pos, w.value')
-    return cursor
+# columns of select_lines() rows
+VALUE, LEMMA, POS, COUNT, ARF, LEMMA_COUNT, LEMMA_ARF, LEMMA_IS_PNAME, ARF_NEIGHBOURS, LEMMA_ARF_RANK = range(10)
 
-KEY_ALPHABET = ['%d' % i for i in range(10)] + [chr(x) for x in range(ord('a'), ord('z') + 1)] + [chr(x) for x in range(ord('A'), ord('Z') + 1)]
+COLUMNS = (
+    'value', 'lemma', 'pos', 'count', 'arf', 'lemma_count', 'lemma_arf', 'lemma_is_pname', 'arf_neighbours',
+    'lemma_arf_rank')
 
 
-def mk_id(x):
-    ans = [0, 0, 0, 0, 0, 0]
-    idx = len(ans) - 1
-    while x > 0:
-        p = x % len(KEY_ALPHABET)
-        ans[idx] = KEY_ALPHABET[p]
-        x = int(x / len(KEY_ALPHABET))
-        idx -= 1
-    ans = ''.join([str(x) for x in ans])
-    return ans
+def select_lines(db1, after=None, by_id=False, ranked=False):
+    """
+    Args:
+        after: an optional (lemma, pos) key to start right after
+        by_id: if True, lemmas are ordered by their stable ids (see couchsync.py)
+        ranked: if True, lemma_arf_rank is filled in (otherwise it is NULL)
+    """
+    if by_id:
+        add_stable_ids(db1)  # a no-op unless the database has been built by an older version
+        db1.commit()
+    return source(
+        db1,
+        (SELECT_RANKED_FORMS if ranked else SELECT_FORMS) + ' ' +
+        ('WHERE (w.lemma, w.pos) > (?, ?) ' if after else '') +
+        ('ORDER BY m.stable_id, w.value' if by_id else 'ORDER BY w.lemma, w.pos, w.value'), after or ())
 
 
-def convert(db1, db2):
-    buff = []
-    curr_lemma = None
-    i = 0
-    id_base = 0
-    for row in select_lines(db1):
-        if re.match(r'^[\sA-Za-z0-9áÁéÉěĚšŠčČřŘžŽýÝíÍúÚůťŤďĎňŇóÓ-]+$', row['lemma']):
-            new_lemma, new_pos = row['lemma'], row['lemma_pos']
-            if curr_lemma is None or new_lemma != curr_lemma['lemma'] or new_pos != curr_lemma['pos']:
-                if curr_lemma != None:
-                    buff.append(curr_lemma)
-                curr_lemma = {
-                    '_id': mk_id(id_base),
-                    'lemma': new_lemma,
-                    'forms': [],
-                    'pos': new_pos,
-                    'arf': row['lemma_arf'],
-                    'is_pname': bool(row['lemma_is_pname']),
-                    'count': row['lemma_count']
-                }
-                id_base += 1
-            curr_lemma['forms'].append({'word': row['value'], 'count': row['count'], 'arf': row['arf']})
-            if len(buff) == 50000:
-                db2.update(buff)
-                buff = []
-        i += 1
-        if i % 100000 == 0:
-            print('Processed {} records'.format(i))
-    buff.append(curr_lemma)
-    if len(buff) > 0:
-        db2.update(buff)
+def build_doc(rows, doc_id, corpus_size=None):
+    """
+    Args:
+        corpus_size: if set, ipm, flevel and ARF rank are added to the document
+                     and its forms (see common.add_freq_info)
+    """
+    first = rows[0]
+    doc = {
+        '_id': doc_id,
+        'lemma': first[LEMMA],
+        'forms': [{'word': row[VALUE], 'count': row[COUNT], 'arf': row[ARF]} for row in rows],
+        'pos': first[POS],
+        'arf': first[LEMMA_ARF],
+        'is_pname': bool(first[LEMMA_IS_PNAME]),
+        'count': first[LEMMA_COUNT]
+    }
+    if first[ARF_NEIGHBOURS]:
+        doc['arf_neighbours'] = json.loads(first[ARF_NEIGHBOURS])
+    if corpus_size:
+        add_freq_info(doc, corpus_size, first[LEMMA_ARF_RANK])
+    return doc
+
+
+def convert(db1, sink, batch_size=BATCH_SIZE, checkpoint=None, resume=False, remote=None, corpus_size=None):
+    export(lambda after, by_id: select_lines(db1, after, by_id, bool(corpus_size) and remote is None), partial(build_doc, corpus_size=corpus_size), LEMMA, POS,
+           sink, batch_size, checkpoint, resume, remote)
 
 
 if __name__ == '__main__':
-    db1 = sqlite3.connect(sys.argv[1])
-    db1.row_factory = sqlite3.Row
-    db2 = couchdb.Server(sys.argv[2])
-    #db2 = DummyDB2()
-    convert(db1, db2[DB_NAME])
\ No newline at end of file
+    args = mk_arg_parser('freqdb2couchdb', 'mkfreqdb.py', DB_NAME, BATCH_SIZE).parse_args()
+    run_from_args(args, select_lines, partial(build_doc, corpus_size=args.corpus_size), LEMMA, POS, COLUMNS)
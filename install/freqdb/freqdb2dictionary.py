@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export sqlite3-based word frequency database (created by mkfreqdb.py or
+mkfreqdb_sublemmas.py) to the MariaDB dictionary schema (see dictionary.sql)
+used by the Frodo backend.
+
+Instead of INSERT statements, tab separated files for LOAD DATA INFILE are
+produced along with a load script which creates the tables without secondary
+indexes, loads the data and only then creates the indexes. Rows are converted
+(including the SHA1 word ids) in a process pool.
+
+The --sqlite-check option loads the produced files into an SQLite database
+with the same tables, which allows the export to be tested without MariaDB.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from collections import deque
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+from pipeline import FETCH_SIZE, source
+
+DEFAULT_NUM_WORKERS = os.cpu_count() or 1
+
+WORD_COLUMNS = ('id', 'value', 'lemma', 'sublemma', 'pos', 'count', 'ngram', 'arf', 'sim_freqs_score', 'initial_cap')
+
+TERM_SEARCH_COLUMNS = ('word_id', 'value')
+
+SQL_TEMPLATE = """-- created by freqdb2dictionary.py
+SET NAMES utf8mb4;
+SET foreign_key_checks = 0;
+
+DROP TABLE IF EXISTS `{corpus}_term_search`;
+DROP TABLE IF EXISTS `{corpus}_word`;
+
+CREATE TABLE `{corpus}_word` (
+  `id` varchar(40) NOT NULL,
+  `value` text DEFAULT NULL,
+  `lemma` text DEFAULT NULL,
+  `sublemma` text DEFAULT NULL,
+  `pos` varchar(20) DEFAULT NULL,
+  `count` int(11) DEFAULT NULL,
+  `ngram` tinyint(4) NOT NULL,
+  `arf` float DEFAULT NULL,
+  `sim_freqs_score` float NOT NULL DEFAULT 0,
+  `initial_cap` tinyint(4) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`id`,`ngram`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin;
+
+CREATE TABLE `{corpus}_term_search` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `word_id` varchar(40) NOT NULL,
+  `value` text DEFAULT NULL,
+  `value_lc` text GENERATED ALWAYS AS (lcase(`value`)) STORED,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin;
+
+LOAD DATA LOCAL INFILE '{word_file}' INTO TABLE `{corpus}_word` CHARACTER SET utf8mb4
+  FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'
+  ({word_columns});
+
+LOAD DATA LOCAL INFILE '{term_file}' INTO TABLE `{corpus}_term_search` CHARACTER SET utf8mb4
+  FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'
+  ({term_columns});
+
+ALTER TABLE `{corpus}_word`
+  ADD KEY `{corpus}_word_pos_idx` (`pos`),
+  ADD KEY `{corpus}_word_sim_freqs_score_idx` (`sim_freqs_score`,`ngram`),
+  ADD KEY `{corpus}_word_lemma_idx` (`lemma`(768));
+
+ALTER TABLE `{corpus}_term_search`
+  ADD KEY `word_id` (`word_id`),
+  ADD KEY `{corpus}_term_search_value_idx` (`value`(768)),
+  ADD KEY `{corpus}_term_search_value_lc_idx` (`value_lc`(768)),
+  ADD CONSTRAINT `{corpus}_term_search_ibfk_1` FOREIGN KEY (`word_id`) REFERENCES `{corpus}_word` (`id`);
+
+SET foreign_key_checks = 1;
+"""
+
+# LOAD DATA default escaping
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+
+
+def mk_word_id(value: str, lemma: str, pos: str, sublemma: Optional[str] = None) -> str:
+    """
+    Create a word id compatible with existing dictionaries (SHA1 of value,
+    lemma and pos). Sublemmas different from the value are included too
+    to keep the ids unique.
+    """
+    key = value + lemma + pos
+    if sublemma is not None and sublemma != value:
+        key += sublemma
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def tsv_value(v) -> str:
+    if v is None:
+        return '\\N'
+    return str(v).translate(ESCAPES)
+
+
+def parse_tsv_line(line: str) -> List[Optional[str]]:
+    """
+    An inverse function to tsv_value() applied to a whole line
+    """
+    ans = []
+    for field in line.rstrip('\n').split('\t'):
+        if field == '\\N':
+            ans.append(None)
+            continue
+        buff = []
+        i = 0
+        while i < len(field):
+            if field[i] == '\\' and i + 1 < len(field):
+                buff.append(UNESCAPES.get(field[i + 1], field[i + 1]))
+                i += 2
+            else:
+                buff.append(field[i])
+                i += 1
+        ans.append(''.join(buff))
+    return ans
+
+
+def convert_rows(rows: List[Tuple]) -> Tuple[str, str]:
+    """
+    Convert a chunk of (value, lemma, sublemma, pos, count, arf, lemma_arf, is_pname)
+    rows into TSV data for the word and term_search tables. Runs in pool workers.
+    """
+    words = []
+    terms = []
+    for value, lemma, sublemma, pos, count, arf, lemma_arf, is_pname in rows:
+        word_id = mk_word_id(value or '', lemma or '', pos or '', sublemma)
+        words.append('\t'.join(tsv_value(v) for v in (
+            word_id, value, lemma, value if sublemma is None else sublemma, pos, count,
+            len(value.split(' ')) if value else 1, arf, lemma_arf or 0, int(bool(is_pname)))))
+        for term in dict.fromkeys(v for v in (value, lemma, sublemma) if v):
+            terms.append(word_id + '\t' + tsv_value(term))
+    return '\n'.join(words) + '\n', '\n'.join(terms) + '\n'
+
+
+def iter_chunks(db, fetch_size: int):
+    has_sublemma = any(r[1] == 'sublemma' for r in db.execute('PRAGMA table_info(word)'))
+    rows = source(
+        db,
+        'SELECT w.value, w.lemma, {0}, w.pos, w.count, w.arf, m.arf, m.is_pname '
+        'FROM word AS w JOIN lemma AS m ON m.value = w.lemma AND m.pos = w.pos'.format(
+            'w.sublemma' if has_sublemma else 'NULL'))
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == fetch_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def export(db, out_dir: str, corpus: str, num_workers: int = DEFAULT_NUM_WORKERS, fetch_size: int = FETCH_SIZE) -> str:
+    """
+    Write TSV files and a load script to out_dir. Returns
+    a path of the load script.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    word_path = os.path.join(out_dir, '{0}_word.tsv'.format(corpus))
+    term_path = os.path.join(out_dir, '{0}_term_search.tsv'.format(corpus))
+    with open(word_path, 'w', encoding='utf-8', newline='\n') as fw_word, \
+            open(term_path, 'w', encoding='utf-8', newline='\n') as fw_term:
+
+        def write(words, terms):
+            fw_word.write(words)
+            fw_term.write(terms)
+
+        if num_workers > 1:
+            with Pool(num_workers) as pool:
+                # a bounded number of chunks in progress (Pool.imap would read
+                # the whole database ahead); results are written in order
+                pending = deque()
+                for chunk in iter_chunks(db, fetch_size):
+                    pending.append(pool.apply_async(convert_rows, (chunk,)))
+                    if len(pending) >= 2 * num_workers:
+                        write(*pending.popleft().get())
+                while len(pending) > 0:
+                    write(*pending.popleft().get())
+        else:
+            for chunk in iter_chunks(db, fetch_size):
+                write(*convert_rows(chunk))
+    script_path = os.path.join(out_dir, '{0}_load.sql'.format(corpus))
+    with open(script_path, 'w') as fw:
+        fw.write(SQL_TEMPLATE.format(
+            corpus=corpus, word_file=os.path.abspath(word_path), term_file=os.path.abspath(term_path),
+            word_columns=', '.join('`{0}`'.format(c) for c in WORD_COLUMNS),
+            term_columns=', '.join('`{0}`'.format(c) for c in TERM_SEARCH_COLUMNS)))
+    return script_path
+
+
+def load_sqlite(out_dir: str, corpus: str, db_path: str):
+    """
+    Load exported files into an SQLite stand-in of the dictionary
+    schema (e.g. for testing).
+    """
+    with sqlite3.connect(db_path) as db:
+        db.execute('DROP TABLE IF EXISTS {0}_term_search'.format(corpus))
+        db.execute('DROP TABLE IF EXISTS {0}_word'.format(corpus))
+        db.execute(
+            'CREATE TABLE {0}_word (id TEXT NOT NULL, value TEXT, lemma TEXT, sublemma TEXT, pos TEXT, count INTEGER, '
+            'ngram INTEGER NOT NULL, arf REAL, sim_freqs_score REAL NOT NULL DEFAULT 0, '
+            'initial_cap INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (id, ngram))'.format(corpus))
+        db.execute(
+            'CREATE TABLE {0}_term_search (id INTEGER PRIMARY KEY AUTOINCREMENT, word_id TEXT NOT NULL, value TEXT, '
+            'value_lc TEXT GENERATED ALWAYS AS (lower(value)) STORED, '
+            'FOREIGN KEY (word_id) REFERENCES {0}_word (id))'.format(corpus))
+        with open(os.path.join(out_dir, '{0}_word.tsv'.format(corpus)), encoding='utf-8', newline='\n') as fr:
+            db.executemany(
+                'INSERT INTO {0}_word ({1}) VALUES ({2})'.format(
+                    corpus, ', '.join(WORD_COLUMNS), ', '.join('?' for _ in WORD_COLUMNS)),
+                (parse_tsv_line(line) for line in fr))
+        with open(os.path.join(out_dir, '{0}_term_search.tsv'.format(corpus)), encoding='utf-8', newline='\n') as fr:
+            db.executemany(
+                'INSERT INTO {0}_term_search (word_id, value) VALUES (?, ?)'.format(corpus),
+                (parse_tsv_line(line) for line in fr))
+        db.execute('CREATE INDEX {0}_word_lemma_idx ON {0}_word (lemma)'.format(corpus))
+        db.execute('CREATE INDEX {0}_term_search_value_lc_idx ON {0}_term_search (value_lc)'.format(corpus))
+        num_words = db.execute('SELECT COUNT(*) FROM {0}_word'.format(corpus)).fetchone()[0]
+        num_terms = db.execute('SELECT COUNT(*) FROM {0}_term_search'.format(corpus)).fetchone()[0]
+    db.close()
+    print('SQLite check: {0} words, {1} search terms loaded into {2}'.format(num_words, num_terms, db_path))
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        'freqdb2dictionary', description='Export sqlite3-based word frequency database to MariaDB dictionary tables')
+    argparser.add_argument('sqlite_db', metavar='SQLITE_DB', help='a database created by mkfreqdb.py or mkfreqdb_sublemmas.py')
+    argparser.add_argument('out_dir', metavar='OUT_DIR', help='a directory to write TSV files and a load script to')
+    argparser.add_argument('corpus', metavar='CORPUS', help='table name prefix (e.g. susanne)')
+    argparser.add_argument('-w', '--workers', type=int, default=DEFAULT_NUM_WORKERS,
+                           help='Number of worker processes (default is {0})'.format(DEFAULT_NUM_WORKERS))
+    argparser.add_argument('--sqlite-check', type=str, metavar='DB',
+                           help='Load the exported files into an SQLite database with the same tables')
+    args = argparser.parse_args()
+
+    t0 = time.time()
+    db1 = sqlite3.connect(args.sqlite_db)
+    script = export(db1, args.out_dir, args.corpus, args.workers)
+    print('Exported in {0:.1f}s, load the data using: mariadb --local-infile=1 DB_NAME < {1}'.format(
+        time.time() - t0, script))
+    if args.sqlite_check:
+        load_sqlite(args.out_dir, args.corpus, args.sqlite_check)
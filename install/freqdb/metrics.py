@@ -0,0 +1,257 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Progress metrics and a sampling profiler for the freqdb scripts.
+
+Metrics collects processed rows and groups, rejected rows by reason and
+time spent in individual stages. Stage times are exclusive: time spent
+in a nested stage (e.g. 'read' pulled by 'process') is not counted to
+its parent. If an output is set, a background thread writes a JSON line
+snapshot every interval seconds:
+
+    {"time": ..., "elapsed": ..., "rows": ..., "groups": ..., "rows_per_s": ...,
+     "groups_per_s": ..., "stage": ..., "stages": {...}, "rejected": {...},
+     "rss_bytes": ..., "sqlite_temp_bytes": ..., "final": false}
+
+The rates are computed since the previous snapshot. SQLite temp usage is
+the total size of SQLite's (unlinked) temporary files opened by the
+process (Linux only, otherwise null).
+
+SamplingProfiler periodically samples stacks of all the threads (e.g.
+the CouchDB loader reads and encodes documents in a separate thread) and
+writes them in the "collapsed" format (as used by flamegraph.pl and
+speedscope).
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+DEFAULT_INTERVAL = 10.0
+
+DEFAULT_PROFILE_INTERVAL = 5.0  # ms
+
+METRICS_THREAD = 'freqdb-metrics'
+
+T = TypeVar('T')
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as fr:
+            return int(fr.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak RSS as a fallback
+
+
+def sqlite_temp_bytes() -> Optional[int]:
+    """
+    SQLite creates temporary files (named etilqs_*) and unlinks them right
+    away, so they can be found only via the process' file descriptors.
+    """
+    if not os.path.isdir('/proc/self/fd'):
+        return None
+    total = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            if 'etilqs_' in os.readlink('/proc/self/fd/' + fd):
+                total += os.stat('/proc/self/fd/' + fd).st_size
+        except OSError:
+            pass
+    return total
+
+
+class Metrics:
+    """
+    Metrics without an output only count rows, groups and rejected
+    rows (which is cheap). Per-item stage timing in timed() is active
+    only if an output is set.
+    """
+
+    def __init__(self, output: Optional[str] = None, interval: float = DEFAULT_INTERVAL):
+        self.rows = 0
+        self.groups = 0
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.current_stage = None
+        self._output = output
+        self._interval = interval
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        self._fw = None
+        self._t0 = time.time()
+        self._last = (self._t0, 0, 0)
+
+    @property
+    def enabled(self) -> bool:
+        return self._output is not None
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def reject(self, reason: str, num: int = 1):
+        self.rejected[reason] += num
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        stack = self._stack()
+        prev_stage, self.current_stage = self.current_stage, name
+        stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            self.stages[name] += dt - stack.pop()
+            if stack:
+                stack[-1] += dt
+            self.current_stage = prev_stage
+
+    def timed(self, name: str, items: Iterable[T], count_rows: bool = False) -> Iterator[T]:
+        """
+        Measure time spent producing items (i.e. in next()) as the stage 'name'.
+        If count_rows is True, the items are counted as processed rows.
+        """
+        if not self.enabled:
+            return iter(items)
+        return self._timed(name, items, count_rows)
+
+    def _timed(self, name: str, items: Iterable[T], count_rows: bool) -> Iterator[T]:
+        it = iter(items)
+        stack = self._stack()
+        while True:
+            stack.append(0.0)
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                dt = time.perf_counter() - t0
+                self.stages[name] += dt - stack.pop()
+                if stack:
+                    stack[-1] += dt
+            if count_rows:
+                self.rows += 1
+            yield item
+
+    def snapshot(self, final: bool = False) -> Dict:
+        now = time.time()
+        t_prev, rows_prev, groups_prev = self._last
+        rows, groups = self.rows, self.groups
+        dt = max(now - t_prev, 1e-6)
+        self._last = (now, rows, groups)
+        return dict(
+            time=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)), elapsed=round(now - self._t0, 3),
+            rows=rows, groups=groups, rows_per_s=round((rows - rows_prev) / dt, 1),
+            groups_per_s=round((groups - groups_prev) / dt, 1), stage=self.current_stage,
+            stages={k: round(v, 3) for k, v in list(self.stages.items())}, rejected=dict(self.rejected),
+            rss_bytes=rss_bytes(), sqlite_temp_bytes=sqlite_temp_bytes(), final=final)
+
+    def _emit(self, final: bool = False):
+        self._fw.write(json.dumps(self.snapshot(final)) + '\n')
+        self._fw.flush()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._emit()
+
+    def __enter__(self):
+        if self.enabled:
+            self._fw = sys.stderr if self._output == '-' else open(self._output, 'a')
+            self._thread = threading.Thread(target=self._run, name=METRICS_THREAD, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._emit(final=True)
+            if self._fw is not sys.stderr:
+                self._fw.close()
+
+
+class SamplingProfiler:
+    """
+    Sample stacks of all the threads every interval milliseconds and write
+    the collapsed stacks (rooted at thread names, with their sample counts)
+    to output.
+    """
+
+    def __init__(self, output: str, interval: float = DEFAULT_PROFILE_INTERVAL):
+        self._output = output
+        self._interval = interval / 1000
+        self._stacks: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or names.get(ident) == METRICS_THREAD:
+                continue
+            items = []
+            while frame is not None:
+                code = frame.f_code
+                items.append('{0} ({1}:{2})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            items.append(names.get(ident, str(ident)))
+            self._stacks[';'.join(reversed(items))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        with open(self._output, 'w') as fw:
+            for stack, num in sorted(self._stacks.items(), key=lambda x: -x[1]):
+                fw.write('{0} {1}\n'.format(stack, num))
+        print('Profile: {0} samples written to {1}'.format(sum(self._stacks.values()), self._output))
+
+
+def profiled(output: Optional[str], interval: float = DEFAULT_PROFILE_INTERVAL):
+    return SamplingProfiler(output, interval) if output else contextlib.nullcontext()
+
+
+def add_arguments(argparser: argparse.ArgumentParser):
+    argparser.add_argument('--metrics', type=str, metavar='FILE',
+                           help='Append JSON lines progress metrics to FILE (use - for stderr)')
+    argparser.add_argument('--metrics-interval', type=float, default=DEFAULT_INTERVAL,
+                           help='Seconds between metrics snapshots (default is {0})'.format(DEFAULT_INTERVAL))
+    argparser.add_argument('--profile', type=str, metavar='FILE',
+                           help='Sample the processing and write collapsed stacks (flamegraph format) to FILE')
+    argparser.add_argument('--profile-interval', type=float, default=DEFAULT_PROFILE_INTERVAL,
+                           help='Milliseconds between profiler samples (default is {0})'.format(DEFAULT_PROFILE_INTERVAL))
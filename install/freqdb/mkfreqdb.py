@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 # upd dist
 
-import sys
 import sqlite3
 import time
+import argparse
+from functools import partial
+from pathlib import Path
 import re
 
-from .common import upcase_regex, pos2pos, penn2pos, is_stop_ngram
+from common import CHARSETS, DEFAULT_CHARSET, is_pname, is_stop_ngram
+from batchwriter import BatchWriter, TableSpec
+from shards import build_sharded
+from delta import apply_delta, record_full_build, write_changes
+from couchsync import add_stable_ids
+from metrics import Metrics, add_arguments as add_metrics_arguments, profiled
+from tagsets import DEFAULT_TAGSET, TAGSETS, get_tagset
+from partition import DEFAULT_PARTITION_ROWS, estimate_num_partitions, iter_partitioned, nulls_first
+import neighbours
+import suggestions
 
 
 def rm_morphodita_stuff(s):
@@ -17,74 +28,199 @@ def create_tables(db):
     cur = db.cursor()
     cur.execute('DROP TABLE IF EXISTS word')
     cur.execute('DROP TABLE IF EXISTS lemma')
+    neighbours.create_table(db, recreate=True)
+    suggestions.create_table(db, recreate=True)
     cur.execute('CREATE TABLE lemma (value TEXT, pos TEXT, count INTEGER, arf INTEGER, is_pname INTEGER, PRIMARY KEY(value, pos))')
     cur.execute('CREATE TABLE word (value TEXT, lemma TEXT, pos TEXT, count INTEGER, arf INTEGER, PRIMARY KEY (value, lemma, pos), FOREIGN KEY (lemma, pos) REFERENCES lemma(value, pos))')
 
 
+LEMMA_TABLE = TableSpec('lemma', ('value', 'pos', 'count', 'arf', 'is_pname'), ('value', 'pos'), ('count', 'arf'))
+
+WORD_TABLE = TableSpec('word', ('value', 'lemma', 'pos', 'count', 'arf'), ('value', 'lemma', 'pos'), ('count', 'arf'))
+
+# lemmas along with their rank by ARF (1 = the highest ARF)
+SELECT_RANKED_LEMMAS = 'SELECT *, RANK() OVER (ORDER BY arf DESC) AS arf_rank FROM lemma'
+
+_SELECT_FORMS = (
+    'SELECT w.value, w.lemma, w.pos, w.count, w.arf, m.count as lemma_count, m.arf as lemma_arf, m.is_pname as lemma_is_pname, '
+    'n.neighbours AS arf_neighbours{rank} '
+    'FROM word AS w JOIN {lemma} AS m ON m.value = w.lemma AND m.pos = w.pos '
+    'LEFT JOIN arf_neighbours AS n ON n.lemma = m.value AND n.pos = m.pos')
+
+# word forms along with their lemma data (as read by the loaders); ranking lemmas
+# requires a pass over the whole lemma table so the rank is NULL here and it is
+# selected only by SELECT_RANKED_FORMS
+SELECT_FORMS = _SELECT_FORMS.format(rank=', NULL AS lemma_arf_rank', lemma='lemma')
+
+SELECT_RANKED_FORMS = _SELECT_FORMS.format(
+    rank=', m.arf_rank AS lemma_arf_rank', lemma='({0})'.format(SELECT_RANKED_LEMMAS))
+
+# the columnar export derives the rank from lemma_arf (see columnar.py)
+SELECT_COLUMNAR_FORMS = _SELECT_FORMS.format(rank='', lemma='lemma')
+
+COLUMNAR_GROUP_RANKS = {'lemma_arf_rank': 'lemma_arf'}
+
+FORMS_STR_COLUMNS = ('value', 'lemma', 'pos', 'arf_neighbours')
+
+FORMS_FLOAT_COLUMNS = ('arf', 'lemma_arf')
+
+
 def get_lemma_total(rows):
     return sum(row[3] for row in rows)
 
 def get_lemma_arf(rows):
     return sum(row[4] for row in rows)
 
-def proc_line(cur, item, curr_lemma, words):
+def proc_line(writer: BatchWriter, item, curr_lemma, words, pos_imp):
     if curr_lemma is None or item[1] != curr_lemma[1] or (item[1] == curr_lemma[1] and item[2] != curr_lemma[2]):
         if len(words) > 0:
-            try:
-                cur.execute('INSERT INTO lemma (value, pos, count, arf, is_pname) VALUES (?, ?, ?, ?, ?)',
-                    [curr_lemma[1], pos_imp(curr_lemma[2]), get_lemma_total(words), get_lemma_arf(words), int(upcase_regex.match(curr_lemma[1]) is not None)])
-            except sqlite3.IntegrityError:
-                print('Problem with lemma+pos {0}'.format(curr_lemma))
-                print('UPDATE lemma SET count = count + %s, arf = arf + %s WHERE value = %s AND pos = %s' % (get_lemma_total(words), get_lemma_arf(words), curr_lemma[1], pos_imp(curr_lemma[2])))
-                cur.execute('UPDATE lemma SET count = count + ?, arf = arf + ? WHERE value = ? AND pos = ?', [get_lemma_total(words), get_lemma_arf(words), curr_lemma[1], pos_imp(curr_lemma[2])])
+            # all the words share lemma and tag of the group
+            pos = pos_imp(curr_lemma[2])
+            writer.add('lemma', (curr_lemma[1], pos, get_lemma_total(words), get_lemma_arf(words),
+                                 int(is_pname(curr_lemma[1]))))
             for w in words:
-                try:
-                    cur.execute('INSERT INTO word (value, lemma, pos, count, arf) VALUES (?, ?, ?, ?, ?)', [w[0], w[1], pos_imp(w[2]), w[3], w[4]])
-                except sqlite3.IntegrityError:
-                    print('Problem with word+lemma+pos {0}'.format(curr_lemma))
-                    print('UPDATE word SET count = count + %s, arf = arf + %s WHERE value = %s AND lemma = %s AND pos = %s' % (w[3], w[4], w[0], w[1], pos_imp(w[2])))
-                    cur.execute('UPDATE word SET count = count + ?, arf = arf + ? WHERE value = ? AND lemma = ? AND pos = ?', (w[3], w[4], w[0], w[1], pos_imp(w[2])))
+                writer.add('word', (w[0], w[1], pos, w[3], w[4]))
         curr_lemma = item
         words = []
     words.append(item)
     return words, curr_lemma
 
-def run(db, pos_imp):
-    create_tables(db)
-    cur1 = db.cursor()
-    cur2 = db.cursor()
-    cur1.execute("SELECT col0, col1, col2, `count` AS abs, arf FROM colcounts ORDER BY col1, col2, col0")
+SELECT_COLCOUNTS = "SELECT col0, col1, col2, `count` AS abs, arf FROM colcounts"
+
+
+def read_sorted(db, where=None, params=()):
+    cur = db.cursor()
+    cur.execute(SELECT_COLCOUNTS + (' WHERE ' + where if where else '') + ' ORDER BY col1, col2, col0', params)
+    return cur
+
+def read_partitioned(db, partition_rows, tmp_dir=None, where=None, params=(), num_shards=1):
+    """
+    Read colcounts unsorted and group them via on-disk hash partitions
+    (see partition.py). Groups are produced in a different order than
+    read_sorted() but each group is complete and sorted the same way.
+    """
+    cur = db.cursor()
+    cur.execute(SELECT_COLCOUNTS + (' WHERE ' + where if where else ''), params)
+    return iter_partitioned(
+        cur, estimate_num_partitions(db, 'colcounts', partition_rows * num_shards),
+        key_fn=lambda row: (row[1], row[2]), sort_key=lambda row: nulls_first(row, (1, 2, 0)), tmp_dir=tmp_dir)
+
+def run(db, pos_imp, read_rows=read_sorted, recreate=True, metrics=None):
+    metrics = metrics or Metrics()
+    with metrics.stage('process'):
+        _run(db, pos_imp, read_rows, recreate, metrics)
+
+def _run(db, pos_imp, read_rows, recreate, metrics):
+    if recreate:
+        create_tables(db)
+    rows = metrics.timed('read', read_rows(db), count_rows=True)
+    writer = BatchWriter(db, [LEMMA_TABLE, WORD_TABLE], metrics=metrics)
     curr_lemma = None
     words = []
     num_stop = 0
-    for item in cur1:
+    for item in rows:
         tmp = list(item)
         tmp[1] = rm_morphodita_stuff(item[1])
         item = tuple(item)
         if is_stop_ngram(item[1]):
             num_stop += 1
+            metrics.reject('stop_ngram')
             continue
-        words, curr_lemma = proc_line(cur2, item, curr_lemma, words)
-    proc_line(cur2, (None, None, None, None, None), curr_lemma, words)
+        words, curr_lemma = proc_line(writer, item, curr_lemma, words, pos_imp)
+        if curr_lemma is item:
+            metrics.groups += 1
+    proc_line(writer, (None, None, None, None, None), curr_lemma, words, pos_imp)
+    writer.flush()
     print('num stop words: {}'.format(num_stop))
+    writer.print_summary()
+
+def build_shard(shard_path, where, params, src_path, pos_imp, partition_rows=None, tmp_dir=None, num_shards=1):
+    """
+    Process a single lemma range of the source database into a separate
+    shard database (see shards.py).
+    """
+    src = sqlite3.connect(Path(src_path).absolute().as_uri() + '?mode=ro', uri=True)
+    with sqlite3.connect(shard_path) as db:
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('BEGIN TRANSACTION')
+        if partition_rows:
+            run(db, pos_imp, lambda _: read_partitioned(src, partition_rows, tmp_dir, where, params, num_shards))
+        else:
+            run(db, pos_imp, lambda _: read_sorted(src, where, params))
+        db.commit()
+    db.close()
+    src.close()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 1:
-        print('Missing database path')
-        sys.exit(1)
-    if len(sys.argv) > 2:
-        if sys.argv[2] == 'penn':
-            pos_imp = penn2pos
-        else:
-            print('Unknown PoS tag type {0}'.format(sys.argv[2]))
-            sys.exit(1)
-    else:
-        pos_imp = pos2pos
-    with sqlite3.connect(sys.argv[1]) as db:
+    argparser = argparse.ArgumentParser('mkfreqdb', description='Create lemma and word frequency tables from a colcounts table')
+    argparser.add_argument('db_path', metavar='DB_PATH', help='sqlite3 database with the colcounts table')
+    argparser.add_argument('pos_type', metavar='POS_TYPE', nargs='?', default=DEFAULT_TAGSET, choices=list(TAGSETS),
+                           help='PoS tag type ({0}); default: {1} (first character of a positional tag)'.format(
+                               ', '.join(TAGSETS), DEFAULT_TAGSET))
+    argparser.add_argument('-x', '--external-sort', action='store_const', const=True,
+                           help='Do not let SQLite sort colcounts, use on-disk hash partitions instead')
+    argparser.add_argument('--partition-rows', type=int, default=DEFAULT_PARTITION_ROWS,
+                           help='Approximate number of rows per partition in the external sort mode (default is {0})'.format(DEFAULT_PARTITION_ROWS))
+    argparser.add_argument('--tmp-dir', type=str, help='Directory for partition and shard files (default is the system temp dir)')
+    argparser.add_argument('-w', '--workers', type=int, default=1,
+                           help='Number of processes, each processing its own lemma range (default is 1)')
+    argparser.add_argument('-d', '--delta', type=str,
+                           help='A database with a colcounts delta; only lemmas found there are recomputed')
+    argparser.add_argument('--changed-out', type=str, help='In the delta mode, write changed (lemma, pos) groups to a TSV file')
+    argparser.add_argument('-n', '--arf-neighbours', type=int, metavar='K',
+                           help='Precompute K nearest lemmas by ARF for each lemma (requires numpy)')
+    argparser.add_argument('--charset', choices=list(CHARSETS), default=DEFAULT_CHARSET,
+                           help='Lemma filter of the converters (ARF neighbours are computed only from accepted lemmas, default is {0})'.format(DEFAULT_CHARSET))
+    argparser.add_argument('--suggestions', type=int, metavar='N',
+                           help='Build autocomplete prefix index with top N word forms/lemmas per prefix')
+    argparser.add_argument('--columnar', type=str, metavar='DIR',
+                           help='Also write the sorted word forms to a memory-mappable columnar export (requires numpy)')
+    add_metrics_arguments(argparser)
+    args = argparser.parse_args()
+    pos_imp = get_tagset(args.pos_type)
+    with sqlite3.connect(args.db_path) as db, Metrics(args.metrics, args.metrics_interval) as metrics:
         t0 = time.time()
-        db.execute('PRAGMA journal_mode = OFF')
+        # the delta mode modifies colcounts in place so it must be able to roll back
+        db.execute('PRAGMA journal_mode = {0}'.format('DELETE' if args.delta else 'OFF'))
         db.execute('BEGIN TRANSACTION')
-        run(db, pos_imp)
-        db.commit()
+        neighbours.create_table(db)
+        with metrics.stage('build'), profiled(args.profile, args.profile_interval):
+            if args.delta:
+                changes = apply_delta(
+                    db, args.delta, 'col1', [LEMMA_TABLE, WORD_TABLE],
+                    lambda where, params: run(db, pos_imp, lambda db: read_sorted(db, where, params), recreate=False, metrics=metrics))
+                if args.changed_out:
+                    write_changes(args.changed_out, changes)
+                print('changed groups: {0}'.format(len(changes)))
+            elif args.workers > 1:
+                build_sharded(
+                    db, args.workers, 'col1',
+                    partial(build_shard, src_path=args.db_path, pos_imp=pos_imp,
+                            partition_rows=args.partition_rows if args.external_sort else None,
+                            tmp_dir=args.tmp_dir, num_shards=args.workers),
+                    create_tables,
+                    [LEMMA_TABLE, WORD_TABLE], args.tmp_dir)
+            elif args.external_sort:
+                run(db, pos_imp, lambda db: read_partitioned(db, args.partition_rows, args.tmp_dir), metrics=metrics)
+            else:
+                run(db, pos_imp, metrics=metrics)
+        if not args.delta:
+            record_full_build(db)
+        with metrics.stage('stable_ids'):
+            add_stable_ids(db)
+        if args.arf_neighbours:
+            with metrics.stage('arf_neighbours'):
+                neighbours.compute_arf_neighbours(db, args.arf_neighbours, CHARSETS[args.charset])
+        if args.suggestions:
+            with metrics.stage('suggestions'):
+                suggestions.build_suggestions(db, args.suggestions)
+        with metrics.stage('commit'):
+            db.commit()
+        if args.columnar:
+            from columnar import export_columnar  # requires numpy
+            with metrics.stage('columnar'):
+                export_columnar(db, args.columnar, SELECT_COLUMNAR_FORMS + ' ORDER BY w.lemma, w.pos, w.value',
+                                str_columns=FORMS_STR_COLUMNS, float_columns=FORMS_FLOAT_COLUMNS,
+                                group_ranks=COLUMNAR_GROUP_RANKS)
         print('Done in {0}'.format(time.time() - t0))
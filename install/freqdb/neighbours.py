@@ -0,0 +1,97 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Precomputed lists of lemmas with a similar ARF.
+
+For each (lemma, pos), the K nearest lemmas by ARF within the same n-gram
+order are found using a single sort and searchsorted() over the lemma table.
+Only lemmas accepted by the converters' charset filter (see common.CHARSETS)
+are considered, as the other ones never get to CouchDB. The windows are the
+same as the ones queried by the CouchDB backend's getSimilarFreqWords on its
+n-gram order specific views (an exact ARF match, ARF above arf + arf / 1e5 and
+ARF below arf - arf / 1e6), so the backend can answer the tile from the lemma's
+own document. Lists are stored as JSON in the 'arf_neighbours' table:
+
+    {"k": K, "same": [...], "above": [...], "below": [...]}
+
+where each item is {"lemma", "pos", "count", "arf", "is_pname"}, "above" is
+ordered by ascending ARF and "below" by descending ARF.
+"""
+
+import json
+from typing import Optional
+
+from common import Charset
+
+NEIGHBOURS_TABLE = 'arf_neighbours'
+
+DEFAULT_NUM_NEIGHBOURS = 10
+
+
+def create_table(db, recreate: bool = False):
+    if recreate:
+        db.execute('DROP TABLE IF EXISTS {0}'.format(NEIGHBOURS_TABLE))
+    db.execute('CREATE TABLE IF NOT EXISTS {0} (lemma TEXT, pos TEXT, neighbours TEXT, PRIMARY KEY (lemma, pos))'.format(
+        NEIGHBOURS_TABLE))
+
+
+def ngram_order(lemma: str) -> int:
+    # the same as lemma.split(' ').length in the CouchDB backend
+    return len(lemma.split(' ')) if lemma else 0
+
+
+def _item(row):
+    return dict(lemma=row[0], pos=row[1], count=row[2], arf=row[3], is_pname=bool(row[4]))
+
+
+def compute_arf_neighbours(db, k: int = DEFAULT_NUM_NEIGHBOURS, charset: Optional[Charset] = None):
+    """
+    Recompute the arf_neighbours table from the lemma table
+    (optionally using only lemmas accepted by charset).
+    """
+    import numpy as np  # required only here
+
+    create_table(db, recreate=True)
+    cur = db.cursor()
+    cur.execute('SELECT value, pos, count, arf, is_pname FROM lemma')
+    by_order = {}
+    for row in cur:
+        if charset is not None and not charset.accepts(row[0]):
+            continue
+        by_order.setdefault(ngram_order(row[0]), []).append(row)
+    total = 0
+    for order, lemmas in sorted(by_order.items()):
+        arfs = np.array([row[3] or 0 for row in lemmas], dtype=np.float64)
+        srt = np.argsort(arfs, kind='stable')
+        arfs = arfs[srt]
+        same_lo = np.searchsorted(arfs, arfs, side='left')
+        same_hi = np.searchsorted(arfs, arfs, side='right')
+        above_lo = np.searchsorted(arfs, arfs + arfs / 1e5, side='left')
+        below_hi = np.searchsorted(arfs, arfs - arfs / 1e6, side='right')
+        ans = []
+        for i in range(len(srt)):
+            same = [_item(lemmas[srt[j]]) for j in range(same_lo[i], min(same_hi[i], same_lo[i] + k + 1)) if j != i][:k]
+            above = [_item(lemmas[srt[j]]) for j in range(above_lo[i], min(above_lo[i] + k, len(srt)))]
+            below = [_item(lemmas[srt[j]]) for j in range(below_hi[i] - 1, max(below_hi[i] - k, 0) - 1, -1)]
+            row = lemmas[srt[i]]
+            ans.append((row[0], row[1], json.dumps(dict(k=k, same=same, above=above, below=below), ensure_ascii=False)))
+            if len(ans) >= 10000:
+                cur.executemany('INSERT INTO {0} (lemma, pos, neighbours) VALUES (?, ?, ?)'.format(NEIGHBOURS_TABLE), ans)
+                ans = []
+        cur.executemany('INSERT INTO {0} (lemma, pos, neighbours) VALUES (?, ?, ?)'.format(NEIGHBOURS_TABLE), ans)
+        total += len(lemmas)
+        print('ARF neighbours: {0} lemmas of n-gram order {1}'.format(len(lemmas), order))
+    return total
@@ -0,0 +1,111 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+External (hash partitioned) replacement for a large ORDER BY.
+
+Instead of letting SQLite build a temporary B-tree over the whole
+colcounts table, the rows are streamed unsorted and spilled into
+on-disk partition files by a stable hash of their group key. Each
+partition is then loaded and sorted in memory on its own, which keeps
+peak RAM bounded by the partition size. Rows of one group always end
+up in the same partition, so the output is grouped the same way a
+sorted query would be grouped (only the order of groups differs).
+"""
+
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_PARTITION_ROWS = 5000000
+
+WRITE_BUFFER_ROWS = 2000
+
+
+def partition_of(key: Tuple, num_partitions: int) -> int:
+    """
+    Return a partition index for a group key. Unlike hash(), the value
+    is stable across processes and runs.
+    """
+    return zlib.crc32('\t'.join('' if k is None else k for k in key).encode('utf-8')) % num_partitions
+
+
+def nulls_first(row: Tuple, columns: Tuple[int, ...]) -> Tuple:
+    """
+    Create a sort key ordering the specified columns the same way
+    SQLite does (NULL first, then text by code points).
+    """
+    return tuple((row[i] is not None, row[i]) for i in columns)
+
+
+def estimate_num_partitions(db, table: str, partition_rows: int) -> int:
+    """
+    Estimate required number of partitions using MAX(rowid) which
+    (unlike COUNT(*)) does not require a full table scan.
+    """
+    cur = db.cursor()
+    cur.execute('SELECT MAX(rowid) FROM {0}'.format(table))
+    num_rows = cur.fetchone()[0] or 0
+    return max(1, math.ceil(num_rows / partition_rows))
+
+
+def iter_partitioned(
+        rows: Iterable[Tuple],
+        num_partitions: int,
+        key_fn: Callable[[Tuple], Tuple],
+        sort_key: Callable[[Tuple], Any],
+        tmp_dir: Optional[str] = None) -> Iterator[Tuple]:
+    """
+    Spill rows into num_partitions temporary files and then yield
+    them back partition by partition, each partition sorted by sort_key.
+    Partition files are removed as soon as they are consumed.
+    """
+    work_dir = tempfile.mkdtemp(prefix='freqdb-spill-', dir=tmp_dir)
+    try:
+        paths = [os.path.join(work_dir, 'part{0:05d}.pkl'.format(i)) for i in range(num_partitions)]
+        files = [open(p, 'wb') for p in paths]
+        buffers: List[List[Tuple]] = [[] for _ in range(num_partitions)]
+        try:
+            for row in rows:
+                idx = partition_of(key_fn(row), num_partitions)
+                buffers[idx].append(row)
+                if len(buffers[idx]) >= WRITE_BUFFER_ROWS:
+                    pickle.dump(buffers[idx], files[idx], pickle.HIGHEST_PROTOCOL)
+                    buffers[idx] = []
+            for idx, buff in enumerate(buffers):
+                if len(buff) > 0:
+                    pickle.dump(buff, files[idx], pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in files:
+                f.close()
+        del buffers
+
+        for path in paths:
+            part: List[Tuple] = []
+            with open(path, 'rb') as fr:
+                while True:
+                    try:
+                        part.extend(pickle.load(fr))
+                    except EOFError:
+                        break
+            os.unlink(path)
+            part.sort(key=sort_key)
+            yield from part
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
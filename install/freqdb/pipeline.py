@@ -0,0 +1,376 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A streaming export pipeline for freqdb documents.
+
+The pipeline is composed of generator stages:
+
+    source -> filter -> grouper -> document builder -> batcher -> sink
+
+Rows are read as plain tuples (via fetchmany) and the only thing kept
+in memory is the current lemma group and the batches waiting for a sink.
+The freqdb2couchdb*.py scripts are just configurations of the pipeline
+(an SQL query and a document builder).
+"""
+
+import argparse
+import os
+import sqlite3
+from itertools import groupby
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bluegreen import BlueGreen, DEFAULT_ALIAS_DB, check_server_conf, update_server_conf, versioned_name
+from couchloader import CouchBulkLoader, Checkpoint, DEFAULT_NUM_WRITERS
+from couchsync import SyncStats, iter_changes, iter_remote, mk_stable_id
+from docencoding import EncodedBatch, EncodingStats, byte_batches, DEFAULT_MAX_BATCH_BYTES
+from common import CHARSETS, DEFAULT_CHARSET, Charset
+from compactdocs import compact_doc
+from metrics import Metrics, add_arguments as add_metrics_arguments, profiled
+
+FETCH_SIZE = 10000
+
+REPORT_EVERY = 100000
+
+KEY_ALPHABET = ['%d' % i for i in range(10)] + [chr(x) for x in range(ord('a'), ord('z') + 1)] + [chr(x) for x in range(ord('A'), ord('Z') + 1)]
+
+Row = Tuple[Any, ...]
+
+Doc = Dict[str, Any]
+
+
+def mk_id(x):
+    ans = [0, 0, 0, 0, 0, 0]
+    idx = len(ans) - 1
+    while x > 0:
+        p = x % len(KEY_ALPHABET)
+        ans[idx] = KEY_ALPHABET[p]
+        x = int(x / len(KEY_ALPHABET))
+        idx -= 1
+    ans = ''.join([str(x) for x in ans])
+    return ans
+
+
+def parse_id(s):
+    """
+    An inverse function to mk_id
+    """
+    ans = 0
+    for c in s:
+        ans = ans * len(KEY_ALPHABET) + KEY_ALPHABET.index(c)
+    return ans
+
+
+# ---------------------------- stages ----------------------------------
+
+def source(db, sql: str, params: Tuple = (), fetch_size: int = FETCH_SIZE) -> Iterator[Row]:
+    cursor = db.cursor()
+    cursor.execute(sql, params)
+    i = 0
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if len(rows) == 0:
+            break
+        yield from rows
+        prev, i = i, i + len(rows)
+        if i // REPORT_EVERY > prev // REPORT_EVERY:
+            print('Processed {} records'.format(i))
+
+
+def filter_rows(
+        rows: Iterable[Row],
+        column: int,
+        charset: Charset = CHARSETS[DEFAULT_CHARSET],
+        metrics: Optional[Metrics] = None) -> Iterator[Row]:
+    accepts = charset.accepts
+    for row in rows:
+        if accepts(row[column]):
+            yield row
+        elif metrics:
+            metrics.reject('charset')
+
+
+def group_rows(rows: Iterable[Row], key_columns: Tuple[int, ...]) -> Iterator[List[Row]]:
+    """
+    Group consecutive rows with the same key.
+    """
+    for _, group in groupby(rows, key=lambda row: tuple(row[i] for i in key_columns)):
+        yield list(group)
+
+
+def sequence_ids(id_base: int = 0) -> Callable[[List[Row]], str]:
+    counter = [id_base]
+
+    def mk(rows: List[Row]) -> str:
+        ans = mk_id(counter[0])
+        counter[0] += 1
+        return ans
+    return mk
+
+
+def stable_ids(lemma_col: int, pos_col: int) -> Callable[[List[Row]], str]:
+    return lambda rows: mk_stable_id(rows[0][lemma_col], rows[0][pos_col])
+
+
+def build_docs(
+        groups: Iterable[List[Row]],
+        build_doc: Callable[[List[Row], str], Doc],
+        mk_doc_id: Callable[[List[Row]], str],
+        metrics: Optional[Metrics] = None) -> Iterator[Doc]:
+    for rows in groups:
+        if metrics:
+            metrics.groups += 1
+        yield build_doc(rows, mk_doc_id(rows))
+
+
+def compact_docs(docs: Iterable[Doc], top_k: int) -> Iterator[List[Doc]]:
+    """
+    Convert documents to the compact schema (see compactdocs.py). Each document
+    is replaced by a list containing the document and possibly its overflow document.
+    """
+    for doc in docs:
+        yield compact_doc(doc, top_k)
+
+
+def flatten_docs(items: Iterable[List[Doc]]) -> Iterator[Doc]:
+    for docs in items:
+        yield from docs
+
+
+# ---------------------------- sinks ----------------------------------
+# (CouchBulkLoader from couchloader.py is the CouchDB sink)
+
+class DummySink:
+    """
+    For testing
+    """
+
+    def load(self, batches: Iterable[EncodedBatch], on_commit=None):
+        for batch in batches:
+            for data in batch.parts:
+                print(data.decode('utf-8'))
+            if on_commit:
+                on_commit(batch.last)
+
+
+class JsonlSink:
+    """
+    Write documents as JSON lines (one document per line)
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def load(self, batches: Iterable[EncodedBatch], on_commit=None):
+        with open(self._path, 'wb') as fw:
+            for batch in batches:
+                for data in batch.parts:
+                    fw.write(data)
+                    fw.write(b'\n')
+                if on_commit:
+                    on_commit(batch.last)
+
+
+# ---------------------------- export ----------------------------------
+
+def export(
+        select: Callable[[Optional[Tuple[str, str]], bool], Iterator[Row]],
+        build_doc: Callable[[List[Row], str], Doc],
+        lemma_col: int,
+        pos_col: int,
+        sink,
+        batch_size: int,
+        checkpoint: Optional[Checkpoint] = None,
+        resume: bool = False,
+        remote: Optional[Iterable[Tuple[str, str, str]]] = None,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        metrics: Optional[Metrics] = None,
+        charset: Charset = CHARSETS[DEFAULT_CHARSET],
+        compact_forms: Optional[int] = None):
+    """
+    Run the whole pipeline.
+
+    Args:
+        select: a function (after, by_id) returning source rows ordered by (lemma, pos) key
+                (or by stable id if by_id is True) and starting after the 'after' key
+        build_doc: a function creating a document out of rows of a single (lemma, pos) group
+        checkpoint: if set, a position after each committed batch is stored there
+        resume: if True, continue right after the position stored in the checkpoint
+        remote: if set, only a diff against this (id, rev, hash) listing
+                of existing documents is written (see couchsync.py)
+        max_batch_bytes: a batch is cut once its encoded size would exceed this
+                         (batch_size still limits the number of documents)
+        metrics: if set, rows, documents (as groups) and rejected rows are counted and the 'read',
+                 'build', 'encode' and 'load' stages are measured (see metrics.py)
+        charset: only lemmas accepted by this filter are exported
+        compact_forms: if set, documents are written in the compact schema with at most
+                       this number of forms inline (see compactdocs.py)
+    """
+    metrics = metrics or Metrics()
+    enc_stats = EncodingStats()
+
+    def load(docs, on_commit=None):
+        batches = byte_batches(metrics.timed('build', docs), max_batch_bytes, batch_size, enc_stats)
+        with metrics.stage('load'):
+            sink.load(metrics.timed('encode', batches), on_commit)
+
+    if remote is not None:
+        stats = SyncStats()
+        rows = filter_rows(metrics.timed('read', select(None, True), count_rows=True), lemma_col, charset, metrics)
+        docs = build_docs(group_rows(rows, (lemma_col, pos_col)), build_doc, stable_ids(lemma_col, pos_col), metrics)
+        if compact_forms:
+            # overflow ids sort right after their main documents so the order by id is kept
+            docs = flatten_docs(compact_docs(docs, compact_forms))
+        load(iter_changes(docs, remote, stats))
+        stats.report()
+        enc_stats.report()
+        return
+
+    after, id_base = None, 0
+    if resume and checkpoint:
+        state = checkpoint.load()
+        if state is None:
+            print('No checkpoint found, starting from the beginning')
+        else:
+            after, id_base = (state['lemma'], state['pos']), state['id_base']
+            print('Resuming after lemma {0} ({1})'.format(*after))
+
+    def on_commit(doc):
+        doc_id = doc.get('overflow_of', doc['_id'])
+        checkpoint.save(dict(lemma=doc['lemma'], pos=doc['pos'], id_base=parse_id(doc_id) + 1))
+
+    rows = filter_rows(metrics.timed('read', select(after, False), count_rows=True), lemma_col, charset, metrics)
+    docs = build_docs(group_rows(rows, (lemma_col, pos_col)), build_doc, sequence_ids(id_base), metrics)
+    if compact_forms:
+        docs = compact_docs(docs, compact_forms)  # lists are never split between batches
+    load(docs, on_commit if checkpoint else None)
+    if checkpoint:
+        checkpoint.clear()
+    enc_stats.report()
+
+
+def mk_arg_parser(prog: str, source_script: str, db_name: str, batch_size: int) -> argparse.ArgumentParser:
+    argparser = argparse.ArgumentParser(prog, description='Convert sqlite3-based word frequency database to CouchDB')
+    argparser.add_argument('sqlite_db', metavar='SQLITE_DB',
+                           help='a database created by {0} (or a directory with its --columnar export)'.format(source_script))
+    argparser.add_argument('couchdb_url', metavar='COUCHDB_URL', help='CouchDB server URL (including credentials if needed)')
+    argparser.add_argument('--db-name', type=str, default=db_name, help='CouchDB database name (default is {0})'.format(db_name))
+    argparser.add_argument('-w', '--writers', type=int, default=DEFAULT_NUM_WRITERS,
+                           help='Number of concurrent bulk writers (default is {0})'.format(DEFAULT_NUM_WRITERS))
+    argparser.add_argument('-b', '--batch-size', type=int, default=batch_size,
+                           help='Max. number of documents per bulk request (default is {0})'.format(batch_size))
+    argparser.add_argument('--max-batch-bytes', type=int, default=DEFAULT_MAX_BATCH_BYTES,
+                           help='Max. size of a bulk request body in bytes (default is {0})'.format(DEFAULT_MAX_BATCH_BYTES))
+    argparser.add_argument('--dry-run', action='store_const', const=True, help='Just print the documents')
+    argparser.add_argument('--jsonl', type=str, help='Write the documents to a JSON lines file instead of CouchDB')
+    argparser.add_argument('--checkpoint', type=str,
+                           help='A file to store import progress to (default is SQLITE_DB.DB_NAME.checkpoint)')
+    argparser.add_argument('--resume', action='store_const', const=True,
+                           help='Continue an interrupted import from the last checkpoint')
+    argparser.add_argument('-s', '--sync', action='store_const', const=True,
+                           help='Use stable document ids and write only new, changed and deleted documents (no checkpoints needed)')
+    argparser.add_argument('--blue-green', action='store_const', const=True,
+                           help='Load to a fresh versioned database DB_NAME_TIMESTAMP, install and pre-warm the views '
+                                'and only then switch --server-conf and the DB_NAME alias to it (see bluegreen.py)')
+    argparser.add_argument('--target-db', type=str,
+                           help='With --blue-green, load to this database instead of a new one (e.g. to --resume)')
+    argparser.add_argument('--alias-db', type=str, default=DEFAULT_ALIAS_DB,
+                           help='With --blue-green, a database with alias documents (default is {0})'.format(DEFAULT_ALIAS_DB))
+    argparser.add_argument('--design-doc', type=str,
+                           help='With --blue-green, a design document to install the views to (default is the one '
+                                'in freqDB.database.path of --server-conf; a different one is refused)')
+    argparser.add_argument('--warm-timeout', type=float,
+                           help='With --blue-green, max. seconds to wait for the views to be indexed (default is no limit)')
+    argparser.add_argument('--server-conf', type=str,
+                           help='With --blue-green (required), switch freqDB.database.path of this WaG server configuration')
+    argparser.add_argument('--corpus-size', type=int,
+                           help='Store precomputed ipm, frequency band and ARF rank in the documents (the value must match '
+                                'the corpusSize of the freqDB configuration)')
+    argparser.add_argument('--compact-forms', type=int, metavar='K',
+                           help='Use the compact document schema with at most K forms (by count) stored inline '
+                                'and the rest in an overflow document (requires updated views, see README)')
+    argparser.add_argument('--charset', choices=list(CHARSETS), default=DEFAULT_CHARSET,
+                           help='Export only lemmas consisting of letters of this language, digits and hyphens (default is {0})'.format(DEFAULT_CHARSET))
+    add_metrics_arguments(argparser)
+    return argparser
+
+
+def run_from_args(
+        args: argparse.Namespace,
+        select: Callable[[sqlite3.Connection, Optional[Tuple[str, str]], bool, bool], Iterator[Row]],
+        build_doc: Callable[[List[Row], str], Doc],
+        lemma_col: int,
+        pos_col: int,
+        columns: Optional[Tuple[str, ...]] = None):
+    """
+    Configure and run the pipeline according to the arguments
+    parsed by a parser created via mk_arg_parser().
+
+    Args:
+        select: a function (db, after, by_id, ranked) returning source rows (see export()),
+                with ranked=True, the global lemma ARF rank is filled in
+        columns: names of the select() row columns; if SQLITE_DB is a columnar export
+                 (see columnar.py), rows with these columns are read from there instead
+    """
+    # Ranking requires a pass over all the lemmas. Also, in the sync mode, a single changed
+    # lemma ARF would shift the rank of many other lemmas and all of them would be rewritten.
+    ranked = bool(args.corpus_size) and not args.sync
+    if args.corpus_size and args.sync:
+        print('Note: the global ARF rank (arf_rank of lemmas) is not stored in the sync mode')
+    if os.path.isdir(args.sqlite_db):
+        from columnar import ColumnarFreqDB, is_columnar  # requires numpy
+        if not is_columnar(args.sqlite_db):
+            raise ValueError('{0} is not a (complete) columnar export'.format(args.sqlite_db))
+        cdb = ColumnarFreqDB(args.sqlite_db, with_ranks=ranked)
+        select_rows = lambda after, by_id: cdb.iter_rows(columns, after, by_id)
+    else:
+        # the database is read from the loader's reader thread
+        db1 = sqlite3.connect(args.sqlite_db, check_same_thread=False)
+        select_rows = lambda after, by_id: select(db1, after, by_id, ranked)
+    db_name = args.db_name
+    blue_green = None
+    if args.blue_green:
+        if args.sync or args.dry_run or args.jsonl:
+            raise ValueError('--blue-green loads a fresh database, it cannot be used with --sync, --dry-run or --jsonl')
+        if not args.server_conf:
+            # the server reads the database from its configuration, not from the alias document
+            raise ValueError('--blue-green requires --server-conf')
+        design_doc = check_server_conf(args.server_conf, args.design_doc)
+        blue_green = BlueGreen(args.couchdb_url, args.db_name, args.alias_db, design_doc)
+        db_name = args.target_db or versioned_name(args.db_name)
+        blue_green.create_db(db_name, exist_ok=args.target_db is not None)
+    if args.dry_run:
+        sink = DummySink()
+    elif args.jsonl:
+        sink = JsonlSink(args.jsonl)
+    else:
+        sink = CouchBulkLoader(args.couchdb_url, db_name, num_writers=args.writers)
+    with Metrics(args.metrics, args.metrics_interval) as metrics, profiled(args.profile, args.profile_interval):
+        if args.sync:
+            export(select_rows, build_doc, lemma_col, pos_col, sink, args.batch_size,
+                   remote=iter_remote(args.couchdb_url, args.db_name), max_batch_bytes=args.max_batch_bytes,
+                   metrics=metrics, charset=CHARSETS[args.charset], compact_forms=args.compact_forms)
+        else:
+            checkpoint = None if args.dry_run or args.jsonl else Checkpoint(
+                args.checkpoint or '{0}.{1}.checkpoint'.format(args.sqlite_db.rstrip('/'), db_name))
+            export(select_rows, build_doc, lemma_col, pos_col, sink, args.batch_size,
+                   checkpoint, args.resume, max_batch_bytes=args.max_batch_bytes, metrics=metrics,
+                   charset=CHARSETS[args.charset], compact_forms=args.compact_forms)
+        if blue_green:
+            with metrics.stage('views'):
+                blue_green.install_views(db_name)
+                blue_green.warm_views(db_name, args.warm_timeout)
+            blue_green.switch(db_name)
+            update_server_conf(args.server_conf, db_name)
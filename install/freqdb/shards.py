@@ -0,0 +1,125 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Multi-process (sharded) freqdb build.
+
+The colcounts table is split into lemma key ranges. Each range is
+processed by a separate process into its own shard database and the
+shards are then copied (in range order) into the final tables. As all
+the primary keys of the output tables contain the lemma, a key never
+spans two shards and the shards can be simply concatenated. The result
+is identical to the single-process output including the row order.
+"""
+
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+from typing import Callable, List, Optional, Tuple
+
+from batchwriter import TableSpec
+
+DEFAULT_SAMPLE_SIZE = 20000
+
+
+def sample_bounds(db, table: str, column: str, num_shards: int, sample_size: int = DEFAULT_SAMPLE_SIZE) -> List[str]:
+    """
+    Find (at most) num_shards - 1 range boundaries for column values
+    splitting the table to approximately same sized shards. The values
+    are estimated from a random sample of rows fetched by rowid so there
+    is no need to sort or scan the table.
+    """
+    cur = db.cursor()
+    cur.execute('SELECT MAX(rowid) FROM {0}'.format(table))
+    max_rowid = cur.fetchone()[0] or 0
+    if num_shards < 2 or max_rowid == 0:
+        return []
+    rowids = random.Random(max_rowid).sample(range(1, max_rowid + 1), min(sample_size, max_rowid))
+    sample = []
+    for rowid in rowids:
+        cur.execute('SELECT {0} FROM {1} WHERE rowid = ?'.format(column, table), (rowid,))
+        row = cur.fetchone()
+        if row is not None and row[0] is not None:
+            sample.append(row[0])
+    sample.sort()
+    bounds = []
+    for i in range(1, num_shards):
+        if len(sample) == 0:
+            break
+        v = sample[min(len(sample) - 1, i * len(sample) // num_shards)]
+        if len(bounds) == 0 or v > bounds[-1]:
+            bounds.append(v)
+    return bounds
+
+
+def shard_condition(column: str, bounds: List[str], idx: int) -> Tuple[Optional[str], Tuple]:
+    """
+    Return an SQL condition (and its parameters) selecting the idx-th
+    shard defined by bounds. NULL values belong to the first shard
+    (SQLite sorts them first).
+    """
+    if len(bounds) == 0:
+        return None, ()
+    elif idx == 0:
+        return '({0} IS NULL OR {0} < ?)'.format(column), (bounds[0],)
+    elif idx == len(bounds):
+        return '{0} >= ?'.format(column), (bounds[-1],)
+    return '{0} >= ? AND {0} < ?'.format(column), (bounds[idx - 1], bounds[idx])
+
+
+def merge_shards(db, shard_paths: List[str], tables: List[TableSpec]):
+    """
+    Copy shard tables (in the order of shard_paths) to the same named
+    (and already created) tables in db.
+    """
+    cur = db.cursor()
+    for path in shard_paths:
+        with sqlite3.connect(path) as shard_db:
+            for t in tables:
+                cur.executemany(
+                    'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                        t.name, ', '.join(t.columns), ', '.join('?' for _ in t.columns)),
+                    shard_db.execute('SELECT {0} FROM {1} ORDER BY rowid'.format(', '.join(t.columns), t.name)))
+        shard_db.close()
+
+
+def build_sharded(
+        db,
+        num_workers: int,
+        column: str,
+        build_shard: Callable[[str, Optional[str], Tuple], None],
+        create_tables: Callable[[sqlite3.Connection], None],
+        tables: List[TableSpec],
+        tmp_dir: Optional[str] = None):
+    """
+    Run build_shard(shard_db_path, sql_condition, sql_params) for each
+    lemma range in a pool of num_workers processes and merge the results
+    into tables created by create_tables(db). The build_shard function
+    must be picklable (e.g. a functools.partial of a module level function).
+    """
+    bounds = sample_bounds(db, 'colcounts', column, num_workers)
+    work_dir = tempfile.mkdtemp(prefix='freqdb-shards-', dir=tmp_dir)
+    try:
+        paths = [os.path.join(work_dir, 'shard{0:03d}.db'.format(i)) for i in range(len(bounds) + 1)]
+        jobs = [(path,) + shard_condition(column, bounds, i) for i, path in enumerate(paths)]
+        with multiprocessing.Pool(num_workers) as pool:
+            pool.starmap(build_shard, jobs)
+        create_tables(db)
+        merge_shards(db, paths, tables)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
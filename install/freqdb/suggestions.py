@@ -0,0 +1,118 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A prefix index for query autocomplete.
+
+Distinct word forms and lemmas (case-folded) are read in the sorted order
+so that all the strings sharing a prefix are processed consecutively. For
+each prefix (up to max_prefix_len characters), the top N strings by ARF
+are kept in a bounded heap and the result is stored to the 'suggestion'
+table (prefix, JSON list of strings). A suggestion lookup then costs
+a single key read (see suggestions2couchdb.py).
+"""
+
+import heapq
+import json
+from typing import Iterable, Iterator, List, Tuple
+
+SUGGESTION_TABLE = 'suggestion'
+
+DEFAULT_TOP_N = 10
+
+DEFAULT_MAX_PREFIX_LEN = 10
+
+
+def fold(s: str) -> str:
+    # should match toLowerCase() used by the CouchDB backend
+    return s.lower()
+
+
+def create_table(db, recreate: bool = False):
+    if recreate:
+        db.execute('DROP TABLE IF EXISTS {0}'.format(SUGGESTION_TABLE))
+    db.execute('CREATE TABLE IF NOT EXISTS {0} (prefix TEXT PRIMARY KEY, items TEXT)'.format(SUGGESTION_TABLE))
+
+
+def iter_entries(db) -> Iterator[Tuple[str, str, float]]:
+    """
+    Produce (folded value, value, ARF) of distinct word forms and lemmas
+    ordered by the folded value. A string found both as a form and a lemma
+    gets the higher of both ARFs.
+    """
+    db.create_function('fold', 1, fold, deterministic=True)
+    cur = db.cursor()
+    cur.execute(
+        'SELECT fold(value) AS folded, value, MAX(arf) FROM ('
+        'SELECT value, SUM(arf) AS arf FROM word GROUP BY value '
+        'UNION ALL '
+        'SELECT value, SUM(arf) AS arf FROM lemma GROUP BY value) '
+        'WHERE value IS NOT NULL AND value != \'\' '
+        'GROUP BY value ORDER BY folded, value')
+    return cur
+
+
+def iter_prefixes(
+        entries: Iterable[Tuple[str, str, float]],
+        top_n: int = DEFAULT_TOP_N,
+        max_prefix_len: int = DEFAULT_MAX_PREFIX_LEN) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Produce (prefix, top N values) for entries ordered by their folded
+    value. Only a stack of heaps for the prefixes of the current entry
+    is kept in memory. Prefixes are produced in post-order (a longer
+    prefix before its own prefixes).
+    """
+    stack: List[Tuple[str, list]] = []
+
+    def finish(prefix, heap):
+        return prefix, [v for _, _, v in sorted(heap, key=lambda x: (-x[0], -x[1]))]
+
+    for i, (folded, value, arf) in enumerate(entries):
+        depth = 0
+        while depth < len(stack) and depth < len(folded) and stack[depth][0][-1] == folded[depth]:
+            depth += 1
+        while len(stack) > depth:
+            yield finish(*stack.pop())
+        for j in range(len(stack) + 1, min(len(folded), max_prefix_len) + 1):
+            stack.append((folded[:j], []))
+        # in case of equal ARFs, the alphabetically lower value wins
+        item = (arf or 0, -i, value)
+        for _, heap in stack:
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    while len(stack) > 0:
+        yield finish(*stack.pop())
+
+
+def build_suggestions(db, top_n: int = DEFAULT_TOP_N, max_prefix_len: int = DEFAULT_MAX_PREFIX_LEN) -> int:
+    """
+    Recompute the suggestion table from the word and lemma tables.
+    """
+    create_table(db, recreate=True)
+    cur = db.cursor()
+    buff = []
+    total = 0
+    for prefix, values in iter_prefixes(iter_entries(db), top_n, max_prefix_len):
+        buff.append((prefix, json.dumps(values, ensure_ascii=False)))
+        if len(buff) >= 10000:
+            cur.executemany('INSERT INTO {0} (prefix, items) VALUES (?, ?)'.format(SUGGESTION_TABLE), buff)
+            total += len(buff)
+            buff = []
+    cur.executemany('INSERT INTO {0} (prefix, items) VALUES (?, ?)'.format(SUGGESTION_TABLE), buff)
+    total += len(buff)
+    print('Suggestions: {0} prefixes'.format(total))
+    return total
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Store the autocomplete prefix index (see suggestions.py) to a dedicated
+CouchDB database. Each prefix is a document {"_id": prefix, "items": [...]},
+so the CouchDB backend (options.suggestionsUrl) resolves a suggestion with
+a single document read. Only new, changed and deleted prefixes are written
+(see couchsync.py).
+"""
+
+import argparse
+import json
+import sqlite3
+
+from couchloader import CouchBulkLoader, DEFAULT_NUM_WRITERS
+from couchsync import SyncStats, iter_changes, iter_remote
+from docencoding import EncodingStats, byte_batches, DEFAULT_MAX_BATCH_BYTES
+from pipeline import DummySink, JsonlSink, source
+from suggestions import SUGGESTION_TABLE
+
+DB_NAME = 'freqdb_suggestions'
+
+BATCH_SIZE = 50000
+
+
+def iter_docs(db):
+    # prefixes are ordered the same way as CouchDB's _all_docs ids (by code points)
+    for prefix, items in source(db, 'SELECT prefix, items FROM {0} ORDER BY prefix'.format(SUGGESTION_TABLE)):
+        if prefix.startswith('_'):  # reserved by CouchDB
+            continue
+        yield {'_id': prefix, 'items': json.loads(items)}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser('suggestions2couchdb', description='Store autocomplete prefix index to CouchDB')
+    argparser.add_argument('sqlite_db', metavar='SQLITE_DB', help='a database created by mkfreqdb.py with --suggestions')
+    argparser.add_argument('couchdb_url', metavar='COUCHDB_URL', help='CouchDB server URL (including credentials if needed)')
+    argparser.add_argument('--db-name', type=str, default=DB_NAME, help='CouchDB database name (default is {0})'.format(DB_NAME))
+    argparser.add_argument('-w', '--writers', type=int, default=DEFAULT_NUM_WRITERS,
+                           help='Number of concurrent bulk writers (default is {0})'.format(DEFAULT_NUM_WRITERS))
+    argparser.add_argument('-b', '--batch-size', type=int, default=BATCH_SIZE,
+                           help='Max. number of documents per bulk request (default is {0})'.format(BATCH_SIZE))
+    argparser.add_argument('--max-batch-bytes', type=int, default=DEFAULT_MAX_BATCH_BYTES,
+                           help='Max. size of a bulk request body in bytes (default is {0})'.format(DEFAULT_MAX_BATCH_BYTES))
+    argparser.add_argument('--dry-run', action='store_const', const=True, help='Just print the documents')
+    argparser.add_argument('--jsonl', type=str, help='Write the documents to a JSON lines file instead of CouchDB')
+    args = argparser.parse_args()
+
+    db1 = sqlite3.connect(args.sqlite_db, check_same_thread=False)
+    enc_stats = EncodingStats()
+    if args.dry_run or args.jsonl:
+        sink = DummySink() if args.dry_run else JsonlSink(args.jsonl)
+        sink.load(byte_batches(iter_docs(db1), args.max_batch_bytes, args.batch_size, enc_stats))
+    else:
+        stats = SyncStats()
+        sink = CouchBulkLoader(args.couchdb_url, args.db_name, num_writers=args.writers)
+        sink.load(byte_batches(
+            iter_changes(iter_docs(db1), iter_remote(args.couchdb_url, args.db_name), stats),
+            args.max_batch_bytes, args.batch_size, enc_stats))
+        stats.report()
+    enc_stats.report()
@@ -0,0 +1,168 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Mapping of source tagsets to the single letter PoS values stored
+in the freqdb (the CNC positional tag PoS letters).
+
+Each tagset is a table (from a tag key to the PoS letter) plus a function
+extracting the key from a tag (a tagset without a table uses the key
+itself). A TagsetMapping memoizes results per whole tag, so each distinct
+tag is resolved only once per process. Use map_column() to map a whole
+list of tags in one call.
+
+Supported tagsets (the builders' POS_TYPE argument):
+
+    cnc  - CNC positional tags (the first character), the default
+    penn - Penn Treebank tags
+    ud   - Universal Dependencies UPOS tags (features after '|' are ignored)
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+
+UNKNOWN_POS = 'X'
+
+PENN_POS = {
+    'CC': 'J',  # Coordinating conjunction
+    'CD': 'C',  # Cardinal number
+    'DT': 'X',  # Determiner
+    'EX': 'X',  # Existential there
+    'FW': 'X',  # Foreign word
+    'IN': 'R',  # Preposition or subordinating conjunction
+    'JJ': 'A',  # Adjective
+    'JJR': 'A',  # Adjective, comparative
+    'JJS': 'A',  # Adjective, superlative
+    'LS': 'X',  # List item marker
+    'MD': 'X',  # Modal
+    'NN': 'N',  # Noun, singular or mass
+    'NNS': 'N',  # Noun, plural
+    'NNP': 'X',  # Proper noun, singular
+    'NNPS': 'X',  # Proper noun, plural
+    'PDT': 'X',  # Predeterminer
+    'POS': 'X',  # Possessive ending
+    'PRP': 'P',  # Personal pronoun
+    'PRP$': 'P',  # Possessive pronoun
+    'RB': 'D',  # Adverb
+    'RBR': 'D',  # Adverb, comparative
+    'RBS': 'D',  # Adverb, superlative
+    'RP': 'T',  # Particle
+    'SYM': 'X',  # Symbol
+    'TO': 'X',  # to
+    'UH': 'I',  # Interjection
+    'VB': 'V',  # Verb, base form
+    'VBD': 'V',  # Verb, past tense
+    'VBG': 'V',  # Verb, gerund or present participle
+    'VBN': 'V',  # Verb, past participle
+    'VBP': 'V',  # Verb, non-3rd person singular present
+    'VBZ': 'V',  # Verb, 3rd person singular present
+    'WDT': 'V',  # Wh-determiner
+    'WP': 'P',  # Wh-pronoun
+    'WP$': 'P',  # Possessive wh-pronoun
+    'WRB': 'D',  # Wh-adverb
+}
+
+UD_POS = {
+    'ADJ': 'A',
+    'ADP': 'R',
+    'ADV': 'D',
+    'AUX': 'V',
+    'CCONJ': 'J',
+    'DET': 'P',  # determiners are pronouns in the CNC tagset
+    'INTJ': 'I',
+    'NOUN': 'N',
+    'NUM': 'C',
+    'PART': 'T',
+    'PRON': 'P',
+    'PROPN': 'N',
+    'PUNCT': 'Z',
+    'SCONJ': 'J',
+    'SYM': 'X',
+    'VERB': 'V',
+    'X': 'X',
+}
+
+
+def cnc_key(tag: str) -> str:
+    return tag[:1]
+
+
+def penn_key(tag: str) -> str:
+    return tag
+
+
+def ud_key(tag: str) -> str:
+    return tag.split('|', 1)[0].upper()
+
+
+class TagsetMapping:
+    """
+    A memoized tag -> PoS mapping. Instances are callable (so they can be
+    used as the builders' pos_imp) and picklable as long as key_fn is
+    a module level function.
+    """
+
+    def __init__(
+            self, name: str, table: Optional[Dict[str, str]], key_fn: Callable[[str], str], default: str = UNKNOWN_POS):
+        self.name = name
+        self._table = dict(table) if table is not None else None
+        self._key_fn = key_fn
+        self._default = default
+        self._cache: Dict[Optional[str], str] = {}
+
+    def _resolve(self, tag: Optional[str]) -> str:
+        if not tag:
+            ans = self._default
+        elif self._table is None:
+            ans = self._key_fn(tag)
+        else:
+            ans = self._table.get(self._key_fn(tag), self._default)
+        self._cache[tag] = ans
+        return ans
+
+    def __call__(self, tag: Optional[str]) -> str:
+        ans = self._cache.get(tag)
+        return ans if ans is not None else self._resolve(tag)
+
+    def map_column(self, tags: Iterable[Optional[str]]) -> List[str]:
+        """
+        Map a whole column of tags. Only tags not seen before are resolved.
+        """
+        if not isinstance(tags, (list, tuple)):
+            tags = list(tags)
+        cache = self._cache
+        for tag in set(tags).difference(cache):
+            self._resolve(tag)
+        return [cache[tag] for tag in tags]
+
+    def __getstate__(self):
+        return dict(self.__dict__, _cache={})
+
+
+CNC = TagsetMapping('cnc', None, cnc_key)
+
+PENN = TagsetMapping('penn', PENN_POS, penn_key)
+
+UD = TagsetMapping('ud', UD_POS, ud_key)
+
+TAGSETS = {m.name: m for m in (CNC, PENN, UD)}
+
+DEFAULT_TAGSET = CNC.name
+
+
+def get_tagset(name: str) -> TagsetMapping:
+    try:
+        return TAGSETS[name]
+    except KeyError:
+        raise ValueError('Unknown PoS tag type {0} (supported: {1})'.format(name, ', '.join(TAGSETS)))
@@ -0,0 +1,183 @@
+# Copyright 2026 Institute of the Czech National Corpus,
+#                Faculty of Arts, Charles University
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of the CouchDB bulk loader against a local stand-in HTTP server
+mimicking the _bulk_docs endpoint. Run from this directory:
+
+    python -m unittest test_couchloader
+"""
+
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from couchloader import BulkLoadError, CouchBulkLoader
+from docencoding import byte_batches
+
+
+class StandInCouch(ThreadingHTTPServer):
+    """
+    A stand-in CouchDB server. Each POST is answered by respond(num_request, docs)
+    returning (status, response data); by default, all the documents are accepted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.respond = lambda num_request, docs: (201, [{'ok': True, 'id': doc['_id']} for doc in docs])
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+    def accepted_ids(self):
+        return sorted(doc['_id'] for path, docs, status in self.requests if status < 300 for doc in docs)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            num_request = len(self.server.requests)
+            status, data = self.server.respond(num_request, body['docs'])
+            self.server.requests.append((self.path, body['docs'], status))
+        raw = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+def mk_docs(num):
+    return [{'_id': '{0:05d}'.format(i), 'lemma': 'lemma{0}'.format(i), 'count': i} for i in range(num)]
+
+
+class CouchBulkLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInCouch()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def mk_loader(self, **kw):
+        kw.setdefault('backoff', 0.01)
+        kw.setdefault('report_interval', 60)
+        return CouchBulkLoader(self.server.url, 'freqdb', **kw)
+
+    def test_batches_posted_to_bulk_docs(self):
+        docs = mk_docs(250)
+        stats = self.mk_loader(num_writers=3).load(byte_batches(iter(docs), max_docs=40))
+        self.assertEqual(set(path for path, _, _ in self.server.requests), {'/freqdb/_bulk_docs'})
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertEqual(self.server.accepted_ids(), [doc['_id'] for doc in docs])
+        self.assertEqual((stats.num_docs, stats.num_batches, stats.num_retries), (250, 7, 0))
+
+    def test_plain_list_batches(self):
+        docs = mk_docs(10)
+        stats = self.mk_loader(num_writers=1).load([docs[:5], docs[5:]])
+        self.assertEqual(self.server.accepted_ids(), [doc['_id'] for doc in docs])
+        self.assertEqual(stats.num_batches, 2)
+
+    def test_server_errors_retried_with_backoff(self):
+        failures = {0: 503, 1: 429, 2: 500}
+        times = []
+
+        def respond(num_request, docs):
+            times.append(time.time())
+            if num_request in failures:
+                return failures[num_request], {'error': 'unavailable'}
+            return 201, [{'ok': True, 'id': doc['_id']} for doc in docs]
+        self.server.respond = respond
+        docs = mk_docs(20)
+        stats = self.mk_loader(num_writers=1, backoff=0.05).load(byte_batches(iter(docs), max_docs=10))
+        self.assertEqual(stats.num_retries, 3)
+        self.assertEqual(stats.num_docs, 20)
+        self.assertEqual(self.server.accepted_ids(), [doc['_id'] for doc in docs])
+        # exponential backoff: 0.05, 0.1, 0.2 s
+        delays = [b - a for a, b in zip(times, times[1:4])]
+        for delay, expected in zip(delays, (0.05, 0.1, 0.2)):
+            self.assertGreaterEqual(delay, expected * 0.9)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.respond = lambda num_request, docs: (503, {'error': 'unavailable'})
+        with self.assertRaises(BulkLoadError):
+            self.mk_loader(num_writers=1, max_retries=2).load(byte_batches(iter(mk_docs(5))))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_error_not_retried(self):
+        self.server.respond = lambda num_request, docs: (400, {'error': 'bad_request'})
+        with self.assertRaises(BulkLoadError) as ctx:
+            self.mk_loader(num_writers=1).load(byte_batches(iter(mk_docs(5))))
+        self.assertEqual(ctx.exception.status, 400)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_document_conflicts_counted(self):
+        def respond(num_request, docs):
+            return 201, [{'id': doc['_id'], 'error': 'conflict', 'reason': 'Document update conflict.'}
+                         if doc['count'] % 10 == 0 else {'ok': True, 'id': doc['_id']} for doc in docs]
+        self.server.respond = respond
+        stats = self.mk_loader(num_writers=2).load(byte_batches(iter(mk_docs(100)), max_docs=30))
+        self.assertEqual(stats.num_doc_errors, 10)
+        self.assertEqual(stats.num_docs, 100)
+        self.assertEqual(stats.num_retries, 0)
+
+    def test_commits_reported_in_order(self):
+        def respond(num_request, docs):
+            if docs[0]['count'] == 0:
+                time.sleep(0.3)  # the first batch is committed last
+            return 201, [{'ok': True, 'id': doc['_id']} for doc in docs]
+        self.server.respond = respond
+        committed = []
+        self.mk_loader(num_writers=4).load(
+            byte_batches(iter(mk_docs(100)), max_docs=10), on_commit=lambda doc: committed.append(doc['_id']))
+        self.assertEqual(committed, ['{0:05d}'.format(i) for i in range(9, 100, 10)])
+
+
+class MarkCommittedTest(unittest.TestCase):
+
+    def test_out_of_order_commits(self):
+        loader = CouchBulkLoader('http://127.0.0.1:1', 'freqdb')
+        committed = []
+        loader._on_commit = lambda doc: committed.append(doc['_id'])
+        loader._mark_committed(2, {'_id': 'c'})
+        loader._mark_committed(1, {'_id': 'b'})
+        self.assertEqual(committed, [])
+        loader._mark_committed(0, {'_id': 'a'})
+        self.assertEqual(committed, ['a', 'b', 'c'])
+        loader._mark_committed(4, {'_id': 'e'})
+        self.assertEqual(committed, ['a', 'b', 'c'])
+        loader._mark_committed(3, {'_id': 'd'})
+        self.assertEqual(committed, ['a', 'b', 'c', 'd', 'e'])
+
+
+if __name__ == '__main__':
+    unittest.main()
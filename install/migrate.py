@@ -16,14 +16,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""
+Migrations of the tile configurations stored in CouchDB.
+
+A migration is a registered transform function (see @migration) called for
+each tile configuration document (ids starting with "cnc:"). It changes the
+document in place and it may also change the layouts configuration. The
+runner (migrate_data) fetches the documents in pages, writes only documents
+whose content hash has changed (so a migration can be safely re-run) via
+_bulk_docs requests running in a pool of workers (with a bounded number of
+requests in flight) and stores the last fully written page to a checkpoint
+file so an interrupted migration can be resumed.
+"""
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+import hashlib
 import json
+import os
 import sys
 import re
-from typing import Dict, Any, Tuple
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import argparse
 
+DEFAULT_PAGE_SIZE = 500
+
+DEFAULT_WORKERS = 4
+
+LAYOUT_MODES = ['single', 'cmp', 'translat']
+
+TILE_DOC_PREFIX = 'cnc:'
+
 
 class DbConf():
 
@@ -34,96 +62,346 @@ class DbConf():
     username = ''
     password = ''
     dry_run = False
+    page_size = DEFAULT_PAGE_SIZE
+    workers = DEFAULT_WORKERS
 
 
 def parse_server_url(url: str) -> Tuple[str, str]:
     return re.split(r'(https?://)', url)[1:]
 
 
-def put_document(db_conf: DbConf, ident: str, doc):
+def create_session(db_conf: DbConf) -> requests.Session:
+    """
+    Create a session with pooled keep-alive connections (one per worker
+    plus one for reading). Credentials are sent via the Authorization
+    header (not as a part of URLs).
+    """
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(db_conf.username, db_conf.password)
+    session.headers.update({'Accept': 'application/json', 'Content-Type': 'application/json'})
+    for scheme in ('http://', 'https://'):
+        session.mount(scheme, HTTPAdapter(pool_maxsize=db_conf.workers + 1, max_retries=3))
+    return session
+
+
+def db_url(db_conf: DbConf, db: str, path: str = '') -> str:
     protocol, server = parse_server_url(db_conf.server)
-    url = f'{protocol}{db_conf.username}:{db_conf.password}@{server}/{db_conf.db2}/{ident}'
+    return f'{protocol}{server.rstrip("/")}/{db}/{path}'
+
+
+def doc_hash(doc: Dict[str, Any]) -> str:
+    data = {k: v for k, v in doc.items() if k not in ('_id', '_rev')}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def iter_doc_pages(
+        session: requests.Session, db_conf: DbConf, prefix: str,
+        after: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Iterate over pages of documents with ids starting with prefix
+    (fetched via _all_docs?include_docs=true), optionally starting
+    right after the document 'after'. Pages start at the smallest id
+    greater than the previous one (id + '\\u0000') instead of using skip.
+    """
+    params = {
+        'include_docs': 'true',
+        'startkey': json.dumps(after + '\u0000' if after else prefix),
+        'endkey': json.dumps(prefix + '\ufff0'),
+        'limit': db_conf.page_size,
+    }
+    while True:
+        ans = session.get(db_url(db_conf, db_conf.db, '_all_docs'), params=params)
+        ans.raise_for_status()
+        rows = ans.json()['rows']
+        docs = [row['doc'] for row in rows if row.get('doc') is not None]
+        if len(docs) > 0:
+            yield docs
+        if len(rows) < db_conf.page_size:
+            return
+        params['startkey'] = json.dumps(rows[-1]['id'] + '\u0000')
+
+
+def fetch_target_docs(session: requests.Session, db_conf: DbConf, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the current versions of documents from the target database
+    (db2); missing and deleted documents are not included.
+    """
+    ans = session.post(
+        db_url(db_conf, db_conf.db2, '_all_docs'), params={'include_docs': 'true'}, data=json.dumps({'keys': ids}))
+    ans.raise_for_status()
+    return {row['id']: row['doc'] for row in ans.json()['rows'] if row.get('doc') is not None}
+
+
+def bulk_put_documents(session: requests.Session, db_conf: DbConf, docs: List[Dict[str, Any]]) -> int:
+    """
+    Write documents via _bulk_docs and return the number of failed ones
+    """
     if db_conf.dry_run:
-        print('----------------')
-        print(f'db update -> {url}')
-        print(json.dumps(doc))
-        return None
-    else:
-        if db_conf.db != db_conf.db2:
-            del doc['_rev']
-        print(url)
-        print(doc)
-        return requests.put(url, data=json.dumps(doc),
-                            headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
+        for doc in docs:
+            print('----------------')
+            print(f'db update -> {db_url(db_conf, db_conf.db2, doc["_id"])}')
+            print(json.dumps(doc))
+        return 0
+    ans = session.post(db_url(db_conf, db_conf.db2, '_bulk_docs'), data=json.dumps({'docs': docs}))
+    ans.raise_for_status()
+    num_errors = 0
+    for item in ans.json():
+        if 'error' in item:
+            print(f'failed to update {item["id"]}: {item["error"]} ({item.get("reason")})')
+            num_errors += 1
+    return num_errors
 
 
-def get_doc(db_conf: DbConf, id: str):
-    protocol, server = parse_server_url(db_conf.server)
-    ans = requests.get(f'{protocol}{db_conf.username}:{db_conf.password}@{server}/{db_conf.db}/{id}')
-    return ans.json()
+def index_layout_tiles(l_data: Dict[str, Any]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """
+    Map (lang, tile ident) to all the tile entries (in all modes
+    and groups) of the layouts configuration.
+    """
+    ans = defaultdict(list)
+    for lang, layouts in l_data.items():
+        for mode in LAYOUT_MODES:
+            for group in layouts.get(mode, {}).get('groups', []):
+                if type(group) is str:
+                    print(f'skipping group {group}')
+                    continue
+                for tile in group['tiles']:
+                    ans[(lang, tile['tile'])].append(tile)
+    return ans
 
 
-def get_all_docs(db_conf: DbConf):
-    protocol, server = parse_server_url(db_conf.server)
-    ans = requests.get(f'{protocol}{db_conf.username}:{db_conf.password}@{server}/{db_conf.db}/_all_docs')
-    return ans.json()
-
-
-def migrate_data(db_conf: DbConf, path: str):
-    all_docs = get_all_docs(db_conf)
-    for row in all_docs['rows']:
-        waitFor, readSubqFrom = None, None
-        ident = row['id']
-        if not ident.startswith('cnc:'):
-            print(f'skipping {ident}')
-            continue
-        doc = get_doc(db_conf, ident)
-        if 'conf' not in doc:
-            print(f'skipping {ident} (no conf section)')
-            continue
-
-        if 'waitFor' in doc['conf']:
-            waitFor = doc['conf']['waitFor']
-            del doc['conf']['waitFor']
-        if 'readSubqFrom' in doc['conf']:
-            readSubqFrom = doc['conf']['readSubqFrom']
-            del doc['conf']['readSubqFrom']
-
-        if waitFor or readSubqFrom:
-            with open(path) as fr:
-                l_data = json.load(fr)
-            if doc['lang'] in l_data:
-                for mode in ['single', 'cmp', 'translat']:
-                    for group in l_data[doc['lang']][mode]['groups']:
-                        if type(group) is str:
-                            print(f'skipping group {group}')
-                            continue
-                        for tile in group['tiles']:
-                            if tile['tile'] == doc['ident']:
-                                if waitFor:
-                                    tile['waitFor'] = waitFor
-                                if readSubqFrom:
-                                    tile['readSubqFrom'] = readSubqFrom
-                                if db_conf.dry_run:
-                                    print('----------------')
-                                    print(f'layout update --> {tile}')
-            if not db_conf.dry_run:
-                with open(path, 'w') as f:
-                    json.dump(l_data, f, indent=4, ensure_ascii=False)
-
-            del doc['_id']
-            ans = put_document(db_conf, ident, doc)
-            if ans is not None:
-                print(f'{ans.status_code}: {ans.text}')
+class LayoutsConf:
+    """
+    The layouts configuration file with tiles indexed by (lang, ident).
+    Migrations changing it must call set_changed().
+    """
+
+    def __init__(self, path: str, dry_run: bool = False):
+        self.path = path
+        self.dry_run = dry_run
+        with open(path) as fr:
+            self.data = json.load(fr)
+        self.tiles = index_layout_tiles(self.data)
+        self.changed = False
+
+    def get_tiles(self, lang: str, ident: str) -> List[Dict[str, Any]]:
+        return self.tiles.get((lang, ident), [])
+
+    def set_changed(self, tile: Dict[str, Any]):
+        self.changed = True
+        if self.dry_run:
+            print('----------------')
+            print(f'layout update --> {tile}')
+
+    def save(self):
+        """
+        Write the file (atomically) if it has been changed
+        """
+        if not self.changed or self.dry_run:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+Transform = Callable[[Dict[str, Any], LayoutsConf], None]
+
+MIGRATIONS: Dict[str, Tuple[Transform, str]] = {}
+
+
+def migration(name: str, description: str):
+    """
+    Register a transform function (doc, layouts) -> None changing
+    a tile configuration document (and possibly layouts) in place.
+    A transform must be idempotent, i.e. applying it to an already
+    migrated document must not change it.
+    """
+    def decorator(fn: Transform) -> Transform:
+        MIGRATIONS[name] = (fn, description)
+        return fn
+    return decorator
+
+
+@migration('tile-deps-to-layouts', 'Move "waitFor" and "readSubqFrom" from tile confs to layouts')
+def move_tile_deps_to_layouts(doc: Dict[str, Any], layouts: LayoutsConf):
+    if 'conf' not in doc:
+        return
+    waitFor = doc['conf'].pop('waitFor', None)
+    readSubqFrom = doc['conf'].pop('readSubqFrom', None)
+    if waitFor or readSubqFrom:
+        for tile in layouts.get_tiles(doc['lang'], doc['ident']):
+            if waitFor:
+                tile['waitFor'] = waitFor
+            if readSubqFrom:
+                tile['readSubqFrom'] = readSubqFrom
+            layouts.set_changed(tile)
+
+
+class Checkpoint:
+    """
+    Id of the last document of the last fully written page
+    (along with the names of the migrations being applied)
+    """
+
+    def __init__(self, path: Optional[str], migrations: List[str]):
+        self.path = path
+        self.migrations = migrations
+
+    def load(self) -> Optional[str]:
+        if not self.path or not os.path.isfile(self.path):
+            return None
+        with open(self.path) as fr:
+            data = json.load(fr)
+        if data['migrations'] != self.migrations:
+            print(f'ERROR: checkpoint {self.path} belongs to different migrations ({", ".join(data["migrations"])})')
+            sys.exit(1)
+        return data['last_id']
+
+    def save(self, last_id: str):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fw:
+            json.dump({'migrations': self.migrations, 'last_id': last_id}, fw)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.isfile(self.path):
+            os.unlink(self.path)
+
+
+class MigrationStats:
+
+    def __init__(self):
+        self.docs = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.t0 = time.time()
+
+    def report(self):
+        print(f'{self.docs} documents processed in {time.time() - self.t0:.1f}s: {self.changed} changed, '
+              f'{self.unchanged} unchanged, {self.errors} failed')
+
+
+def migrate_data(
+        db_conf: DbConf, path: str, migrations: Optional[List[str]] = None,
+        checkpoint_path: Optional[str] = None, resume: bool = False) -> MigrationStats:
+    """
+    Apply registered migrations (all of them by default) to the tile configuration
+    documents. Pages are read sequentially while the changed documents are written
+    by db_conf.workers concurrent workers (at most that many pages are in flight).
+    The checkpoint is advanced only over a continuous sequence of written pages
+    (a page with failed documents stops it, so --resume retries the page).
+    The layouts file is saved before documents depending on its changes are written.
+    With a different target database, documents already equal to their target
+    versions are skipped (so a repeated run writes nothing) and the others are
+    written with the target's _rev.
+    """
+    names = migrations or list(MIGRATIONS)
+    transforms = [MIGRATIONS[name][0] for name in names]
+    layouts = LayoutsConf(path, db_conf.dry_run)
+    checkpoint = Checkpoint(None if db_conf.dry_run else checkpoint_path, names)
+    after = checkpoint.load() if resume else None
+    if after:
+        print(f'resuming after {after}')
+    session = create_session(db_conf)
+    stats = MigrationStats()
+    in_flight = threading.BoundedSemaphore(db_conf.workers)
+    lock = threading.Lock()
+    failed = threading.Event()
+    written: Dict[int, Optional[str]] = {}
+    next_seq = [0]
+
+    def mark_written(seq: int, last_id: Optional[str]):
+        """
+        Record a written page (last_id is None for a page with errors)
+        """
+        with lock:
+            written[seq] = last_id
+            last = None
+            while written.get(next_seq[0]) is not None:
+                last = written.pop(next_seq[0])
+                next_seq[0] += 1
+            if last is not None:
+                checkpoint.save(last)
+
+    def write(seq: int, docs: List[Dict[str, Any]], last_id: str):
+        try:
+            num_errors = bulk_put_documents(session, db_conf, docs)
+            with lock:
+                stats.errors += num_errors
+            mark_written(seq, None if num_errors > 0 else last_id)
+        except BaseException:
+            failed.set()
+            raise
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(db_conf.workers) as executor:
+        futures = []
+        for seq, docs in enumerate(iter_doc_pages(session, db_conf, TILE_DOC_PREFIX, after)):
+            if failed.is_set():
+                break
+            # with a different target database, documents are compared with their target versions
+            targets = None
+            if db_conf.db != db_conf.db2:
+                targets = fetch_target_docs(session, db_conf, [doc['_id'] for doc in docs])
+            updated = []
+            for doc in docs:
+                orig_hash = doc_hash(doc)
+                for transform in transforms:
+                    transform(doc, layouts)
+                if targets is None:
+                    if doc_hash(doc) != orig_hash:
+                        updated.append(doc)
+                    continue
+                target = targets.get(doc['_id'])
+                if target is None:
+                    doc.pop('_rev', None)
+                    updated.append(doc)
+                elif doc_hash(target) != doc_hash(doc):
+                    doc['_rev'] = target['_rev']
+                    updated.append(doc)
+            stats.docs += len(docs)
+            stats.changed += len(updated)
+            stats.unchanged += len(docs) - len(updated)
+            layouts.save()
+            in_flight.acquire()
+            if len(updated) > 0:
+                futures.append(executor.submit(write, seq, updated, docs[-1]['_id']))
+            else:
+                in_flight.release()
+                mark_written(seq, docs[-1]['_id'])
+        for future in futures:
+            future.result()
+    if stats.errors > 0:
+        print('some documents failed, the checkpoint has not been advanced past the first failed page (use --resume to retry)')
+    else:
+        checkpoint.clear()
+    stats.report()
+    return stats
 
 
 if __name__ == '__main__':
-    argparser = argparse.ArgumentParser('migrate', description='Migrate "waitFor" and "readSubqFrom" configurations from CouchDB tile conf to layout conf')
+    argparser = argparse.ArgumentParser('migrate', description='Migrate CouchDB tile configurations (and layouts)')
     argparser.add_argument('layouts_conf', metavar='LAYOUTS_CONF', help='WaG server configuration file with tileDB filled in')
     argparser.add_argument('wdglance_conf', metavar='WDGLANCE_CONF', help='a JSON file containing tiles configurations')
     argparser.add_argument('-s', '--source-db', type=str, help='Source database (default is wag_conf)')
     argparser.add_argument('-t', '--target-db', type=str, help='Target database (default is wag_conf)')
     argparser.add_argument('-r', '--server', type=str, help='Custom server URL')
+    argparser.add_argument('-p', '--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                           help=f'Number of documents fetched and written per request (default is {DEFAULT_PAGE_SIZE})')
+    argparser.add_argument('-m', '--migration', type=str, action='append', choices=list(MIGRATIONS),
+                           help='A migration to apply (can be repeated, default is all of them: {0})'.format(
+                               '; '.join(f'{k} - {v[1]}' for k, v in MIGRATIONS.items())))
+    argparser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                           help=f'Max. number of concurrent write requests (default is {DEFAULT_WORKERS})')
+    argparser.add_argument('-c', '--checkpoint', type=str,
+                           help='A file to store migration progress to (default is LAYOUTS_CONF.migrate.checkpoint)')
+    argparser.add_argument('--resume', action='store_const', const=True,
+                           help='Continue an interrupted migration from the checkpoint')
     argparser.add_argument('-d', '--dry-run', action='store_const', const=True, help='Do not write anything, just print the target docs (this overrides --target-db)')
     args = argparser.parse_args()
     with open(args.wdglance_conf) as fr:
@@ -136,6 +414,8 @@ if __name__ == '__main__':
     db_conf.db = tmp.get('db', db_conf.db)
     db_conf.db2 = args.target_db if args.target_db else db_conf.db
     db_conf.dry_run = args.dry_run
+    db_conf.page_size = args.page_size
+    db_conf.workers = args.workers
     if args.server:
         db_conf.server = args.server
     else:
@@ -143,4 +423,5 @@ if __name__ == '__main__':
     db_conf.prefix = tmp.get('prefix', db_conf.prefix)
     db_conf.username = tmp.get('username', db_conf.username)
     db_conf.password = tmp.get('password', db_conf.password)
-    migrate_data(db_conf, args.layouts_conf)
\ No newline at end of file
+    migrate_data(db_conf, args.layouts_conf, args.migration,
+                 args.checkpoint or f'{args.layouts_conf}.migrate.checkpoint', args.resume)
\ No newline at end of file
@@ -27,17 +27,44 @@ Required config:
     'gitBranch': 'used_git_branch',
     'gitRemote': 'git_remote_identifier'
 }
+
+Optional config:
+{
+    'copyWorkers': 8,  # number of parallel file copy/link operations
+    'activation': 'copy'  # or 'symlink'
+}
+
+Archived files are stored in a content-addressed object store (archiveDir/.objects)
+and hardlinked from there to archives and to the application directory, so
+files unchanged between versions are stored just once. Stored objects are
+read-only (a file modified in place would change all the archives sharing it).
+Objects no longer used by any archive can be removed via the "gc" action.
+
+Activation modes:
+  copy    - the application directory is cleaned and the archive is linked
+            (or copied) into it
+  symlink - the application directory is a symbolic link to a complete archive
+            and it is replaced atomically (rename) by a link to the new archive;
+            a deployment from an archive is just the link replacement
+            (if appDir is a regular directory, it is renamed to appDir.pre-symlink
+            on the first deployment)
 """
 
 import argparse
+import errno
+import hashlib
 import json
 import os
 import platform
 import re
+import shutil
+import stat
 import subprocess
 import sys
+import threading
 import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
 from io import IOBase
@@ -49,6 +76,10 @@ from typing import Any, Dict, List, Optional, Tuple
 GIT_URL_TEST_TIMEOUT = 5
 DEFAULT_DATETIME_FORMAT = '%Y-%m-%d-%H-%M-%S'
 FILES = ('assets', 'conf', 'dist', 'dist-server', 'html', 'package.json')
+LIBRARIES = ('node_modules', 'src')  # node_modules because of server deps, src because of schemas (TODO prune)
+OBJECT_STORE_DIR = '.objects'
+OBJECT_STORE_INDEX = 'index.json'
+DEFAULT_COPY_WORKERS = 8
 DEPLOY_MESSAGE_FILE = '.deploy_info'
 INVALIDATION_FILE = '.invalid'
 CONFIG_DIR_NAME = 'configDirName'
@@ -62,6 +93,10 @@ GIT_REMOTE = 'gitRemote'
 WAG_CONF_ALIASES = 'wagConfAliases'
 WAG_CONF_CUSTOM = 'wagConfCustom'
 TARGET_SYMLINKS = 'targetSymlinks'
+COPY_WORKERS = 'copyWorkers'
+ACTIVATION = 'activation'
+ACTIVATION_COPY = 'copy'
+ACTIVATION_SYMLINK = 'symlink'
 GLOBAL_CONF_PATH = os.environ.get('GLOBAL_CONF_PATH', '/usr/local/etc/wag-deploy.json')
 WAG_CONF_FILES = (
     'layouts.json', 'server1.json', 'server2.json', 'themes-cnc.json', 'themes.json',
@@ -248,6 +283,9 @@ class Configuration:
             return re.match(r'[a-zA-Z]:\\', s) is not None
 
     def __init__(self, data: Dict[str, Any], skip_remote_checks=False):
+        activation = data.get(ACTIVATION, ACTIVATION_COPY)
+        if activation not in (ACTIVATION_COPY, ACTIVATION_SYMLINK):
+            raise ConfigError(f'Unknown activation mode {activation}')
         keys = [APP_CONFIG_DIR, WORKING_DIR, ARCHIVE_DIR, APP_DIR]
         for item in keys:
             p = os.path.realpath(data[item])
@@ -255,6 +293,9 @@ class Configuration:
                 raise ConfigError(f'{item} cannot be set to forbidden value {p}')
             elif not self._is_abs_path(p):
                 raise ConfigError(f'{item} path must be absolute')
+            elif item == APP_DIR and activation == ACTIVATION_SYMLINK and not os.path.exists(data[item]):
+                if not os.path.isdir(os.path.dirname(p)):
+                    raise ConfigError(f'Parent directory of {p} ({item}) does not exist.')
             elif not os.path.isdir(p):
                 raise ConfigError(f'Path {p} ({item}) does not exist.')
         if not skip_remote_checks:
@@ -280,6 +321,19 @@ class Configuration:
     def app_dir(self) -> str:
         return os.path.realpath(self._data[APP_DIR])
 
+    @property
+    def app_link(self) -> str:
+        """
+        Path of the application directory itself (i.e. not
+        resolved in case it is a symbolic link)
+        """
+        path = self._data[APP_DIR].rstrip('/')
+        return os.path.join(os.path.realpath(os.path.dirname(path)), os.path.basename(path))
+
+    @property
+    def activation(self) -> str:
+        return self._data.get(ACTIVATION, ACTIVATION_COPY)
+
     @property
     def working_dir(self) -> str:
         return os.path.realpath(self._data[WORKING_DIR])
@@ -308,6 +362,14 @@ class Configuration:
     def target_symlinks(self) -> Dict[str, str]:
         return self._target_symlinks
 
+    @property
+    def object_store_dir(self) -> str:
+        return os.path.join(self.archive_dir, OBJECT_STORE_DIR)
+
+    @property
+    def copy_workers(self) -> int:
+        return self._data.get(COPY_WORKERS, DEFAULT_COPY_WORKERS)
+
 
 class ConfigError(Exception):
     pass
@@ -321,6 +383,153 @@ class InputError(Exception):
     pass
 
 
+class ObjectStore:
+    """
+    A content-addressed store of files. An object is named by a SHA-256 digest
+    of the file content and by the file mode (hardlinks share the mode).
+    Files are placed to their destinations as hardlinks to the objects (or
+    copied if the destination is on a different file system). To avoid
+    re-reading unchanged source files, digests are cached by file path,
+    size, mtime and inode.
+
+    Args:
+        root: the store directory (must be on the same file system as archives)
+        workers: max. number of files processed in parallel
+    """
+
+    def __init__(self, root: str, workers: int = DEFAULT_COPY_WORKERS):
+        self._root = root
+        self._workers = workers
+        self._index_path = os.path.join(root, OBJECT_STORE_INDEX)
+        self._index: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+        self._num_files = 0
+        self._num_new = 0
+        self._bytes_new = 0
+        os.makedirs(root, exist_ok=True)
+        if os.path.isfile(self._index_path):
+            with open(self._index_path) as fr:
+                self._index = json.load(fr)
+
+    @staticmethod
+    def _digest(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as fr:
+            for chunk in iter(lambda: fr.read(1024 * 1024), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def _place(src_path: str, dst_path: str):
+        if os.path.lexists(dst_path):
+            os.unlink(dst_path)
+        try:
+            os.link(src_path, dst_path)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            shutil.copy2(src_path, dst_path)
+
+    def _object_path(self, src_path: str, st: os.stat_result) -> str:
+        mode = stat.S_IMODE(st.st_mode) & ~0o222
+        cached = self._index.get(src_path)
+        if cached and cached[:3] == [st.st_size, st.st_mtime_ns, st.st_ino]:
+            key = cached[3]
+        else:
+            key = '{0}-{1:o}'.format(self._digest(src_path), mode)
+            self._index[src_path] = [st.st_size, st.st_mtime_ns, st.st_ino, key]
+        obj_path = os.path.join(self._root, key[:2], key)
+        if not os.path.exists(obj_path):
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            tmp_path = '{0}.{1}.tmp'.format(obj_path, threading.get_ident())
+            shutil.copy2(src_path, tmp_path)
+            os.chmod(tmp_path, mode)
+            try:
+                os.link(tmp_path, obj_path)
+                with self._lock:
+                    self._num_new += 1
+                    self._bytes_new += st.st_size
+            except FileExistsError:  # stored by another thread in the meantime
+                pass
+            finally:
+                os.unlink(tmp_path)
+        return obj_path
+
+    def _add_file(self, src_path: str, dst_path: str):
+        self._place(self._object_path(src_path, os.stat(src_path)), dst_path)
+
+    def _process_tree(self, src: str, dst: str, fn):
+        """
+        Recreate the directory structure (and symlinks) of src in dst and
+        call fn(src_file, dst_file) for all the regular files in parallel.
+        """
+        jobs = []
+        if os.path.isfile(src) and not os.path.islink(src):
+            jobs.append((src, dst))
+        else:
+            if not os.path.isdir(src):
+                raise FileNotFoundError(errno.ENOENT, 'No such file or directory', src)
+            for dir_path, dir_names, file_names in os.walk(src):
+                dst_dir = os.path.join(dst, os.path.relpath(dir_path, src))
+                os.makedirs(dst_dir, exist_ok=True)
+                shutil.copymode(dir_path, dst_dir)
+                for name in dir_names + file_names:
+                    src_path = os.path.join(dir_path, name)
+                    dst_path = os.path.join(dst_dir, name)
+                    if os.path.islink(src_path):
+                        if os.path.islink(dst_path) or os.path.isfile(dst_path):
+                            os.unlink(dst_path)
+                        os.symlink(os.readlink(src_path), dst_path)
+                    elif name in file_names:
+                        jobs.append((src_path, dst_path))
+        with ThreadPoolExecutor(self._workers) as executor:
+            for future in [executor.submit(fn, *job) for job in jobs]:
+                future.result()
+        self._num_files += len(jobs)
+
+    def add_tree(self, src: str, dst: str):
+        """
+        Store all the files of src (a file or a directory) and hardlink them to dst.
+        """
+        self._process_tree(src, dst, self._add_file)
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as fw:
+            json.dump(self._index, fw)
+        os.replace(tmp_path, self._index_path)
+
+    def link_tree(self, src: str, dst: str):
+        """
+        Hardlink a tree which is already stored (e.g. an archive) to dst.
+        """
+        self._process_tree(src, dst, self._place)
+
+    def gc(self) -> Tuple[int, int]:
+        """
+        Remove objects not linked from anywhere else. Returns the number
+        of removed objects and the number of freed bytes.
+        """
+        num_removed = 0
+        freed = 0
+        for dir_path, _, file_names in os.walk(self._root):
+            if dir_path == self._root:  # index
+                continue
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                st = os.lstat(path)
+                if st.st_nlink == 1:
+                    os.unlink(path)
+                    num_removed += 1
+                    freed += st.st_size
+        return num_removed, freed
+
+    def report(self):
+        print('{0} files processed, {1} new objects stored ({2:.1f} MB)'.format(
+            self._num_files, self._num_new, self._bytes_new / 1e6))
+        self._num_files = 0
+        self._num_new = 0
+        self._bytes_new = 0
+
+
 def description(text: str):
     def decor(fn):
         @wraps(fn)
@@ -351,6 +560,7 @@ class Deployer(object):
 
     def __init__(self, conf: Configuration):
         self._conf = conf
+        self._store = ObjectStore(conf.object_store_dir, conf.copy_workers)
 
     def shell_cmd(self, *args, **kw):
         """
@@ -390,11 +600,12 @@ class Deployer(object):
             None
 
         Raises:
-            ShellCommandError
+            FileNotFoundError
         """
-        for item in FILES + (self._conf.config_dir_name,):
+        for item in FILES + (self._conf.config_dir_name,) + LIBRARIES:
             src_path = os.path.join(self._conf.working_dir, item)
-            self.shell_cmd('cp', '-r', '-p', src_path, arch_path)
+            self._store.add_tree(src_path, os.path.join(arch_path, item))
+        self._store.report()
 
     @description('Copying configuration to the archive')
     def copy_configuration(self, arch_path: str):
@@ -410,12 +621,20 @@ class Deployer(object):
             self.shell_cmd('cp', '-p', src_path, dst_path)
 
     @description('copy libraries')
-    def copy_libraries(self):
-        src_path = os.path.join(self._conf.working_dir, 'node_modules')  # because of server deps
-        dst_path = os.path.join(self._conf.app_dir)
-        self.shell_cmd('cp', '-r', '-p', src_path, dst_path)
-        src_path = os.path.join(self._conf.working_dir, 'src')  # because of schemas (TODO prune)
-        self.shell_cmd('cp', '-r', '-p', src_path, dst_path)
+    def copy_libraries(self, arch_path: str):
+        """
+        Args:
+            arch_path (str): path to an archive (archives created by older
+                versions of the script do not contain libraries - in such
+                case, the libraries are taken from the working directory)
+        """
+        for item in LIBRARIES:
+            dst_path = os.path.join(self._conf.app_dir, item)
+            if os.path.isdir(os.path.join(arch_path, item)):
+                self._store.link_tree(os.path.join(arch_path, item), dst_path)
+            else:
+                self._store.add_tree(os.path.join(self._conf.working_dir, item), dst_path)
+        self._store.report()
 
     @description('Updating data from repository')
     def update_from_repository(self):
@@ -469,8 +688,44 @@ class Deployer(object):
             arch_path (str): path to an archive
         """
         for item in chain(FILES, (DEPLOY_MESSAGE_FILE, self._conf.config_dir_name)):
-            self.shell_cmd('cp', '-r', '-p', os.path.join(arch_path, item), self._conf.app_dir)
-        self.copy_libraries()
+            self._store.link_tree(os.path.join(arch_path, item), os.path.join(self._conf.app_dir, item))
+        self.copy_libraries(arch_path)
+
+    @description('Completing archive')
+    def complete_archive(self, arch_path: str):
+        """
+        Add libraries to archives created by older versions of the script
+        (the libraries are taken from the working directory)
+
+        Args:
+            arch_path (str): path to an archive
+        """
+        missing = [item for item in LIBRARIES if not os.path.isdir(os.path.join(arch_path, item))]
+        for item in missing:
+            self._store.add_tree(os.path.join(self._conf.working_dir, item), os.path.join(arch_path, item))
+        if missing:
+            self._store.report()
+
+    @description('Activating new version')
+    def activate_archive(self, arch_path: str):
+        """
+        Atomically replace the application directory link with
+        a link to the archive.
+
+        Args:
+            arch_path (str): path to an archive
+        """
+        app_link = self._conf.app_link
+        if os.path.isdir(app_link) and not os.path.islink(app_link):
+            backup_path = app_link + '.pre-symlink'
+            print(f'moving the application directory {app_link} to {backup_path}')
+            os.rename(app_link, backup_path)
+        tmp_link = app_link + '.tmp-link'
+        if os.path.lexists(tmp_link):
+            os.unlink(tmp_link)
+        os.symlink(arch_path, tmp_link)
+        os.replace(tmp_link, app_link)
+        print(f'{app_link} -> {arch_path}')
 
     @description('Comparing current and new package.json for changed dependencies')
     def update_npm_deps(self):
@@ -488,6 +743,8 @@ class Deployer(object):
     @description('Creating custom symbolic links')
     def create_custom_symlinks(self):
         for source, target in self._conf.target_symlinks.items():
+            if os.path.islink(target) and os.readlink(target) == source:
+                continue  # e.g. a link inside a reactivated archive
             os.symlink(source, target)
 
     def run_all(self, date: datetime, message: str, update_confxml: bool):
@@ -503,18 +760,32 @@ class Deployer(object):
         self.copy_configuration(arch_path)
         self.record_deployment_info(arch_path, message)
         self.copy_app_to_archive(arch_path)
-        self.remove_current_deployment()
-        self.deploy_new_version(arch_path)
+        self.activate(arch_path)
         self.create_custom_symlinks()
 
+    def activate(self, arch_path: str):
+        """
+        Args:
+            arch_path (str): path to an archive
+        """
+        if self._conf.activation == ACTIVATION_SYMLINK:
+            self.complete_archive(arch_path)
+            self.activate_archive(arch_path)
+        else:
+            if os.path.islink(self._conf.app_link):
+                raise ConfigError(
+                    f'{self._conf.app_link} is a symbolic link (to an archive) - please remove it '
+                    'before switching back to the copy activation')
+            self.remove_current_deployment()
+            self.deploy_new_version(arch_path)
+
     def from_archive(self, archive_id: str):
         """
         Args:
             archive_id (str): an ID of an archived item to be deployed
         """
         arch_path = os.path.join(self._conf.archive_dir, archive_id)
-        self.remove_current_deployment()
-        self.deploy_new_version(arch_path)
+        self.activate(arch_path)
         with open(os.path.join(arch_path, DEPLOY_MESSAGE_FILE), 'rb') as fr:
             print('\nDeployment information:\n{}'.format(fr.read()))
 
@@ -526,8 +797,24 @@ def list_archive(conf: Configuration):
     """
     print('archived deployments:')
     print(conf.archive_dir)
-    for item in os.listdir(conf.archive_dir):
-        print('\t{0}'.format(item))
+    active = None
+    if os.path.islink(conf.app_link):
+        active = os.path.basename(os.path.realpath(conf.app_link))
+    for item in list_archive_ids(conf):
+        print('\t{0}{1}'.format(item, ' (active)' if item == active else ''))
+
+
+def list_archive_ids(conf: Configuration) -> List[str]:
+    return [item for item in os.listdir(conf.archive_dir) if not item.startswith('.')]
+
+
+def collect_garbage(conf: Configuration):
+    """
+    Remove stored objects not used by any archive (e.g. after
+    some archives have been deleted)
+    """
+    num_removed, freed = ObjectStore(conf.object_store_dir).gc()
+    print('removed {0} unused objects ({1:.1f} MB)'.format(num_removed, freed / 1e6))
 
 
 def invalidate_archive(conf: Configuration, archive_id: str, message: str):
@@ -560,7 +847,7 @@ def find_matching_archive(conf: Configuration, arch_id: str) -> Optional[str]:
         InputError: in case of ambiguous search (one exact match is accepted only)
 
     """
-    avail_archives = os.listdir(conf.archive_dir)
+    avail_archives = list_archive_ids(conf)
     ans = None
     for item in avail_archives:
         if item.startswith(arch_id):
@@ -589,7 +876,7 @@ if __name__ == '__main__':
             To add more files, please configure "wagConfCustom" item
             in your deployment config file.'''.format(', '.join(WAG_CONF_FILES))))
     argp.add_argument('action', metavar='ACTION',
-                      help='Action to perform (deploy, list, invalidate, show_conf)')
+                      help='Action to perform (deploy, list, invalidate, gc, show_conf)')
     argp.add_argument('archive_id', metavar='ARCHIVE_ID', nargs='?',
                       default='new', help='Archive identifier (default is *new*)')
     argp.add_argument('-c', '--config-path', type=str,
@@ -641,8 +928,10 @@ if __name__ == '__main__':
             list_archive(conf)
         elif args.action == 'invalidate':
             invalidate_archive(conf, args.archive_id, args.message)
+        elif args.action == 'gc':
+            collect_garbage(conf)
         else:
-            raise Exception(f'Unknown action "{args.action}" (use one of: deploy, list)')
+            raise Exception(f'Unknown action "{args.action}" (use one of: deploy, list, invalidate, gc)')
     except ConfigError as e:
         print(f'\n\U0001F4A5 Configuration error: {e}\n')
         sys.exit(2)
@@ -248,6 +248,26 @@ export interface ClientStaticConf {
     // If string we expect this to be a fs path to another
     // JSON file containing just the 'layout' configuration.
     layouts: LayoutsConfig | string;
+
+    /**
+     * A path to a configuration bundle created by install/confbundle.py.
+     * If set, both layouts and tiles are loaded from the bundle
+     * (i.e. no tile configurations are fetched from a tile database)
+     * and the 'layouts' and 'tiles' values are ignored.
+     */
+    confBundle?: string;
+}
+
+/**
+ * A pre-merged and validated configuration of layouts and
+ * tiles (see install/confbundle.py)
+ */
+export interface ConfBundle {
+    version: number;
+    hash: string;
+    created: string;
+    layouts: LayoutsConfig;
+    tiles: AllQueryTypesTileConf;
 }
 
 export interface TileDbConf {
@@ -476,6 +496,13 @@ export interface FreqDbOptions {
      */
     maxSingleTypeNgramArf?: number;
 
+    /**
+     * URL of a CouchDB database with autocomplete prefix documents
+     * (see install/freqdb/suggestions2couchdb.py). If omitted, the CouchDB
+     * backend does not provide any suggestions.
+     */
+    suggestionsUrl?: string;
+
     korpusDBCrit?: string;
     korpusDBNgramCrit?: string;
     korpusDBNorm?: string;
@@ -23,14 +23,19 @@ import { IAppServices, IApiServices } from '../../../../appServices.js';
 import {
     LemmatizationLevel,
     QueryMatch,
+    FreqBand,
     calcFreqBand,
 } from '../../../../query/index.js';
 import { IFreqDB } from '../../freqdb.js';
 import { FreqDbOptions, MainPosAttrValues } from '../../../../conf/index.js';
-import { serverHttpRequest } from '../../../request.js';
+import {
+    serverHttpRequest,
+    ServerHTTPRequestError,
+} from '../../../request.js';
 import { importQueryPosWithLabel, posTagsEqual } from '../../../../postag.js';
 import { SourceDetails } from '../../../../types.js';
 import { CouchStoredSourceInfo } from './sourceInfo.js';
+import urlJoin from 'url-join';
 
 /*
 CouchDB as an internal word frequency database for WaG
@@ -46,24 +51,50 @@ Document structure:
     "upos": "PART",
     "arf":34748.076,
     "is_pname":false,
-    "count":66556
+    "count":66556,
+    "arf_neighbours": {"k": 10, "same": [...], "above": [...], "below": [...]}
 }
 
+Documents created with freqdb2couchdb.py --corpus-size also contain "ipm",
+"flevel" and "arf_rank" (for the lemma and for each form) and their "forms"
+are sorted by count. In such a case, the values are used as they are
+(the corpus size used by the script must match the corpusSize of the
+configuration).
+
+Documents created with freqdb2couchdb.py --compact-forms K use the compact
+schema ("schema": 2, see install/freqdb/compactdocs.py): forms are stored
+as parallel arrays in "cforms" (sorted by count) and only the top K forms
+are inline. The rest is stored in an overflow document (referenced by the
+"overflow" field, with "overflow_of" set to the id of the main document)
+which is read only when all the word forms are needed. Documents with
+a single form keep the original schema. With compact documents, the views
+must skip the overflow documents (all but "by-word", see below).
+
+The optional "arf_neighbours" contains lemmas of the same n-gram order with
+a similar ARF (precomputed by mkfreqdb.py --arf-neighbours). If present,
+similar frequency words are read from there instead of the n-gram order
+specific "*g-by-arf" views (the mixed "by-arf" view is always queried as
+the lists do not contain lemmas of other n-gram orders).
+
 Please note that specific views must be defined to make
-the database functional along with WaG (see below).
+the database functional along with WaG (see below). The freqdb2couchdb*.py
+scripts with --blue-green install them to a freshly loaded database and
+pre-build their indexes (see install/freqdb/bluegreen.py).
 */
 
 enum Views {
     /*
     function (doc) {
-        emit(doc.arf, 1);
+        if (!doc.overflow_of) {
+            emit(doc.arf, 1);
+        }
     }
     */
     BY_ARF = 'by-arf',
 
     /*
     function (doc) {
-        if (doc.lemma.split(' ').length === 1) {
+        if (!doc.overflow_of && doc.lemma.split(' ').length === 1) {
             emit(doc.arf, null);
         }
     }
@@ -72,7 +103,7 @@ enum Views {
 
     /*
     function (doc) {
-        if (doc.lemma.split(' ').length === 2) {
+        if (!doc.overflow_of && doc.lemma.split(' ').length === 2) {
             emit(doc.arf, null);
         }
     }
@@ -81,7 +112,7 @@ enum Views {
 
     /*
     function (doc) {
-        if (doc.lemma.split(' ').length === 3) {
+        if (!doc.overflow_of && doc.lemma.split(' ').length === 3) {
             emit(doc.arf, null);
         }
     }
@@ -90,21 +121,68 @@ enum Views {
 
     /*
     function (doc) {
-    emit(doc.lemma, doc.count);
+        if (!doc.overflow_of) {
+            emit(doc.lemma, doc.count);
+        }
     }
     */
     BY_LEMMA = 'by-lemma',
 
     /*
     function (doc) {
-        doc.forms.forEach(function (v) {
-            emit(v.word, v.count);
-        });
+        if (doc.cforms) {
+            doc.cforms.word.forEach(function (v, i) {
+                emit(v, doc.cforms.count[i]);
+            });
+        } else {
+            doc.forms.forEach(function (v) {
+                emit(v.word, v.count);
+            });
+        }
     }
     */
     BY_WORD = 'by-word',
 }
 
+type ArfNeighbour = Pick<
+    HTTPNgramDoc,
+    'lemma' | 'pos' | 'upos' | 'count' | 'arf' | 'is_pname' | 'ipm' | 'flevel'
+>;
+
+interface PrecomputedFreqs {
+    count: number;
+    ipm?: number;
+    flevel?: FreqBand;
+}
+
+interface ArfNeighbours {
+    k: number;
+    same: Array<ArfNeighbour>;
+    above: Array<ArfNeighbour>;
+    below: Array<ArfNeighbour>;
+}
+
+interface HTTPNgramForm {
+    word: string;
+    count: number;
+    arf: number;
+    ipm?: number;
+    flevel?: FreqBand;
+    arf_rank?: number;
+}
+
+/**
+ * Forms of a compact document as parallel arrays
+ */
+interface HTTPCompactForms {
+    word: Array<string>;
+    count: Array<number>;
+    arf: Array<number>;
+    ipm?: Array<number>;
+    flevel?: Array<FreqBand>;
+    arf_rank?: Array<number>;
+}
+
 interface HTTPNgramDoc {
     _id: string;
     _rev: string;
@@ -114,11 +192,21 @@ interface HTTPNgramDoc {
     count: number;
     arf: number;
     is_pname: boolean;
-    forms: Array<{
-        word: string;
-        count: number;
-        arf: number;
-    }>;
+    forms?: Array<HTTPNgramForm>;
+    arf_neighbours?: ArfNeighbours;
+    ipm?: number;
+    flevel?: FreqBand;
+    arf_rank?: number;
+    schema?: number;
+    cforms?: HTTPCompactForms;
+    num_forms?: number;
+    overflow?: string;
+    overflow_of?: string;
+}
+
+interface HTTPSuggestionDoc {
+    _id: string;
+    items: Array<string>;
 }
 
 interface HTTPNgramResponse {
@@ -132,6 +220,26 @@ interface HTTPNgramResponse {
     }>;
 }
 
+function expandForms(cforms: HTTPCompactForms): Array<HTTPNgramForm> {
+    return List.map(
+        (word, i) => ({
+            word,
+            count: cforms.count[i],
+            arf: cforms.arf[i],
+            ipm: cforms.ipm ? cforms.ipm[i] : undefined,
+            flevel: cforms.flevel ? cforms.flevel[i] : undefined,
+            arf_rank: cforms.arf_rank ? cforms.arf_rank[i] : undefined,
+        }),
+        cforms.word
+    );
+}
+
+/**
+ * Max. length of prefixes stored in the suggestions
+ * database (see install/freqdb/suggestions.py)
+ */
+const SUGGESTIONS_MAX_PREFIX_LEN = 10;
+
 export class CouchFreqDB implements IFreqDB {
     private readonly dbUrl: string;
 
@@ -145,6 +253,8 @@ export class CouchFreqDB implements IFreqDB {
 
     private readonly maxSingleTypeNgramArf: number;
 
+    private readonly suggestionsUrl: string | undefined;
+
     constructor(
         dbPath: string,
         corpusSize: number,
@@ -172,6 +282,15 @@ export class CouchFreqDB implements IFreqDB {
             );
         }
         this.maxSingleTypeNgramArf = options.maxSingleTypeNgramArf || 0;
+        this.suggestionsUrl = options.suggestionsUrl;
+    }
+
+    private getIpm(v: PrecomputedFreqs): number {
+        return v.ipm !== undefined ? v.ipm : (v.count / this.corpusSize) * 1e6;
+    }
+
+    private getFreqBand(v: PrecomputedFreqs): FreqBand {
+        return v.flevel !== undefined ? v.flevel : calcFreqBand(this.getIpm(v));
     }
 
     private getViewByLemmaWords(
@@ -219,6 +338,45 @@ export class CouchFreqDB implements IFreqDB {
         );
     }
 
+    /**
+     * Get all the forms of a document. The overflow document
+     * of a truncated compact document is fetched from the database
+     * (its URL is derived from the view URL, i.e. [db]/_design/...).
+     */
+    private loadForms(doc: HTTPNgramDoc): Observable<Array<HTTPNgramForm>> {
+        if (!doc.cforms) {
+            return rxOf(doc.forms);
+        }
+        const forms = expandForms(doc.cforms);
+        if (!doc.overflow) {
+            return rxOf(forms);
+        }
+        const designIdx = this.dbUrl.indexOf('/_design/');
+        if (designIdx === -1) {
+            throw new Error(
+                `Invalid freqDB configuration: database path ${this.dbUrl} is not a CouchDB view URL ` +
+                    `([db]/_design/...), overflow forms (doc: ${doc.overflow}) cannot be fetched`
+            );
+        }
+        const dbBaseUrl = this.dbUrl.substring(0, designIdx);
+        return serverHttpRequest<HTTPNgramDoc>({
+            url: urlJoin(dbBaseUrl, encodeURIComponent(doc.overflow)),
+            method: HTTP.Method.GET,
+            auth: {
+                username: this.dbUser,
+                password: this.dbPassword,
+            },
+        }).pipe(
+            // overflow forms have lower counts than the inline ones
+            map((ovf) => [...expandForms(ovf.cforms), ...forms]),
+            catchError((err) => {
+                throw new Error(
+                    `Failed to fetch overflow forms (doc: ${doc.overflow}): ${err}`
+                );
+            })
+        );
+    }
+
     private mergeDocs(
         items: Array<{ doc: HTTPNgramDoc }>,
         word: string,
@@ -228,7 +386,8 @@ export class CouchFreqDB implements IFreqDB {
         return pipe(
             items,
             List.map((v) => v.doc),
-            List.groupBy((v) => v._id),
+            // an overflow document represents the same lemma as its main one
+            List.groupBy((v) => v.overflow_of || v._id),
             List.map(([, v]) => v[0]),
             List.map<HTTPNgramDoc, QueryMatch>((v, i) => ({
                 localId: `${i}`,
@@ -241,8 +400,8 @@ export class CouchFreqDB implements IFreqDB {
                 upos: importQueryPosWithLabel(v.upos, 'upos', appServices),
                 specifier: [],
                 abs: v.count,
-                ipm: (v.count / this.corpusSize) * 1e6,
-                flevel: calcFreqBand((v.count / this.corpusSize) * 1e6),
+                ipm: this.getIpm(v),
+                flevel: this.getFreqBand(v),
                 arf: v.arf,
                 initialCap: false,
                 isCurrent: false,
@@ -254,7 +413,37 @@ export class CouchFreqDB implements IFreqDB {
         appServices: IAppServices,
         word: string
     ): Observable<Array<string>> {
-        return rxOf([]);
+        const prefix = word.toLowerCase();
+        if (!this.suggestionsUrl || !prefix || prefix.startsWith('_')) {
+            return rxOf([]);
+        }
+        // prefix documents are limited in length, longer queries
+        // are resolved by filtering the longest available prefix
+        const docId = prefix.substring(0, SUGGESTIONS_MAX_PREFIX_LEN);
+        return serverHttpRequest<HTTPSuggestionDoc>({
+            url: urlJoin(this.suggestionsUrl, encodeURIComponent(docId)),
+            method: HTTP.Method.GET,
+            auth: {
+                username: this.dbUser,
+                password: this.dbPassword,
+            },
+        }).pipe(
+            map((doc) =>
+                List.filter(
+                    (v) => v.toLowerCase().startsWith(prefix),
+                    doc.items
+                )
+            ),
+            catchError((err) => {
+                if (
+                    err instanceof ServerHTTPRequestError &&
+                    err.status === HTTP.Status.NotFound
+                ) {
+                    return rxOf([]);
+                }
+                throw err;
+            })
+        );
     }
 
     findQueryMatches(
@@ -295,29 +484,47 @@ export class CouchFreqDB implements IFreqDB {
                         pos.join(' ') === v.doc[posAttr],
                     resp.rows
                 );
-                return pos.length === 1 && srch
-                    ? merge(
-                          // we must search for exact frequency separately to prevent
-                          // finding the same results in the next two searches and
-                          // (worse) by exhausting the search items limit.
-                          this.queryServer(view, {
-                              key: srch.doc.arf,
-                              limit: rng,
-                          }),
-                          this.queryServer(view, {
-                              startkey: srch.doc.arf + srch.doc.arf / 1e5,
-                              limit: rng,
-                          }),
-                          this.queryServer(view, {
-                              startkey: srch.doc.arf - srch.doc.arf / 1e6,
-                              limit: rng,
-                              descending: 'true',
-                          })
-                      )
-                    : EMPTY;
+                if (pos.length !== 1 || !srch) {
+                    return EMPTY;
+                }
+                const nbrs = srch.doc.arf_neighbours;
+                if (nbrs && rng <= nbrs.k && view !== Views.BY_ARF) {
+                    // the same windows as the n-gram order specific view queries below
+                    // (see install/freqdb/neighbours.py)
+                    return rxOf<Array<ArfNeighbour>>([
+                        srch.doc,
+                        ...nbrs.same.slice(0, rng - 1),
+                        ...nbrs.above.slice(0, rng),
+                        ...nbrs.below.slice(0, rng),
+                    ]);
+                }
+                return merge(
+                    // we must search for exact frequency separately to prevent
+                    // finding the same results in the next two searches and
+                    // (worse) by exhausting the search items limit.
+                    this.queryServer(view, {
+                        key: srch.doc.arf,
+                        limit: rng,
+                    }),
+                    this.queryServer(view, {
+                        startkey: srch.doc.arf + srch.doc.arf / 1e5,
+                        limit: rng,
+                    }),
+                    this.queryServer(view, {
+                        startkey: srch.doc.arf - srch.doc.arf / 1e6,
+                        limit: rng,
+                        descending: 'true',
+                    })
+                ).pipe(
+                    map((resp) =>
+                        List.map<{ doc: HTTPNgramDoc }, ArfNeighbour>(
+                            (v) => v.doc,
+                            resp.rows
+                        )
+                    )
+                );
             }),
-            map((resp) => List.map((v) => v.doc, resp.rows)),
-            reduce((acc, v) => acc.concat(v), [] as Array<HTTPNgramDoc>),
+            reduce((acc, v) => acc.concat(v), [] as Array<ArfNeighbour>),
             map((values) =>
                 List.map(
                     (v, i) => ({
@@ -332,8 +539,8 @@ export class CouchFreqDB implements IFreqDB {
                             appServices
                         ),
                         specifier: [],
-                        ipm: (v.count / this.corpusSize) * 1e6,
-                        flevel: calcFreqBand((v.count / this.corpusSize) * 1e6),
+                        ipm: this.getIpm(v),
+                        flevel: this.getFreqBand(v),
                         word: lemma,
                         forms: [],
                         abs: v.count,
@@ -354,7 +561,7 @@ export class CouchFreqDB implements IFreqDB {
         posAttr: MainPosAttrValues
     ): Observable<Array<QueryMatch>> {
         return this.queryExact(Views.BY_LEMMA, lemma).pipe(
-            map((resp) => {
+            concatMap((resp) => {
                 const srch =
                     pos.length === 0
                         ? List.filter((v) => v.doc.lemma === lemma, resp.rows)
@@ -364,9 +571,19 @@ export class CouchFreqDB implements IFreqDB {
                                   posTagsEqual(pos, v.doc.pos.split(' ')),
                               resp.rows
                           );
-                return pipe(
+                if (List.empty(srch)) {
+                    return rxOf(
+                        tuple(srch, [] as Array<Array<HTTPNgramForm>>)
+                    );
+                }
+                return forkJoin(
+                    List.map((v) => this.loadForms(v.doc), srch)
+                ).pipe(map((forms) => tuple(srch, forms)));
+            }),
+            map(([srch, docForms]) =>
+                pipe(
                     srch,
-                    List.flatMap((v) =>
+                    List.flatMap((v, i) =>
                         List.map(
                             (form) =>
                                 tuple(
@@ -375,10 +592,18 @@ export class CouchFreqDB implements IFreqDB {
                                     form,
                                     v.doc.is_pname
                                 ),
-                            v.doc.forms
+                            docForms[i]
                         )
                     ),
-                    List.sortBy(([, , form]) => form.count),
+                    // forms of a single document created with precomputed
+                    // frequencies or in the compact schema are already sorted
+                    // by count
+                    (items) =>
+                        srch.length === 1 &&
+                        (srch[0].doc.ipm !== undefined ||
+                            srch[0].doc.cforms !== undefined)
+                            ? items
+                            : List.sortBy(([, , form]) => form.count, items),
                     List.map(([pos, upos, form, is_pname], i) => ({
                         localId: `${i}`,
                         lemma: lemma,
@@ -391,10 +616,8 @@ export class CouchFreqDB implements IFreqDB {
                             appServices
                         ),
                         specifier: [], // TODO
-                        ipm: (form.count / this.corpusSize) * 1e6,
-                        flevel: calcFreqBand(
-                            (form.count / this.corpusSize) * 1e6
-                        ),
+                        ipm: this.getIpm(form),
+                        flevel: this.getFreqBand(form),
                         word: form.word,
                         forms: [],
                         abs: form.count,
@@ -402,8 +625,8 @@ export class CouchFreqDB implements IFreqDB {
                         isCurrent: false,
                         initialCap: is_pname,
                     }))
-                );
-            })
+                )
+            )
         );
     }
 
@@ -37,6 +37,7 @@ import {
     AllQueryTypesTileConf,
     LayoutsConfig,
     InstanceLink,
+    ConfBundle,
 } from '../conf/index.js';
 import { validateTilesConf } from '../conf/validation.js';
 import {
@@ -72,6 +73,25 @@ function loadTilesConf(
     }
 }
 
+/**
+ * Load layouts from a configuration bundle. Tiles from the bundle
+ * are stored directly to clientConf so loadTilesConf just passes
+ * them through.
+ */
+function loadConfBundle(
+    clientConf: ClientStaticConf
+): Observable<LayoutsConfig> {
+    return parseJsonConfig<ConfBundle>(clientConf.confBundle).pipe(
+        map((bundle) => {
+            console.info(
+                `Using configuration bundle ${clientConf.confBundle} (hash ${bundle.hash}, created ${bundle.created})`
+            );
+            clientConf.tiles = bundle.tiles;
+            return bundle.layouts;
+        })
+    );
+}
+
 function loadInstanceSwitchMenuConf(
     clientConf: ClientStaticConf
 ): Observable<Array<InstanceLink>> {
@@ -135,9 +155,11 @@ forkJoin([
         concatMap(
             // load layouts config
             ([serverConf, clientConf, pkgInfo]) =>
-                (typeof clientConf.layouts === 'string'
-                    ? parseJsonConfig<LayoutsConfig>(clientConf.layouts)
-                    : rxOf(clientConf.layouts)
+                (clientConf.confBundle
+                    ? loadConfBundle(clientConf)
+                    : typeof clientConf.layouts === 'string'
+                      ? parseJsonConfig<LayoutsConfig>(clientConf.layouts)
+                      : rxOf(clientConf.layouts)
                 ).pipe(
                     map<
                         LayoutsConfig,